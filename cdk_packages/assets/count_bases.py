@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Count the reads and bases in the output of a basecaller job.
+
+The BAM or FASTQ files under the output directory of the job (/fsx/out/<job ID>) are decoded as
+a stream: BAM files with 'samtools view', gzipped FASTQ files with 'pigz' (or 'gzip' if pigz is
+not installed), both with several decompression threads and in a separate process from the
+parser. Only the histogram of read lengths is kept in memory, so memory use is bounded by the
+number of distinct read lengths, not by the size of the output. If a job wrote both BAM and FASTQ
+files (guppy with '--bam_out'), only the BAM files are counted.
+
+The mean Q-score is the mean of the Q-scores of the reads: the 'qs' tag written by dorado, or the
+Q-score of the mean error probability of the bases if the tag is missing. Secondary and
+supplementary alignments are not counted.
+
+The statistics are written to the reports table by job_agent.py, or printed as JSON:
+
+    python3 count_bases.py /fsx/out/<job ID> --seconds <basecaller run time>
+
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DECOMPRESSION_THREADS = 4
+# Phred quality characters to error probabilities
+ERROR_PROBABILITY = 10 ** (-np.clip(np.arange(256) - 33, 0, None) / 10)
+QSCORE_TAG = re.compile(rb'\tqs:[if]:([0-9.]+)')
+# statistics written to the reports table, see job_agent.py
+RESULT_FIELDS = ['output_reads', 'output_bases', 'mean_qscore', 'read_n50', 'bases_per_s']
+
+
+def output_files(path):
+    """
+    :return: tuple of the format and the output files of the job, BAM files if there are any
+    """
+    bam_files = sorted(glob.glob(os.path.join(path, '**', '*.bam'), recursive=True))
+    if bam_files:
+        return 'bam', bam_files
+    return 'fastq', sorted(
+        glob.glob(os.path.join(path, '**', '*.fastq.gz'), recursive=True) +
+        glob.glob(os.path.join(path, '**', '*.fastq'), recursive=True)
+    )
+
+
+def read_qscore(qualities):
+    if not qualities or qualities == b'*':
+        return None
+    return float(-10 * np.log10(ERROR_PROBABILITY[np.frombuffer(qualities, dtype=np.uint8)].mean()))
+
+
+def decode_command(file_name, threads=DECOMPRESSION_THREADS):
+    if file_name.endswith('.bam'):
+        # exclude secondary (0x100) and supplementary (0x800) alignments
+        return ['samtools', 'view', '-@', str(threads), '-F', '0x900', file_name]
+    if file_name.endswith('.gz'):
+        if shutil.which('pigz'):
+            return ['pigz', '-dc', '-p', str(threads), file_name]
+        return ['gzip', '-dc', file_name]
+    return ['cat', file_name]
+
+
+def iterate_bam_reads(stream):
+    for line in stream:
+        fields = line.rstrip(b'\n').split(b'\t', 11)
+        sequence, qualities = fields[9], fields[10]
+        tag = QSCORE_TAG.search(b'\t' + fields[11]) if len(fields) > 11 else None
+        yield (0 if sequence == b'*' else len(sequence)), float(tag.group(1)) if tag else read_qscore(qualities)
+
+
+def iterate_fastq_reads(stream):
+    while stream.readline():
+        sequence = stream.readline().rstrip(b'\n')
+        stream.readline()
+        qualities = stream.readline().rstrip(b'\n')
+        yield len(sequence), read_qscore(qualities)
+
+
+def count_file(file_name, file_format='bam', threads=DECOMPRESSION_THREADS):
+    """
+    Count the reads and bases of one output file.
+
+    :return: dict with the number of reads, the sum and number of the read Q-scores and the read
+        length histogram
+    """
+    lengths = Counter()
+    qscore_sum = 0.0
+    qscore_count = 0
+    with subprocess.Popen(decode_command(file_name, threads), stdout=subprocess.PIPE, bufsize=1024 * 1024) \
+            as process:
+        reads = iterate_bam_reads(process.stdout) if file_format == 'bam' else iterate_fastq_reads(process.stdout)
+        for length, qscore in reads:
+            lengths[length] += 1
+            if qscore is not None:
+                qscore_sum += qscore
+                qscore_count += 1
+    if process.returncode != 0:
+        raise RuntimeError(f'Decoding {file_name} failed with return code {process.returncode}.')
+    return {'lengths': lengths, 'qscore_sum': qscore_sum, 'qscore_count': qscore_count}
+
+
+def n50(lengths):
+    """
+    :param lengths: read length histogram, dict with the number of reads by length
+    :return: length of the shortest read among the longest reads holding half of the bases
+    """
+    total = sum(length * count for length, count in lengths.items())
+    cumulative = 0
+    for length in sorted(lengths, reverse=True):
+        cumulative += length * lengths[length]
+        if cumulative * 2 >= total:
+            return length
+    return 0
+
+
+def count_bases(path, seconds=None, threads=DECOMPRESSION_THREADS, max_workers=None):
+    """
+    Count the reads and bases of all output files of a job, several files in parallel.
+
+    :param path: output directory of the job
+    :param seconds: run time of the basecaller, to calculate the bases per second
+    :return: dict with the statistics
+    """
+    file_format, files = output_files(path)
+    lengths = Counter()
+    qscore_sum = 0.0
+    qscore_count = 0
+    if files:
+        max_workers = max_workers or max(1, min(len(files), (os.cpu_count() or 1) // threads))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for result in executor.map(count_file, files, [file_format] * len(files), [threads] * len(files)):
+                lengths.update(result['lengths'])
+                qscore_sum += result['qscore_sum']
+                qscore_count += result['qscore_count']
+    bases = sum(length * count for length, count in lengths.items())
+    return {
+        'output_format': file_format,
+        'output_files': len(files),
+        'output_reads': sum(lengths.values()),
+        'output_bases': bases,
+        'mean_qscore': round(qscore_sum / qscore_count, 2) if qscore_count else None,
+        'read_n50': n50(lengths),
+        'bases_per_s': round(bases / seconds, 1) if seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count the reads and bases in the output of a basecaller job.')
+    parser.add_argument('path', help='output directory of the job')
+    parser.add_argument('--seconds', type=float, help='run time of the basecaller in seconds')
+    parser.add_argument('--threads', type=int, default=DECOMPRESSION_THREADS, help='decompression threads per file')
+    args = parser.parse_args()
+    print(json.dumps(count_bases(args.path, seconds=args.seconds, threads=args.threads)))
+
+
+if __name__ == '__main__':
+    main()
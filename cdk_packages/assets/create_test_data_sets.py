@@ -8,60 +8,351 @@ These are test data sets for use with the Oxford Nanopore dorado basecaller. The
 a directory as input. With the different directories with symlinks back to the original files,
 different data set sizes can be provided for testing purposes.
 
+The files of a data set are split into one shard per GPU. The basecalling time of a file is
+proportional to its number of signal samples, so the files are assigned to the shards with
+longest-processing-time-first bin packing on the number of samples (or on the file size if the
+pod5 package is not available). The manifest records the expected load of each shard and the
+imbalance ratio, the load of the largest shard relative to the mean load.
+
+With whole files as shards, the number of shards is limited by the number of files and the load
+of a shard by the size of its largest file. A read-level index of all POD5 files allows to split
+the reads of a data set into any number of shards of equal load instead. These shards are
+directories with symlinks to the files holding their reads, and a list of their read IDs next to
+the directory ('<directory>.read_ids.txt') for the '--read-ids' option of dorado and the
+'--read_id_list' option of guppy. The read-level data sets are named '<data set>_reads' in the
+manifest.
+
+The manifest also records the number of reads, signal samples and bytes of each POD5 file (under
+'files', with a checksum of the file), of each data set ('stats') and of each shard
+('shard_stats'), so that the reports can normalize run times by the data actually basecalled.
+The numbers of reads and samples are taken from the read index, the files are only read for their
+checksum. Files unchanged in size and modification time since the last manifest are not read
+again.
+
 """
 
 import glob
+import hashlib
+import heapq
 import json
 import os
 import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from string import Template
 
 import numpy as np
 import pandas as pd
 
+try:
+    import pod5
+except ImportError:
+    pod5 = None
+
 POD5_DATA_PATH = '/fsx/pod5-all-files/'
 POD5_SUBSET_PATH = '/fsx/pod5-subsets/'
+READ_INDEX_FILE = '/fsx/pod5-index/read_index.parquet'
+READ_INDEX_COLUMNS = ['read_id', 'file', 'row', 'num_samples', 'file_size']
+READ_SHARDS_SUFFIX = '_reads'
+READ_IDS_SUFFIX = '.read_ids.txt'
+MANIFEST_FILE_NAME = 'manifest.json'
+# key of the per-file statistics in the manifest, all other keys are data sets
+FILE_STATS_KEY = 'files'
+CHECKSUM_ALGORITHM = 'sha256'
+CHECKSUM_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def chunk_file_list(list_to_chunk, num_chunks=1, weight='samples'):
+    """
+    Split the files into num_chunks shards with balanced load, see balance_shards().
+    """
+    weights = list_to_chunk[weight] if weight in list_to_chunk.columns else pd.Series(1, index=list_to_chunk.index)
+    return [list_to_chunk.iloc[shard] for shard in balance_shards(weights.to_list(), num_chunks)]
+
+
+def balance_shards(weights, num_chunks=1):
+    """
+    Longest-processing-time-first bin packing: assign the items by descending weight, each to the
+    shard with the least load so far. The largest shard is at most 4/3 of the optimum.
+
+    :return: list of item positions per shard, in the original order of the items
+    """
+    shards = [[] for _ in range(num_chunks)]
+    heap = [(0, idx) for idx in range(num_chunks)]
+    for position in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        load, idx = heapq.heappop(heap)
+        shards[idx].append(position)
+        heapq.heappush(heap, (load + weights[position], idx))
+    return [sorted(shard) for shard in shards]
+
+
+def imbalance_ratio(loads):
+    mean = sum(loads) / len(loads)
+    return max(loads) / mean if mean > 0 else 1.0
+
 
+def shard_path(template, idx, base_path=POD5_SUBSET_PATH):
+    return os.path.join(base_path, Template(template).substitute(idx=idx))
 
-def chunk_file_list(list_to_chunk, num_chunks=1):
-    chunks = np.array_split(list_to_chunk, num_chunks)
-    return chunks
 
+def layout_hash(files, read_ids=None):
+    content = '\n'.join(files) + '\0' + ('\n'.join(read_ids) if read_ids is not None else '')
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
-def create_symlinks(batch, template, base_path):
-    template = Template(template)
-    file_list = []
-    for idx, batch in enumerate(batch):
-        # create directory with the name of the sub data set
-        full_path = os.path.join(POD5_SUBSET_PATH, template.substitute(idx=idx))
-        os.makedirs(full_path, exist_ok=True)
-        for f in batch['file']:
-            # create the symlinks within the new directory
-            src = os.path.join(POD5_DATA_PATH, f)
-            dst = os.path.join(full_path, f)
-            if not os.path.islink(dst):
-                os.symlink(src, dst)
-        file_list.append(full_path)
-    return file_list
 
+def previous_layout(manifest):
+    """
+    Get the hash of each shard directory recorded in a manifest.
 
-def get_file_list():
-    dir_path = f'{POD5_DATA_PATH}*.pod5'
-    pod5_files = glob.glob(dir_path)
+    :return: dict with the layout hash by directory
+    """
+    layout = {}
+    for name, data_set in manifest.items():
+        if name == FILE_STATS_KEY:
+            continue
+        for num_chunks, hashes in data_set.get('layout_hash', {}).items():
+            layout.update(zip(data_set[str(num_chunks)], hashes))
+    return layout
+
+
+def sync_layout(layout, previous=None, data_path=POD5_DATA_PATH, max_workers=32):
+    """
+    Bring the shard directories on disk in line with the desired layout. Directories whose layout
+    hash matches the previous manifest are skipped without touching the file system. Changed
+    directories are listed once, and only missing symlinks are created and stale ones removed,
+    all in a thread pool as each operation is a round trip to the Lustre metadata server.
+    Directories of the previous manifest that are not in the layout are removed.
+
+    :param layout: dict with the 'files' and optionally the 'read_ids' by shard directory
+    :param previous: dict with the layout hash by directory, see previous_layout()
+    :param data_path: directory of the POD5 files the symlinks point to
+    :return: dict with the layout hash by directory
+    """
+    previous = previous or {}
+    hashes = {
+        directory: layout_hash(shard['files'], shard.get('read_ids')) for directory, shard in layout.items()
+    }
+    changed = [
+        directory for directory in layout
+        if previous.get(directory) != hashes[directory] or not os.path.isdir(directory)
+    ]
+    stale = [directory for directory in previous if directory not in layout]
+
+    def list_directory(directory):
+        os.makedirs(directory, exist_ok=True)
+        with os.scandir(directory) as entries:
+            return directory, {entry.name for entry in entries}
+
+    def apply(operation):
+        action, path, content = operation
+        if action == 'link':
+            os.symlink(content, path)
+        elif action == 'unlink':
+            os.unlink(path)
+        else:
+            with open(path, 'w') as fp:
+                fp.write(content)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        operations = []
+        for directory, existing in executor.map(list_directory, changed + stale):
+            desired = set(layout[directory]['files']) if directory in layout else set()
+            operations += [
+                ('link', os.path.join(directory, f), os.path.join(data_path, f)) for f in desired - existing
+            ]
+            operations += [('unlink', os.path.join(directory, f), None) for f in existing - desired]
+            read_ids = layout[directory].get('read_ids') if directory in layout else None
+            if read_ids is not None:
+                operations.append(('write', directory + READ_IDS_SUFFIX, '\n'.join(read_ids) + '\n'))
+        list(executor.map(apply, operations))
+    for directory in stale:
+        os.rmdir(directory)
+        if os.path.exists(directory + READ_IDS_SUFFIX):
+            os.remove(directory + READ_IDS_SUFFIX)
+    num_links = sum(operation[0] == 'link' for operation in operations)
+    num_unlinks = sum(operation[0] == 'unlink' for operation in operations)
+    print(f'Shard directories: {len(layout) - len(changed)} unchanged, {len(changed)} updated, {len(stale)} removed, '
+          f'{num_links} symlinks created, {num_unlinks} removed.')
+    return hashes
+
+
+def get_file_list(path=POD5_DATA_PATH, read_index=None):
+    """
+    List the POD5 files with their size and, if a read index is given, their number of samples.
+    """
+    pod5_files = glob.glob(os.path.join(path, '*.pod5'))
     files = [
-        (f, int(re.search(r'_(?P<file_no>\d+)\.pod5', f)['file_no']))
-        for f in [os.path.basename(f) for f in pod5_files]
+        (os.path.basename(f), int(re.search(r'_(?P<file_no>\d+)\.pod5', os.path.basename(f))['file_no']),
+         os.path.getsize(f))
+        for f in pod5_files
     ]
-    files_df = pd.DataFrame(files, columns=['file', 'no'])
+    files_df = pd.DataFrame(files, columns=['file', 'no', 'size'])
+    files_df['samples'] = files_df['file'].map(read_index.groupby('file')['num_samples'].sum()) \
+        if read_index is not None else None
     files_df.set_index('no', inplace=True)
     files_df.sort_index(inplace=True)
     return files_df
 
 
+def index_file(file_name):
+    """
+    Index the reads of one POD5 file from its read table, without reading the signal.
+
+    :return: dataframe with one row per read, see READ_INDEX_COLUMNS
+    """
+    with pod5.Reader(file_name) as reader:
+        table = reader.read_table.read_all().select(['read_id', 'num_samples'])
+    return pd.DataFrame({
+        'read_id': [str(uuid.UUID(bytes=read_id)) for read_id in table.column('read_id').to_pylist()],
+        'file': os.path.basename(file_name),
+        'row': np.arange(table.num_rows, dtype='int64'),
+        'num_samples': table.column('num_samples').to_numpy().astype('int64'),
+        'file_size': os.path.getsize(file_name),
+    }, columns=READ_INDEX_COLUMNS)
+
+
+def build_read_index(path=POD5_DATA_PATH, index_file_name=READ_INDEX_FILE, max_workers=None):
+    """
+    Build the read index of all POD5 files in path: read ID, file, row in the read table of the
+    file and number of signal samples. The index is saved as Parquet file. If the index exists,
+    only new files and files that changed in size are indexed again.
+
+    :return: read index, ordered by file and row
+    """
+    index = pd.read_parquet(index_file_name) if os.path.exists(index_file_name) \
+        else pd.DataFrame(columns=READ_INDEX_COLUMNS)
+    file_sizes = {os.path.basename(f): os.path.getsize(f) for f in glob.glob(os.path.join(path, '*.pod5'))}
+    indexed_sizes = index.groupby('file')['file_size'].first().to_dict() if not index.empty else {}
+    unchanged = [f for f, size in file_sizes.items() if indexed_sizes.get(f) == size]
+    missing = sorted(set(file_sizes) - set(unchanged))
+    index = index[index['file'].isin(unchanged)].reset_index(drop=True)
+    if missing:
+        print(f'Indexing reads of {len(missing)} POD5 files ...')
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            new = list(executor.map(index_file, [os.path.join(path, f) for f in missing], chunksize=8))
+        index = pd.concat(([index] if not index.empty else []) + new, ignore_index=True)
+        index = index.sort_values(['file', 'row'], kind='stable').reset_index(drop=True)
+        os.makedirs(os.path.dirname(index_file_name), exist_ok=True)
+        index.to_parquet(index_file_name + '.tmp', index=False)
+        os.replace(index_file_name + '.tmp', index_file_name)
+    print(f'Read index: {len(index)} reads in {index["file"].nunique()} files.')
+    return index
+
+
+def file_checksum(file_name):
+    digest = hashlib.new(CHECKSUM_ALGORITHM)
+    buffer = bytearray(CHECKSUM_BLOCK_SIZE)
+    view = memoryview(buffer)
+    with open(file_name, 'rb', buffering=0) as fp:
+        while size := fp.readinto(buffer):
+            digest.update(view[:size])
+    return f'{CHECKSUM_ALGORITHM}:{digest.hexdigest()}'
+
+
+def file_stats(file_name):
+    """
+    Get the size, modification time and checksum of one POD5 file.
+
+    :return: tuple of the file name and a dict with the statistics
+    """
+    return os.path.basename(file_name), {
+        'bytes': os.path.getsize(file_name),
+        'mtime': os.path.getmtime(file_name),
+        'checksum': file_checksum(file_name),
+    }
+
+
+def get_file_stats(path=POD5_DATA_PATH, previous=None, read_index=None, max_workers=None):
+    """
+    Get the statistics of all POD5 files in path, see file_stats(), with the number of reads and
+    signal samples of each file from the read index. The size and checksum of files with the
+    same size and modification time as in previous are reused.
+
+    :param previous: dict with the statistics by file name, e.g. from the last manifest
+    :param read_index: read index, see build_read_index(), reads and samples are None without it
+    :return: dict with the statistics by file name
+    """
+    previous = previous or {}
+    stats = {}
+    missing = []
+    for file_name in sorted(glob.glob(os.path.join(path, '*.pod5'))):
+        entry = previous.get(os.path.basename(file_name))
+        if entry and entry['bytes'] == os.path.getsize(file_name) and entry['mtime'] == os.path.getmtime(file_name):
+            stats[os.path.basename(file_name)] = entry
+        else:
+            missing.append(file_name)
+    if missing:
+        print(f'Reading checksums of {len(missing)} POD5 files ...')
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            stats.update(executor.map(file_stats, missing, chunksize=4))
+    counts = read_index.groupby('file')['num_samples'].agg(['size', 'sum']) if read_index is not None \
+        else pd.DataFrame(columns=['size', 'sum'])
+    reads, samples = counts['size'].to_dict(), counts['sum'].to_dict()
+    return {
+        file_name: dict(entry, reads=reads.get(file_name), samples=samples.get(file_name))
+        for file_name, entry in sorted(stats.items())
+    }
+
+
+def shard_stats(files, stats, reads=None):
+    """
+    Sum the statistics of the files of a shard. For read-level shards, the reads and samples are
+    counted from the reads of the shard, and the bytes are estimated from the share of the
+    samples of each file.
+
+    :param files: file names of the shard
+    :param stats: dict with the statistics by file name, see get_file_stats()
+    :param reads: dataframe with the reads of a read-level shard, see shard_reads()
+    :return: dict with the reads, samples, bytes and checksum of the shard
+    """
+    file_stats_list = [stats.get(f, {}) for f in files]
+    checksums = '\n'.join(f'{f} {entry.get("checksum")}' for f, entry in zip(files, file_stats_list))
+    if reads is None:
+        counts = [entry.get('reads') for entry in file_stats_list]
+        samples = [entry.get('samples') for entry in file_stats_list]
+        return {
+            'reads': sum(counts) if None not in counts else None,
+            'samples': sum(samples) if None not in samples else None,
+            'bytes': sum(entry.get('bytes', 0) for entry in file_stats_list),
+            'checksum': hashlib.sha256(checksums.encode('utf-8')).hexdigest(),
+        }
+    read_samples = reads.groupby('file')['num_samples'].sum()
+    return {
+        'reads': len(reads),
+        'samples': int(reads['num_samples'].sum()),
+        'bytes': int(sum(
+            entry.get('bytes', 0) * read_samples.get(f, 0) / entry['samples']
+            for f, entry in zip(files, file_stats_list) if entry.get('samples')
+        )),
+        'checksum': hashlib.sha256(
+            (checksums + '\0' + '\n'.join(reads['read_id'])).encode('utf-8')
+        ).hexdigest(),
+    }
+
+
+def shard_reads(reads, num_chunks=1):
+    """
+    Split reads into num_chunks shards of equal number of samples. The reads are cut into
+    consecutive ranges at multiples of 1/num_chunks of the total number of samples, the load of a
+    shard differs from the mean load by less than one read.
+
+    :return: list of dataframes with the reads of each shard
+    """
+    cumulative = reads['num_samples'].cumsum().to_numpy()
+    total = cumulative[-1] if len(cumulative) else 0
+    # a read goes to the shard its midpoint falls into
+    midpoints = cumulative - reads['num_samples'].to_numpy() / 2
+    shard = np.minimum((midpoints * num_chunks // max(total, 1)).astype('int64'), num_chunks - 1)
+    return [reads[shard == idx] for idx in range(num_chunks)]
+
+
 class TestData:
 
     def __init__(self):
-        self.all_files = get_file_list()
+        manifest = load_manifest()
+        self.read_index = build_read_index() if pod5 is not None else None
+        self.file_stats = get_file_stats(previous=manifest.get(FILE_STATS_KEY), read_index=self.read_index)
+        self.all_files = get_file_list(read_index=self.read_index)
         self.sample_data_sets = {
             'wgs_full_set': {
                 'num_files': None
@@ -80,26 +371,86 @@ class TestData:
             },
         }
         self.num_chunks = [1, 2, 4, 8]
+        self.weight = 'samples' if self.all_files['samples'].notna().all() else 'size'
+        print(f'Balancing shards by {self.weight}.')
+        # desired shard directories, created by sync_layout()
+        self.layout = {}
         self.create_list_files()
+        if self.read_index is not None:
+            self.create_read_shard_files()
+        hashes = sync_layout(self.layout, previous_layout(manifest))
+        for data_set in self.sample_data_sets.values():
+            data_set['layout_hash'] = {
+                num_chunks: [hashes[directory] for directory in data_set[num_chunks]] for num_chunks in self.num_chunks
+            }
         self.save_manifest()
 
     def create_list_files(self):
         for data_set_name in self.sample_data_sets:
+            files = self.all_files[:self.sample_data_sets[data_set_name]['num_files']]
+            self.sample_data_sets[data_set_name].update({
+                'load_unit': self.weight, 'load': {}, 'imbalance': {}, 'shard_stats': {},
+                'stats': dict(shard_stats(files['file'].to_list(), self.file_stats), files=len(files)),
+            })
             for num_chunks in self.num_chunks:
-                self.sample_data_sets[data_set_name].update({
-                    num_chunks: create_symlinks(
-                        chunk_file_list(
-                            self.all_files[:self.sample_data_sets[data_set_name]['num_files']],
-                            num_chunks=num_chunks
-                        ),
-                        f'{data_set_name}_{num_chunks}_${{idx}}.lst',
-                        POD5_SUBSET_PATH
-                    )
+                chunks = chunk_file_list(files, num_chunks=num_chunks, weight=self.weight)
+                loads = [int(chunk[self.weight].sum()) for chunk in chunks]
+                self.sample_data_sets[data_set_name]['shard_stats'][num_chunks] = [
+                    shard_stats(chunk['file'].to_list(), self.file_stats) for chunk in chunks
+                ]
+                self.sample_data_sets[data_set_name]['load'][num_chunks] = loads
+                self.sample_data_sets[data_set_name]['imbalance'][num_chunks] = round(imbalance_ratio(loads), 4)
+                directories = [
+                    shard_path(f'{data_set_name}_{num_chunks}_${{idx}}.lst', idx) for idx in range(num_chunks)
+                ]
+                self.layout.update({
+                    directory: {'files': chunk['file'].to_list()} for directory, chunk in zip(directories, chunks)
                 })
+                self.sample_data_sets[data_set_name][num_chunks] = directories
+
+    def create_read_shard_files(self):
+        for data_set_name in list(self.sample_data_sets):
+            files = self.all_files[:self.sample_data_sets[data_set_name]['num_files']]['file']
+            reads = self.read_index[self.read_index['file'].isin(files)]
+            read_data_set_name = data_set_name + READ_SHARDS_SUFFIX
+            read_data_set = {
+                'num_files': self.sample_data_sets[data_set_name]['num_files'],
+                'load_unit': 'samples', 'load': {}, 'imbalance': {}, 'read_ids': {}, 'shard_stats': {},
+                'stats': self.sample_data_sets[data_set_name]['stats'],
+            }
+            for num_chunks in self.num_chunks:
+                shards = shard_reads(reads, num_chunks=num_chunks)
+                loads = [int(shard['num_samples'].sum()) for shard in shards]
+                read_data_set['shard_stats'][num_chunks] = [
+                    shard_stats(shard['file'].unique().tolist(), self.file_stats, reads=shard) for shard in shards
+                ]
+                read_data_set['load'][num_chunks] = loads
+                read_data_set['imbalance'][num_chunks] = round(imbalance_ratio(loads), 4)
+                directories = [
+                    shard_path(f'{read_data_set_name}_{num_chunks}_${{idx}}.lst', idx) for idx in range(num_chunks)
+                ]
+                self.layout.update({
+                    directory: {'files': shard['file'].unique().tolist(), 'read_ids': shard['read_id'].to_list()}
+                    for directory, shard in zip(directories, shards)
+                })
+                read_data_set[num_chunks] = directories
+                read_data_set['read_ids'][num_chunks] = [directory + READ_IDS_SUFFIX for directory in directories]
+            self.sample_data_sets[read_data_set_name] = read_data_set
 
     def save_manifest(self):
-        with open(os.path.join(POD5_SUBSET_PATH, 'manifest.json'), 'w') as fp:
-            json.dump(self.sample_data_sets, fp, indent=4)
+        file_name = os.path.join(POD5_SUBSET_PATH, MANIFEST_FILE_NAME)
+        with open(file_name + '.tmp', 'w') as fp:
+            json.dump(dict(self.sample_data_sets, **{FILE_STATS_KEY: self.file_stats}), fp, indent=4)
+        os.replace(file_name + '.tmp', file_name)
+
+
+def load_manifest(path=POD5_SUBSET_PATH):
+    file_name = os.path.join(path, MANIFEST_FILE_NAME)
+    if not os.path.exists(file_name):
+        return {}
+    with open(file_name, 'r') as fp:
+        return json.load(fp)
 
 
-test_data = TestData()
+if __name__ == '__main__':
+    test_data = TestData()
@@ -119,13 +119,10 @@ fi
 
 echo ----- create test data sets -----
 
-INDICATOR=/var/tmp/indicator-create-test-data-sets
-if [ ! -f "${INDICATOR}" ]; then
-    script_file=$(eval '/usr/local/bin/aws ssm get-parameters --region '"$region"' --names /ONT-performance-benchmark/pod5-create-test-data-script --query '"'"'Parameters[0].Value'"'"' --output text')
-    aws s3 cp "$script_file" create_test_data_sets.py
-    python3 create_test_data_sets.py
-    touch "${INDICATOR}"
-fi
+# Runs on every start: the script only creates missing and removes stale symlinks of the test data sets.
+script_file=$(eval '/usr/local/bin/aws ssm get-parameters --region '"$region"' --names /ONT-performance-benchmark/pod5-create-test-data-script --query '"'"'Parameters[0].Value'"'"' --output text')
+aws s3 cp "$script_file" create_test_data_sets.py
+python3 create_test_data_sets.py
 
 echo ----- check download and conversion results -----
 
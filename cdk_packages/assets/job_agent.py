@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Job agent of the basecaller container, run by basecaller.sh with the basecaller command line of
+the job (see create_jobs/basecaller_batch/basecaller_batch.py).
+
+The agent looks up the job, the container instance and the EC2 instance with one call each and
+reuses one boto3 session for all calls. The lookups and the first write of the job to the reports
+table run in a background thread while the basecaller starts. The results are written with
+conditional updates: a write only succeeds if the item does not exist or was written by the same
+or an earlier attempt of the job, so a late write of a previous attempt never overwrites the
+results of a retry. The output of the basecaller is forwarded line by line as it is written, so
+the job ends as soon as the results are written. The throughput while the basecaller runs is
+streamed to the CloudWatch agent, see telemetry.py.
+
+"""
+
+import datetime
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import boto3
+
+import count_bases
+from telemetry import Telemetry
+
+REPORTS_TABLE_PARAMETER = '/ONT-performance-benchmark/reports-table-name'
+POD5_DATA_PATH = '/fsx/pod5-all-files/'
+OUTPUT_PATH = '/fsx/out/'
+# Placeholders in the command line, see create_jobs/basecaller_batch
+ARRAY_FILE_LIST_PLACEHOLDER = '&file_list&'
+JOB_ID_PLACEHOLDER = '&job_id&'
+# Seconds to wait for the log driver to ship the last lines before the container exits.
+LOG_DRAIN_SECONDS = float(os.environ.get('LOG_DRAIN_SECONDS', '1'))
+
+# job attempts and container resources
+NUMBER_ATTRIBUTES = ['job_attempts', 'container_VCPU', 'container_GPU', 'container_MEMORY']
+BASECALLER_NAMES = {'guppy_basecaller': 'guppy', 'dorado': 'dorado'}
+VERSION_COMMANDS = {
+    'guppy_basecaller': (['guppy_basecaller', '--version'], r'(?<=Version )[0-9]+\.[0-9]+\.[0-9]+'),
+    'dorado': (['dorado', '--version'], r'[0-9]+\.[0-9]+\.[0-9]+'),
+}
+# Metrics read from the basecaller log, the last match counts.
+METRICS = {
+    'guppy_basecaller': {
+        'caller_time_ms': r'(?<=Caller time: )[0-9]+',
+        'samples_called': r'(?<=Samples called: )[0-9]+',
+        'samples_per_s': r'(?<=samples/s: )[0-9]+\.[0-9]+e\+[0-9]+',
+    },
+    'dorado': {
+        'selected_batch_size': r'(?<=selected batchsize )[0-9]+',
+        'reads_basecalled': r'(?<=[rR]eads basecalled: )[0-9]+',
+        'samples_per_s': r'(?<=Samples/s: )[0-9]+\.[0-9]+e\+[0-9]+',
+    },
+}
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+def select_file_list(cmd_line, environ):
+    """
+    Select the file list of the job: the file list of the array index for array jobs, the only
+    file list otherwise.
+
+    :return: tuple of the command line, the file list, the array job ID and the array index
+    """
+    if not environ.get('FILE_LISTS'):
+        return cmd_line, None, '', ''
+    file_lists = environ['FILE_LISTS'].split()
+    array_index = environ.get('AWS_BATCH_JOB_ARRAY_INDEX', '')
+    array_job_id = environ['AWS_BATCH_JOB_ID'].rsplit(':', 1)[0] if array_index else ''
+    file_list = file_lists[int(array_index or 0)]
+    return cmd_line.replace(ARRAY_FILE_LIST_PLACEHOLDER, file_list), file_list, array_job_id, array_index
+
+
+def create_shard_directory(s3_client, file_list, file_lists_uri, data_path=POD5_DATA_PATH):
+    """
+    Create the directory of symlinks of a shard created on request from its file list on S3, see
+    create_jobs/basecaller_batch/test_data.py. The directory is built under a temporary name and
+    renamed, so that concurrent jobs of the same shard never see a partial directory.
+    """
+    if os.path.isdir(file_list):
+        return
+    bucket, _, prefix = file_lists_uri[len('s3://'):].partition('/')
+    print(f'creating shard directory {file_list} from {file_lists_uri}{os.path.basename(file_list)}')
+    body = s3_client.get_object(Bucket=bucket, Key=prefix + os.path.basename(file_list))['Body'].read()
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(file_list) + '.', dir=os.path.dirname(file_list))
+    for file_name in body.decode('utf-8').split():
+        os.symlink(os.path.join(data_path, file_name), os.path.join(tmp_dir, file_name))
+    os.chmod(tmp_dir, 0o755)
+    try:
+        os.rename(tmp_dir, file_list)
+    except OSError:
+        # another job of the shard was first
+        shutil.rmtree(tmp_dir)
+
+
+def build_command(cmd_line, job_id, output_path=OUTPUT_PATH):
+    """
+    Add the job ID to the output path of the basecaller.
+
+    :return: tuple of the basecaller command and the command line to run
+    """
+    command = cmd_line.split(maxsplit=1)[0] if cmd_line.strip() else ''
+    if command == 'guppy_basecaller':
+        cmd_line = re.sub(r'(--save_path\s+\S+)', lambda match: f'{match.group(1)}{job_id}/', cmd_line, count=1)
+    if command == 'dorado':
+        os.makedirs(os.path.join(output_path, job_id), exist_ok=True)
+        cmd_line = cmd_line.replace(JOB_ID_PLACEHOLDER, job_id)
+    return command, cmd_line
+
+
+def parse_metrics(command, log):
+    metrics = {}
+    for name, pattern in METRICS.get(command, {}).items():
+        matches = re.findall(pattern, log)
+        metrics[name] = matches[-1] if matches else ''
+    return metrics
+
+
+def basecaller_version(command):
+    if command not in VERSION_COMMANDS:
+        return ''
+    args, pattern = VERSION_COMMANDS[command]
+    try:
+        output = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True).stdout
+    except OSError:
+        return ''
+    match = re.search(pattern, output)
+    return match.group(0) if match else ''
+
+
+def run_basecaller(cmd_line, log_file, on_line=None):
+    """
+    Run the basecaller and forward its output line by line to stdout and the log file.
+
+    :param on_line: function called with each line of output
+    :return: return code of the basecaller
+    """
+    with open(log_file, 'w') as log, subprocess.Popen(
+            ['bash', '-o', 'pipefail', '-c', cmd_line], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True, errors='replace', bufsize=1) as process:
+        for line in process.stdout:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            log.write(line)
+            if on_line:
+                on_line(line)
+    return process.returncode
+
+
+def attributes(values):
+    """
+    Convert values to DynamoDB attribute values. The job attempts and the container resources are
+    numbers, all other values strings as written by the earlier versions of basecaller.sh.
+    """
+    return {
+        name: {'N': str(value)} if name in NUMBER_ATTRIBUTES else {'S': '' if value is None else str(value)}
+        for name, value in values.items()
+    }
+
+
+def write_item(dynamodb_client, table, job_id, attempt, values):
+    """
+    Write the values to the item of the job, unless a later attempt of the job wrote it.
+
+    :return: True if the item was written
+    """
+    names = {f'#a{i}': name for i, name in enumerate(values)}
+    expression_values = {f':v{i}': value for i, value in enumerate(attributes(values).values())}
+    expression_values[':attempt'] = {'N': str(attempt)}
+    try:
+        dynamodb_client.update_item(
+            TableName=table,
+            Key={'job_id': {'S': job_id}},
+            UpdateExpression='SET ' + ', '.join(f'#a{i} = :v{i}' for i in range(len(values))),
+            ConditionExpression='attribute_not_exists(job_id) OR job_attempts <= :attempt',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=expression_values,
+        )
+    except dynamodb_client.exceptions.ConditionalCheckFailedException:
+        print(f'results of job {job_id} were written by a later attempt, not updated')
+        return False
+    return True
+
+
+class JobAgent:
+
+    def __init__(self, environ=None, session=None):
+        self.environ = dict(os.environ if environ is None else environ)
+        self.job_id = self.environ.get('AWS_BATCH_JOB_ID', '')
+        self.attempt = int(self.environ.get('AWS_BATCH_JOB_ATTEMPT') or 1)
+        self.session = session or boto3.session.Session(region_name=self.environ.get('REGION'))
+        self.clients = {}
+        self.metadata = {}
+        self.reports_table = None
+
+    def client(self, name):
+        if name not in self.clients:
+            self.clients[name] = self.session.client(name)
+        return self.clients[name]
+
+    def get_metadata(self):
+        """
+        Look up the resources of the container, the EC2 instance the job runs on and the reports table.
+        """
+        job = self.client('batch').describe_jobs(jobs=[self.job_id])['jobs'][0]['container']
+        container_instance_arn = job['containerInstanceArn']
+        cluster_name = container_instance_arn.split('/', 1)[1].rsplit('/', 1)[0]
+        ec2_instance_id = self.client('ecs').describe_container_instances(
+            cluster=cluster_name, containerInstances=[container_instance_arn]
+        )['containerInstances'][0]['ec2InstanceId']
+        instance = self.client('ec2').describe_instances(
+            InstanceIds=[ec2_instance_id]
+        )['Reservations'][0]['Instances'][0]
+        self.reports_table = self.client('ssm').get_parameter(Name=REPORTS_TABLE_PARAMETER)['Parameter']['Value']
+        self.metadata = {
+            'compute_environment': self.environ.get('AWS_BATCH_CE_NAME', ''),
+            'ec2_instance_id': ec2_instance_id,
+            'ec2_instance_type': instance['InstanceType'],
+            'ec2_instance_launch_time': instance['LaunchTime'].isoformat(),
+            'ec2_availability_zone': instance['Placement']['AvailabilityZone'],
+        }
+        self.metadata.update({
+            f'container_{requirement["type"]}': int(requirement['value'])
+            for requirement in job.get('resourceRequirements', [])
+        })
+        print(f'EC2 instance ID: {ec2_instance_id}')
+        print(f'EC2 instance type: {instance["InstanceType"]}')
+        print(f'EC2 availability zone: {instance["Placement"]["AvailabilityZone"]}')
+
+    def write(self, values):
+        if self.reports_table:
+            write_item(self.client('dynamodb'), self.reports_table, self.job_id, self.attempt, values)
+
+    def run(self, cmd_line):
+        container_start_time = now()
+        print(f'AWS Batch job ID: {self.job_id}')
+        print(f'data set ID: {self.environ.get("DATA_SET_ID", "")}')
+        print(f'compute environment: {self.environ.get("AWS_BATCH_CE_NAME", "")}')
+        print(f'region: {self.environ.get("REGION", "")}')
+
+        cmd_line, file_list, array_job_id, array_index = select_file_list(cmd_line, self.environ)
+        if file_list:
+            print(f'array job ID: {array_job_id}, array index: {array_index}, file list: {file_list}')
+        item = {
+            'data_set_id': self.environ.get('DATA_SET_ID', ''),
+            'container_start_time': container_start_time,
+            'job_attempts': self.attempt,
+            'array_job_id': array_job_id,
+            'array_index': array_index,
+            'parameters': cmd_line,
+            'tags': self.environ.get('TAGS', ''),
+        }
+        command, basecaller_cmd_line = build_command(cmd_line, self.job_id)
+        version = {}
+        telemetry = Telemetry(
+            tags={'basecaller': BASECALLER_NAMES.get(command, ''), 'data_set_id': item['data_set_id']},
+            host=self.environ.get('STATSD_HOST'),
+        )
+
+        def start():
+            try:
+                self.get_metadata()
+                item.update(self.metadata)
+                telemetry.tags['instance_type'] = self.metadata['ec2_instance_type']
+                self.write(dict(item, status='started'))
+            except Exception as e:  # the basecaller runs anyway, the results are written at the end
+                print(f'failed to write the job start to the reports table: {e}')
+            version['value'] = basecaller_version(command)
+
+        starter = threading.Thread(target=start, daemon=True)
+        starter.start()
+        if file_list and self.environ.get('FILE_LISTS_URI'):
+            create_shard_directory(self.client('s3'), file_list, self.environ['FILE_LISTS_URI'])
+
+        # ---------- run basecaller --------------------
+        print('starting basecaller:')
+        print(basecaller_cmd_line)
+        log_file = f'{BASECALLER_NAMES.get(command, "basecaller")}.log'
+        basecaller_start = time.monotonic()
+        telemetry.start()
+        ret = run_basecaller(basecaller_cmd_line, log_file, on_line=telemetry.on_line) \
+            if command in BASECALLER_NAMES else 1
+        basecaller_seconds = round(time.monotonic() - basecaller_start, 3)
+        telemetry.stop()
+        print(f'return code from basecaller = {ret}')
+        # ----------------------------------------------
+
+        container_end_time = now()
+        starter.join()
+        if not self.reports_table:
+            # the lookups failed at the start, try once more to write the results
+            try:
+                self.get_metadata()
+                item.update(self.metadata)
+            except Exception as e:
+                print(f'failed to look up the job, results are not written: {e}')
+                return ret
+        item['container_end_time'] = container_end_time
+        item['throughput_series'] = telemetry.series_json()
+        print(f'writing results to reports table: {self.reports_table}')
+        if ret != 0:
+            self.write(dict(item, status='failed'))
+            return ret
+        with open(log_file, 'r', errors='replace') as f:
+            item.update(parse_metrics(command, f.read()))
+        item.update({
+            'status': 'succeeded',
+            'basecaller_name': BASECALLER_NAMES[command],
+            'basecaller_version': version.get('value', ''),
+            'basecaller_seconds': basecaller_seconds,
+        })
+        # Count the reads and bases the basecaller wrote, after the container end time is taken so
+        # that it does not add to the run time of the job.
+        try:
+            output_stats = count_bases.count_bases(os.path.join(OUTPUT_PATH, self.job_id), seconds=basecaller_seconds)
+            print(f'output statistics: {output_stats}')
+            item.update({name: output_stats[name] for name in count_bases.RESULT_FIELDS})
+        except Exception as e:
+            print(f'failed to count the bases in the output: {e}')
+        self.write(item)
+        return ret
+
+
+def main():
+    ret = JobAgent().run(sys.argv[1] if len(sys.argv) > 1 else '')
+    print('job completed')
+    sys.stdout.flush()
+    time.sleep(LOG_DRAIN_SECONDS)
+    sys.exit(ret)
+
+
+if __name__ == '__main__':
+    main()
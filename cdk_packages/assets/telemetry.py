@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+Live throughput telemetry of a basecaller job.
+
+The job agent (job_agent.py) passes each line of basecaller output to Telemetry.on_line() as it
+is written. Every few seconds, the throughput of the last interval is calculated from the
+counters found in the output and sent as gauges to the statsd listener of the CloudWatch agent
+on the host (see cloudwatch_agent_config_batch_compute.json), e.g. 'basecaller.reads_per_s'.
+The intervals are also kept as a compact time series, which is written to the reports table
+with the results of the job.
+
+The counters depend on the basecaller:
+
+- guppy prints the reads and bases processed every '--progress_stats_frequency' seconds
+  ('[PROG_STAT]' lines).
+- dorado prints a progress bar with the percentage of reads basecalled, and the reads and
+  samples per second at the end.
+
+Neither basecaller prints the number of signal samples processed while it runs, so there is no
+live samples rate; samples per second are only reported for the whole job (see job_agent.py).
+
+"""
+
+import json
+import re
+import socket
+import threading
+import time
+
+STATSD_PORT = 8125
+METRIC_PREFIX = 'basecaller.'
+TELEMETRY_INTERVAL = 10  # seconds
+# The time series is halved in resolution whenever it grows beyond this number of intervals.
+MAX_SERIES_POINTS = 360
+RATES = ['reads_per_s', 'bases_per_s']
+COUNTERS = {'reads_per_s': 'reads', 'bases_per_s': 'bases'}
+GUPPY_PROGRESS_COLUMNS = [
+    'time elapsed(secs)', 'time remaining (estimate)', 'total reads processed', 'total reads (estimate)',
+    'interval(secs)', 'interval reads processed', 'interval bases processed',
+]
+DORADO_PROGRESS = re.compile(r'^\s*\[[^\]]*\]\s*([0-9]+)%')
+
+
+def default_gateway(route_file='/proc/net/route'):
+    """
+    :return: address of the default gateway, the host in the default Docker bridge network, None if unknown
+    """
+    try:
+        with open(route_file, 'r') as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if len(fields) > 2 and fields[1] == '00000000':
+                    return socket.inet_ntoa(int(fields[2], 16).to_bytes(4, 'little'))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class Telemetry:
+
+    def __init__(self, tags: dict = None, host: str = None, port: int = STATSD_PORT,
+                 interval: float = TELEMETRY_INTERVAL, clock=time.monotonic):
+        """
+        :param tags: statsd tags of the gauges, may be updated while the job runs
+        :param host: address of the statsd listener, the default gateway if None
+        """
+        self.tags = tags if tags is not None else {}
+        self.address = (host or default_gateway() or '127.0.0.1', port)
+        self.interval = interval
+        self.clock = clock
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.counters = {'reads': 0, 'bases': 0}
+        self.available = set()
+        self.progress = None
+        self.guppy_columns = GUPPY_PROGRESS_COLUMNS
+        self.start_time = self.last_time = self.clock()
+        self.last_counters = dict(self.counters)
+        self.series = []
+        self.series_interval = interval
+
+    def on_line(self, line: str):
+        """
+        Update the counters from one line of basecaller output.
+        """
+        with self.lock:
+            if line.startswith('[PROG_STAT_HDR]'):
+                self.guppy_columns = [column.strip() for column in line[len('[PROG_STAT_HDR]'):].split(',')]
+            elif line.startswith('[PROG_STAT]'):
+                values = dict(zip(self.guppy_columns, line[len('[PROG_STAT]'):].split(',')))
+                try:
+                    self.counters['reads'] = int(float(values['total reads processed']))
+                    self.counters['bases'] += int(float(values['interval bases processed']))
+                    self.available.update(['reads', 'bases'])
+                except (KeyError, ValueError):
+                    pass
+            else:
+                match = DORADO_PROGRESS.match(line)
+                if match:
+                    self.progress = int(match.group(1))
+
+    def sample(self):
+        """
+        Calculate the throughput of the interval since the last sample, send it to statsd and
+        append it to the time series.
+
+        :return: dict with the rates by name
+        """
+        with self.lock:
+            now = self.clock()
+            elapsed = now - self.last_time
+            if elapsed <= 0:
+                return {}
+            rates = {
+                rate: (self.counters[counter] - self.last_counters[counter]) / elapsed
+                for rate, counter in COUNTERS.items() if counter in self.available
+            }
+            if self.progress is not None:
+                rates['progress_percent'] = self.progress
+            self.last_time = now
+            self.last_counters = dict(self.counters)
+            self.series.append([round(now - self.start_time, 1)] + [
+                round(rates[rate], 1) if rate in rates else None for rate in RATES + ['progress_percent']
+            ])
+            if len(self.series) > MAX_SERIES_POINTS:
+                self.series = compact(self.series)
+                self.series_interval *= 2
+        self.send(rates)
+        return rates
+
+    def send(self, rates: dict):
+        tags = ','.join(f'{name}:{value}' for name, value in self.tags.items() if value not in (None, ''))
+        for name, value in rates.items():
+            message = f'{METRIC_PREFIX}{name}:{value:.1f}|g' + (f'|#{tags}' if tags else '')
+            try:
+                self.socket.sendto(message.encode('utf-8'), self.address)
+            except OSError:
+                # telemetry must not fail the job
+                pass
+
+    def start(self):
+        self.start_time = self.last_time = self.clock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.sample()
+        self.socket.close()
+
+    def series_json(self):
+        """
+        :return: time series as compact JSON: interval, columns and one row per interval, the
+            first column is the end of the interval in seconds since the start
+        """
+        return json.dumps({
+            'interval': self.series_interval,
+            'columns': ['t'] + RATES + ['progress_percent'],
+            'values': self.series,
+        }, separators=(',', ':'))
+
+
+def compact(series: list):
+    """
+    Halve the resolution of a time series by merging pairs of intervals.
+    """
+    merged = []
+    for i in range(0, len(series), 2):
+        pair = series[i:i + 2]
+        merged.append([pair[-1][0]] + [
+            round(sum(values) / len(values), 1) if None not in values else None
+            for values in zip(*[row[1:] for row in pair])
+        ])
+    return merged
@@ -50,6 +50,24 @@ class BasecallerContainer(Construct):
         )
         basecaller_script.grant_read(params.image_builder.ec2_instance_role)
 
+        job_agent_script = Asset(
+            self, 'job agent script',
+            path=os.path.join(dirname, 'assets', 'job_agent.py')
+        )
+        job_agent_script.grant_read(params.image_builder.ec2_instance_role)
+
+        telemetry_script = Asset(
+            self, 'telemetry script',
+            path=os.path.join(dirname, 'assets', 'telemetry.py')
+        )
+        telemetry_script.grant_read(params.image_builder.ec2_instance_role)
+
+        count_bases_script = Asset(
+            self, 'count bases script',
+            path=os.path.join(dirname, 'assets', 'count_bases.py')
+        )
+        count_bases_script.grant_read(params.image_builder.ec2_instance_role)
+
         basecaller_containers = [
             {
                 'id': 'guppy_latest_dorado_v0_5_3',
@@ -104,6 +122,18 @@ class BasecallerContainer(Construct):
                                 name='S3PathBasecallerRunScript',
                                 value=[basecaller_script.s3_object_url]
                             ),
+                            imagebuilder.CfnContainerRecipe.ComponentParameterProperty(
+                                name='S3PathJobAgentScript',
+                                value=[job_agent_script.s3_object_url]
+                            ),
+                            imagebuilder.CfnContainerRecipe.ComponentParameterProperty(
+                                name='S3PathTelemetryScript',
+                                value=[telemetry_script.s3_object_url]
+                            ),
+                            imagebuilder.CfnContainerRecipe.ComponentParameterProperty(
+                                name='S3PathCountBasesScript',
+                                value=[count_bases_script.s3_object_url]
+                            ),
                             imagebuilder.CfnContainerRecipe.ComponentParameterProperty(
                                 name='DoradoURL',
                                 value=[basecaller_container['dorado_url']]
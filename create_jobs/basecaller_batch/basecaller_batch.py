@@ -7,13 +7,16 @@ environment.
 
 """
 
+import copy
+import hashlib
 import json
 import uuid
 from string import Template
 
 import boto3
 
-from .test_data import TestData
+from .submission import load_report, report_key, submit_jobs
+from .test_data import DEFAULT_SHARD_POLICY, TestData
 
 ssm_client = boto3.client('ssm')
 s3_client = boto3.client('s3')
@@ -25,9 +28,17 @@ account_id = boto3.client('sts').get_caller_identity().get('Account')
 # compute environments. This file is generated dynamically during deployment
 # of the performance benchmark environment.
 SSM_PARAMETER_STORE_INSTANCE_TYPES = '/ONT-performance-benchmark/aws-batch-instance-types'
-BASECALLER_DORADO_0_3_0 = f'{account_id}.dkr.ecr.{aws_region_name}.amazonaws.com/basecaller_guppy_latest_dorado0.3.0:latest'
-BASECALLER_DORADO_0_5_3 = f'{account_id}.dkr.ecr.{aws_region_name}.amazonaws.com/basecaller_guppy_latest_dorado0.5.3:latest'
+ECR_REGISTRY = f'{account_id}.dkr.ecr.{aws_region_name}.amazonaws.com'
+BASECALLER_DORADO_0_3_0 = f'{ECR_REGISTRY}/basecaller_guppy_latest_dorado0.3.0:latest'
+BASECALLER_DORADO_0_5_3 = f'{ECR_REGISTRY}/basecaller_guppy_latest_dorado0.5.3:latest'
 BASECALLER_DOCKER_IMAGE = BASECALLER_DORADO_0_5_3
+# Tag on the job definitions with the hash of the job definition name and container properties.
+JOB_DEFINITION_HASH_TAG = 'content-hash'
+# Placeholder for the file list in the basecaller parameters of array jobs. job_agent.py replaces
+# it with the file list selected by the array index of the child job.
+ARRAY_FILE_LIST_PLACEHOLDER = '&file_list&'
+# Test data set of the benchmark, the run time estimates of the reports are based on this data set.
+DEFAULT_DATA_SET = 'wgs_subset_128_files'
 
 CONTAINER_SHORT_NAME = {
     BASECALLER_DORADO_0_3_0: 'guppy-dorado0-3-0',
@@ -81,7 +92,8 @@ class BasecallerBatch:
         self.test_data = TestData()
         self.test_data.load_pod5_subsets()
         self.instance_types = get_aws_batch_instance_types()
-        # self.job_definitions = get_job_definitions()
+        # Registry of the active job definitions keyed by content hash, loaded once on first use.
+        self.job_definitions = None
         # self.create_missing_job_definitions()
 
     # def create_missing_job_definitions(self):
@@ -134,8 +146,37 @@ class BasecallerBatch:
     #         )
     #         self.job_definitions[job_definition['job_definition_name']] = batch_job_definition
 
-    def create_batch_jobs(self, compute: list, container: str = BASECALLER_DOCKER_IMAGE, cmd: str = '', tags: str = ''):
+    def create_batch_jobs(self, compute: list, container: str = BASECALLER_DOCKER_IMAGE, cmd: str = '', tags: str = '',
+                          array_job: bool = False, report_file: str = None, data_set: str = DEFAULT_DATA_SET,
+                          num_shards: int = None, shard_policy: str = DEFAULT_SHARD_POLICY):
+        """
+        Submit one job per GPU for each instance type, each job basecalling one subset of the test data.
+        In array job mode, one array job per instance type is submitted instead, with one child job per GPU.
+
+        :return: submission report, see submit_jobs()
+        """
+        jobs = self.plan_batch_jobs(compute, container=container, cmd=cmd, tags=tags, array_job=array_job,
+                                    data_set=data_set, num_shards=num_shards, shard_policy=shard_policy)
+        return self.submit_jobs(jobs, report_file=report_file)
+
+    def plan_batch_jobs(self, compute: list, container: str = BASECALLER_DOCKER_IMAGE, cmd: str = '', tags: str = '',
+                        array_job: bool = False, data_set: str = DEFAULT_DATA_SET, num_shards: int = None,
+                        shard_policy: str = DEFAULT_SHARD_POLICY):
+        """
+        Generate the jobs of create_batch_jobs() without submitting them. Job queues and job
+        definitions are resolved here, so that the jobs can be submitted concurrently. The test
+        data set is one of the POD5 subsets of TestData, e.g. 'wgs_subset_8_files'. By default it is
+        split into one shard per GPU, balanced by the default shard policy (see
+        TestData.resolve_shard_policy()). Other shard counts or shard policies (see
+        test_data.SHARD_POLICIES) are created on request, see TestData.get_subset().
+
+        :return: list of jobs, each a dict with the key (instance type, provisioning model, tags, image,
+            data set, number of shards, shard policy, shard), the data set ID and the arguments of submit_job()
+        """
         params_templ = Template(cmd)
+        shard_policy = self.test_data.resolve_shard_policy(shard_policy)
+        jobs = []
+        print('Generating AWS Batch jobs ...')
         for item in compute:  # aws_batch_env.validated_instances:
             max_vcpus = self.instance_types[item['instance_type']]['VCpuInfo']['DefaultVCpus']
             max_gpus = sum([
@@ -145,85 +186,175 @@ class BasecallerBatch:
             max_memory = int(
                 self.instance_types[item['instance_type']]['MemoryInfo']['SizeInMiB'] * 0.9
             )
-            file_lists = self.test_data.pod5_sample_data_subsets['wgs_subset_128_files'][max_gpus]  # 1 job per GPU
+            file_lists, file_lists_uri = self.test_data.get_subset(
+                data_set, num_shards or max_gpus, shard_policy  # default: 1 job per GPU
+            )
             # Unique identifier that allows to track which AWS batch jobs belong to the same data set
             data_set_id = str(uuid.uuid4())
-            print('Generating AWS Batch jobs ...')
-            for file_list in file_lists:
-                params = params_templ.substitute(
-                    file_list=file_list,
-                    num_base_mod_threads=max_vcpus // max_gpus if (max_vcpus // max_gpus) <= 48 else 48
-                )
-                job_id = self.submit_basecaller_job(
-                    instance_type=item['instance_type'],
-                    provisioning_model=item['provisioning_model'],
-                    container=container,
-                    basecaller_params=params,
-                    gpus=1,
-                    vcpus=max_vcpus // max_gpus,
-                    memory=max_memory // max_gpus,
-                    tags=[tags],
-                    data_set_id=data_set_id,
-                )
-                print(f'instance type: {item["instance_type"]}, tags: {tags}, file list: {file_list}, job ID: {job_id}')
-            print('Done. Check the status of the jobs in the AWS Batch console.')
+            num_base_mod_threads = max_vcpus // max_gpus if (max_vcpus // max_gpus) <= 48 else 48
+            job = {
+                'instance_type': item['instance_type'],
+                'provisioning_model': item['provisioning_model'],
+                'job_queue': self.get_job_queue(item['instance_type'], item['provisioning_model']),
+                'job_definition_arn': self.get_job_definition_arn(
+                    item['instance_type'], item['provisioning_model'], container
+                ),
+                'data_set_id': data_set_id,
+                'gpus': 1,
+                'vcpus': max_vcpus // max_gpus,
+                'memory': max_memory // max_gpus,
+                'tags': [tags],
+            }
+            if file_lists_uri:
+                # The shard directories are created by the basecaller jobs from the file lists on S3.
+                job['file_lists_uri'] = file_lists_uri
+            # Jobs with a different image or test data are different jobs in the submission report.
+            key = (item['instance_type'], item['provisioning_model'], tags, container, data_set,
+                   num_shards or 'per-gpu', shard_policy)
+            if array_job:
+                jobs.append(dict(
+                    job,
+                    key=key + ('array',),
+                    basecaller_params=params_templ.substitute(
+                        file_list=ARRAY_FILE_LIST_PLACEHOLDER,
+                        num_base_mod_threads=num_base_mod_threads
+                    ),
+                    array_size=len(file_lists),
+                    file_lists=file_lists,
+                ))
+            else:
+                for shard, file_list in enumerate(file_lists):
+                    jobs.append(dict(
+                        job,
+                        key=key + (shard,),
+                        basecaller_params=params_templ.substitute(
+                            file_list=file_list,
+                            num_base_mod_threads=num_base_mod_threads
+                        ),
+                        **({'file_lists': [file_list]} if file_lists_uri else {}),
+                    ))
+        return jobs
+
+    def submit_jobs(self, jobs: list, report_file: str = None, **kwargs):
+        """
+        Submit jobs generated by plan_batch_jobs() concurrently, see submission.submit_jobs(). Jobs in
+        the report file are not submitted again. The remaining jobs of a partially submitted data set
+        keep the data set ID of the jobs submitted before.
+
+        :return: submission report
+        """
+        report = load_report(report_file)
+        data_set_ids = {
+            key.rsplit('|', 1)[0]: entry['data_set_id'] for key, entry in report.items() if entry.get('data_set_id')
+        }
+        for job in jobs:
+            job['data_set_id'] = data_set_ids.get(report_key(job['key'][:-1]), job['data_set_id'])
+        report = submit_jobs(jobs, self.submit_planned_job, report_file=report_file, **kwargs)
+        for job in jobs:
+            entry = report.get(report_key(job['key']))
+            if entry:
+                print(f'instance type: {job["instance_type"]}, tags: {", ".join(job["tags"])}, '
+                      f'shard: {job["key"][-1]}, job ID: {entry["job_id"]}')
+        print('Done. Check the status of the jobs in the AWS Batch console.')
+        return report
+
+    def submit_planned_job(self, job: dict):
+        """
+        Submit a job generated by plan_batch_jobs().
+
+        :return: job ID
+        """
+        overrides = {
+            name: job[name]
+            for name in ['gpus', 'vcpus', 'memory', 'tags', 'data_set_id', 'file_lists', 'file_lists_uri']
+            if name in job
+        }
+        container_overrides = self.make_container_overrides(job['basecaller_params'], **overrides)
+        return self.submit_job(
+            job['job_queue'], job['job_definition_arn'], container_overrides, array_size=job.get('array_size')
+        )
 
     def submit_basecaller_job(
             self,
             instance_type='', provisioning_model='EC2', container=BASECALLER_DOCKER_IMAGE,
-            basecaller_params='', **kwargs):
-        job_queue = self.instance_types[instance_type]['ProvisioningModel'][provisioning_model]
+            basecaller_params='', array_size=None, **kwargs):
+        """
+        Submit a basecaller job. If array_size is greater than 1, an array job with this number of
+        child jobs is submitted.
+
+        :return: job ID
+        """
+        job_queue = self.get_job_queue(instance_type, provisioning_model)
         job_definition_arn = self.get_job_definition_arn(instance_type, provisioning_model, container)
         container_overrides = self.make_container_overrides(basecaller_params, **kwargs)
+        return self.submit_job(job_queue, job_definition_arn, container_overrides, array_size=array_size)
+
+    def submit_job(self, job_queue, job_definition_arn, container_overrides, array_size=None):
+        """
+        :return: job ID
+        """
+        submit_job_args = {}
+        # AWS Batch array jobs have at least 2 child jobs, a single file list is submitted as a normal job.
+        if array_size and array_size > 1:
+            submit_job_args['arrayProperties'] = {'size': array_size}
         job = batch_client.submit_job(
             jobName=job_queue,
             jobQueue=job_queue,
             jobDefinition=job_definition_arn,
             containerOverrides=container_overrides,
-            retryStrategy={'attempts': 10}
+            retryStrategy={'attempts': 10},
+            **submit_job_args
         )
         return job['jobId']
 
+    def get_job_queue(self, instance_type, provisioning_model):
+        return self.instance_types[instance_type]['ProvisioningModel'][provisioning_model]
+
     def get_job_definition_arn(self, instance_type, provisioning_model, container):
         """
         Get job definition ARN for given job queue, instance type and container. If job definition doesn't
-        exist, create one.
+        exist, create one. Job definitions are looked up in the registry of active job definitions by the
+        hash of their name and container properties, a new revision is only registered if the hash changed.
 
         :return: job definition ARN
         """
-        job_definition_name = f'{instance_type.replace(".", "-")}-{provisioning_model}-{CONTAINER_SHORT_NAME[container]}'
-        job_definition = get_job_definition(job_definition_name)
-        if job_definition:
-            job_definition_arn = job_definition['jobDefinitionArn']
-        else:
-            job_definition = self.create_job_definition(
-                job_definition_name, instance_type=instance_type, container=container
+        job_definition_name = f'{instance_type.replace(".", "-")}-{provisioning_model}-{container_short_name(container)}'
+        container_properties = self.make_container_properties(instance_type, container)
+        content_hash = job_definition_hash(job_definition_name, container_properties)
+        if self.job_definitions is None:
+            self.job_definitions = get_job_definitions()
+        if content_hash not in self.job_definitions:
+            self.job_definitions[content_hash] = self.create_job_definition(
+                job_definition_name, container_properties, content_hash
             )
-            job_definition_arn = job_definition['jobDefinitionArn']
-        return job_definition_arn
+        return self.job_definitions[content_hash]['jobDefinitionArn']
 
-    def create_job_definition(self, job_definition_name, instance_type='', container=BASECALLER_DOCKER_IMAGE):
-        """
-        Create job definition for given job definition name.
-
-        :return: job definition details
-        """
+    def make_container_properties(self, instance_type='', container=BASECALLER_DOCKER_IMAGE):
         vcpus = self.instance_types[instance_type]['VCpuInfo']['DefaultVCpus']
         gpus = sum([gpu['Count'] for gpu in self.instance_types[instance_type]['GpuInfo']['Gpus']])
         memory = int(
             self.instance_types[instance_type]['MemoryInfo'][
                 'SizeInMiB'] * 0.9)  # reserve max. 90% of memory for tasks
-        container_properties = CONTAINER_PROPERTIES_TEMPLATE
+        container_properties = copy.deepcopy(CONTAINER_PROPERTIES_TEMPLATE)
         container_properties['image'] = container
         container_properties['resourceRequirements'][0]['value'] = str(vcpus)
         container_properties['resourceRequirements'][1]['value'] = str(gpus)
         container_properties['resourceRequirements'][2]['value'] = str(memory)
+        return container_properties
+
+    def create_job_definition(self, job_definition_name, container_properties, content_hash):
+        """
+        Create job definition for given job definition name.
+
+        :return: job definition details
+        """
+        print(f'Registering job definition "{job_definition_name}" ...')
         job_definition = batch_client.register_job_definition(
             jobDefinitionName=job_definition_name,
             type='container',
             # parameters={'tags': ''},
             containerProperties=container_properties,
-            tags={'application': 'ONT Performance Benchmark'},
+            tags={'application': 'ONT Performance Benchmark', JOB_DEFINITION_HASH_TAG: content_hash},
         )
         return job_definition
 
@@ -250,6 +381,11 @@ class BasecallerBatch:
                 env_vars.append({'name': 'TAGS', 'value': ','.join(kwargs['tags'])})
             if 'data_set_id' in kwargs.keys():
                 env_vars.append({'name': 'DATA_SET_ID', 'value': kwargs['data_set_id']})
+            if 'file_lists' in kwargs.keys():
+                # Child job i of an array job basecalls file list i.
+                env_vars.append({'name': 'FILE_LISTS', 'value': ' '.join(kwargs['file_lists'])})
+            if 'file_lists_uri' in kwargs.keys():
+                env_vars.append({'name': 'FILE_LISTS_URI', 'value': kwargs['file_lists_uri']})
         container_overrides['environment'] = env_vars
         return container_overrides
 
@@ -281,27 +417,49 @@ def get_aws_batch_instance_types():
     return instance_types
 
 
-# def get_job_definitions():
-#     job_definitions = {
-#         job_definition['jobDefinitionName']: job_definition
-#         for job_definition in batch_client.describe_job_definitions(status='ACTIVE')['jobDefinitions']
-#     }
-#     return job_definitions
+def container_image(repository):
+    """
+    :return: URI of the latest image in the given ECR repository of this account and region
+    """
+    return f'{ECR_REGISTRY}/{repository}:latest'
+
+
+def container_short_name(container):
+    # Job definition names allow letters, numbers, hyphens and underscores.
+    if container in CONTAINER_SHORT_NAME:
+        return CONTAINER_SHORT_NAME[container]
+    return container.split('/')[-1].split(':')[0].replace('basecaller_', '').replace('_', '-').replace('.', '-')
 
 
-def get_job_definition(job_definition_name):
+def job_definition_hash(job_definition_name, container_properties):
+    content = json.dumps({'name': job_definition_name, 'containerProperties': container_properties}, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_job_definitions():
     """
-    Get job definition details for given job definition name.
+    Get all active job definitions registered by this library, keyed by content hash. If there are
+    multiple revisions with the same hash, the latest revision is used.
 
-    :return: job definition details
+    :return: job definition details by content hash
     """
-    job_definitions = {
-        job_definition['jobDefinitionName']: job_definition
-        for job_definition in batch_client.describe_job_definitions(status='ACTIVE')['jobDefinitions']
-    }
-    if job_definition_name in job_definitions.keys():
-        return job_definitions[job_definition_name]
-    return None
+    job_definitions = {}
+    for page in batch_client.get_paginator('describe_job_definitions').paginate(status='ACTIVE'):
+        for job_definition in page['jobDefinitions']:
+            content_hash = job_definition.get('tags', {}).get(JOB_DEFINITION_HASH_TAG)
+            if content_hash and job_definition['revision'] > job_definitions.get(content_hash, {}).get('revision', 0):
+                job_definitions[content_hash] = job_definition
+    return job_definitions
+
+
+def get_array_job_status(job_id):
+    """
+    Get the status of an array job and the number of child jobs per status with a single call.
+
+    :return: tuple of the array job status and a dict with the number of child jobs per status
+    """
+    job = batch_client.describe_jobs(jobs=[job_id])['jobs'][0]
+    return job['status'], job.get('arrayProperties', {}).get('statusSummary', {})
 
 
 def terminate_all_jobs():
@@ -321,9 +479,7 @@ def deregister_all_job_definitions():
     """
     Deregister all job definitions. Call this function if there are issues with the job definitions.
     """
-    job_definition_details = batch_client.describe_job_definitions(
-        status='ACTIVE'
-    )
-    for item in job_definition_details['jobDefinitions']:
-        print(f'Deleting job definition "{item["jobDefinitionName"]}" ...')
-        batch_client.deregister_job_definition(jobDefinition=item['jobDefinitionArn'])
+    for page in batch_client.get_paginator('describe_job_definitions').paginate(status='ACTIVE'):
+        for item in page['jobDefinitions']:
+            print(f'Deleting job definition "{item["jobDefinitionName"]}" ...')
+            batch_client.deregister_job_definition(jobDefinition=item['jobDefinitionArn'])
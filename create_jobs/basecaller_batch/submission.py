@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Concurrent submission of AWS Batch jobs.
+
+Jobs are submitted from a pool of worker threads. A token bucket limits the rate of SubmitJob
+calls to stay below the AWS Batch API limits, and throttled calls are retried with exponential
+backoff and full jitter. Each submitted job is recorded in a submission report under the key of
+the job, e.g. (instance type, tags, image, data set, shard). Jobs already in the report are not
+submitted again, so a sweep can be resubmitted with the report of the first run after a partial
+failure.
+
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import ClientError
+
+SUBMISSION_MAX_WORKERS = 16
+# AWS Batch allows up to 50 SubmitJob calls per second per account, leave some for other clients.
+SUBMISSION_RATE = 40
+SUBMISSION_BURST = 50
+SUBMISSION_MAX_ATTEMPTS = 8
+SUBMISSION_BASE_DELAY = 0.5  # seconds
+SUBMISSION_MAX_DELAY = 30  # seconds
+THROTTLING_ERROR_CODES = ['TooManyRequestsException', 'ThrottlingException']
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate: tokens added per second
+            capacity: maximum number of tokens, i.e. the maximum burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, wait until a token is available.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def report_key(key):
+    return '|'.join(str(part) for part in key)
+
+
+def load_report(report_file):
+    if not report_file or not os.path.exists(report_file):
+        return {}
+    with open(report_file, 'r') as f:
+        return json.load(f)
+
+
+def save_report(report, report_file):
+    with open(report_file + '.tmp', 'w') as f:
+        json.dump(report, f, indent=4)
+    os.replace(report_file + '.tmp', report_file)
+
+
+def call_with_retry(function, *args, max_attempts=SUBMISSION_MAX_ATTEMPTS, base_delay=SUBMISSION_BASE_DELAY,
+                    max_delay=SUBMISSION_MAX_DELAY):
+    """
+    Call the function, retry with exponential backoff and full jitter if the call is throttled.
+    """
+    for attempt in range(max_attempts):
+        try:
+            return function(*args)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLING_ERROR_CODES or attempt == max_attempts - 1:
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+def submit_jobs(jobs, submit, report_file=None, max_workers=SUBMISSION_MAX_WORKERS, rate=SUBMISSION_RATE,
+                burst=SUBMISSION_BURST):
+    """
+    Submit jobs concurrently.
+
+    :param jobs: list of dicts with the key of the job in 'key' and the arguments for submit
+    :param submit: function submitting one job, returns the job ID
+    :param report_file: JSON file with the submission report. Jobs already in the report are skipped.
+    :param max_workers: number of threads submitting jobs
+    :param rate: maximum number of submissions per second
+    :param burst: maximum number of submissions at once
+    :return: submission report, a dict with the job ID and data set ID by job key
+    """
+    report = load_report(report_file)
+    pending = [job for job in jobs if report_key(job['key']) not in report]
+    if len(pending) < len(jobs):
+        print(f'{len(jobs) - len(pending)} of {len(jobs)} jobs have been submitted before, skipping.')
+    bucket = TokenBucket(rate, burst)
+    lock = threading.Lock()
+    failed = []
+
+    def submit_job(job):
+        bucket.acquire()
+        return call_with_retry(submit, job)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(submit_job, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                job_id = future.result()
+            except ClientError as e:
+                print(f'Failed to submit job {job["key"]}: {e}')
+                failed.append(job)
+                continue
+            with lock:
+                report[report_key(job['key'])] = {'job_id': job_id, 'data_set_id': job.get('data_set_id')}
+                if report_file:
+                    save_report(report, report_file)
+    print(f'Submitted {len(pending) - len(failed)} jobs in {time.perf_counter() - start:.1f} s, '
+          f'{len(failed)} failed.')
+    return report
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Parameter sweeps over basecaller settings.
+
+A sweep specification (YAML) lists the compute environments and, per basecaller, a matrix of
+parameter values. The matrix is expanded into the cross product of its values. A list entry that
+is a mapping sets several parameters together, e.g. a model and the modified bases it calls.
+Parameters that do not apply to a basecaller are ignored, and job sets with the same settings
+are generated once.
+
+Each job set is tagged with its settings in the form 'basecaller=dorado; version=0.5.3; ...',
+see results/experiment_catalog/experiment_catalog.py for the parser used by the reports.
+
+The optional 'data_set' selects the test data set. Read-level data sets ('<data set>_reads', see
+cdk_packages/assets/create_test_data_sets.py) pass the list of read IDs of each shard to the
+basecaller. The optional 'num_shards' and 'shard_policy' (samples, size or count) split file-level
+data sets into other shards than one per GPU, see create_jobs/basecaller_batch/test_data.py.
+
+Example:
+
+    compute:
+      - {instance_type: g5.48xlarge, provisioning_model: SPOT}
+    images:
+      dorado: {0.5.3: basecaller_guppy_latest_dorado0.5.3}
+    sweeps:
+      - basecaller: dorado
+        matrix:
+          version: [0.5.3]
+          modified_bases:
+            - {modified_bases: no modified bases, model: dna_r10.4.1_e8.2_400bps_hac@v3.5.2}
+          batch_size: [auto, 256, 512]
+    data_set: wgs_subset_128_files_reads
+
+"""
+
+import itertools
+
+import yaml
+
+AUTO = 'auto'
+
+# Parameters of each basecaller in the order they appear in the tags.
+PARAMETERS = {
+    'guppy': ['version', 'model', 'modified_bases', 'num_callers', 'gpu_runners_per_device', 'chunks_per_runner',
+              'threads'],
+    'dorado': ['version', 'model', 'modified_bases', 'batch_size', 'threads'],
+}
+
+DEFAULTS = {
+    'guppy': {'num_callers': 16, 'gpu_runners_per_device': 8, 'chunks_per_runner': 2048, 'threads': AUTO},
+    'dorado': {'batch_size': AUTO, 'threads': 8},
+}
+
+MODIFIED_BASES = ['no modified bases', '5mCG', '5mCG_5hmCG']
+DEFAULT_DATA_SET = 'wgs_subset_128_files'
+DEFAULT_SHARD_POLICY = None  # by samples if known, by size otherwise, see test_data.py
+# Shards of read-level data sets have their read IDs listed in '<shard directory>.read_ids.txt'.
+READ_SHARDS_SUFFIX = '_reads'
+READ_IDS_SUFFIX = '.read_ids.txt'
+
+
+def load_sweep(file_name):
+    """
+    Load a sweep specification from a YAML file.
+
+    :return: sweep specification
+    """
+    with open(file_name, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def expand_sweep(spec):
+    """
+    Expand the matrices of a sweep specification into job sets.
+
+    :return: list of job sets, each a dict with the basecaller, its parameters, the image
+        repository, the tags and the command template for BasecallerBatch.plan_batch_jobs()
+    """
+    job_sets = {}
+    read_ids = is_read_level(spec.get('data_set', DEFAULT_DATA_SET))
+    for sweep in spec['sweeps']:
+        basecaller = sweep['basecaller']
+        if basecaller not in PARAMETERS:
+            raise ValueError(f'Unknown basecaller "{basecaller}", expected one of {list(PARAMETERS)}.')
+        axes = [
+            [value if isinstance(value, dict) else {name: value} for value in values]
+            for name, values in sweep.get('matrix', {}).items()
+        ]
+        for combination in itertools.product(*axes):
+            params = dict(DEFAULTS[basecaller])
+            for values in combination:
+                params.update(values)
+            params = {name: normalize(params[name]) for name in PARAMETERS[basecaller] if name in params}
+            missing = [name for name in ['version', 'model', 'modified_bases'] if name not in params]
+            if missing:
+                raise ValueError(f'Sweep for {basecaller} does not set {missing}.')
+            if params['modified_bases'] not in MODIFIED_BASES:
+                raise ValueError(f'Unknown modified bases "{params["modified_bases"]}", '
+                                 f'expected one of {MODIFIED_BASES}.')
+            tags = format_tags(basecaller, params)
+            if tags in job_sets:
+                continue
+            job_sets[tags] = {
+                'basecaller': basecaller,
+                'params': params,
+                'image': spec['images'][basecaller][params['version']],
+                'tags': tags,
+                'cmd': COMMANDS[basecaller](params, read_ids),
+            }
+    return list(job_sets.values())
+
+
+def normalize(value):
+    # YAML reads versions like 0.5 as numbers and auto settings may be written in upper case.
+    value = str(value)
+    return AUTO if value.lower() == AUTO else value
+
+
+def is_read_level(data_set):
+    return data_set.endswith(READ_SHARDS_SUFFIX)
+
+
+def format_tags(basecaller, params):
+    return '; '.join([f'basecaller={basecaller}'] + [f'{name}={params[name]}' for name in PARAMETERS[basecaller]])
+
+
+def guppy_command(params, read_ids=False):
+    threads = '${num_base_mod_threads}' if params['threads'] == AUTO else params['threads']
+    read_id_list = f'--read_id_list ${{file_list}}{READ_IDS_SUFFIX} ' if read_ids else ''
+    return \
+        'guppy_basecaller ' \
+        '--compress_fastq ' \
+        '--input_path ${file_list}/ ' \
+        '--save_path /fsx/out/ ' \
+        f'--config {params["model"]}.cfg ' \
+        '--bam_out ' \
+        '--index ' \
+        '--device cuda:all:100% ' \
+        '--records_per_fastq 0 ' \
+        '--progress_stats_frequency 5 ' \
+        '--recursive ' \
+        f'{read_id_list}' \
+        f'--num_base_mod_threads {threads} ' \
+        f'--num_callers {params["num_callers"]} ' \
+        f'--gpu_runners_per_device {params["gpu_runners_per_device"]} ' \
+        f'--chunks_per_runner {params["chunks_per_runner"]}'
+
+
+def dorado_command(params, read_ids=False):
+    batch_size = '' if params['batch_size'] == AUTO else f'--batchsize {params["batch_size"]} '
+    modified_bases = '' if params['modified_bases'] == 'no modified bases' \
+        else f'--modified-bases {params["modified_bases"]} '
+    read_id_list = f'--read-ids ${{file_list}}{READ_IDS_SUFFIX} ' if read_ids else ''
+    return \
+        'dorado basecaller ' \
+        f'/usr/local/dorado/models/{params["model"]} ' \
+        '${file_list}/ ' \
+        '--verbose ' \
+        f'{read_id_list}' \
+        f'{batch_size}' \
+        f'{modified_bases}| ' \
+        f'samtools view --threads {params["threads"]} -O BAM -o /fsx/out/&job_id&/calls.bam'
+
+
+COMMANDS = {
+    'guppy': guppy_command,
+    'dorado': dorado_command,
+}
@@ -4,15 +4,28 @@
 
 Library for batching test data.
 
+The subsets of the POD5 test data listed in the manifest are created during deployment (see
+cdk_packages/assets/create_test_data_sets.py). Subsets for other shard counts or balancing
+policies are created on request: the file list of each shard is saved on S3 and the subset is
+recorded in an on-demand manifest on S3. The basecaller job creates the directory of symlinks of
+its shard on FSx from the file list on first use (see cdk_packages/assets/job_agent.py).
+By default, the shards are balanced by the number of signal samples of the files recorded in the
+manifest, or by file size if the manifest has no per-file statistics.
+Concurrent submitters update the on-demand manifest with conditional writes, and since the
+shards of a subset only depend on the test data, they agree on its content.
+
 """
 
+import heapq
 import json
 import re
+import time
 from string import Template
 
 import boto3
 import numpy as np
 import pandas as pd
+from botocore.exceptions import ClientError
 
 PARAMETER_S3_BUCKET = '/ONT-performance-benchmark/data-s3-bucket'
 FAST5_TEST_DATA_KEY_PREFIX = 'fast5-all-files/'
@@ -20,14 +33,99 @@ POD5_TEST_DATA_KEY_PREFIX = 'pod5-all-files/'
 FAST5_FILE_LISTS_KEY_PREFIX = 'fast5-file-lists/'
 POD5_FILE_LISTS_KEY_PREFIX = 'pod5-file-lists/'
 POD5_FILE_LISTS_MANIFEST = 'pod5-subsets/manifest.json'
+POD5_ON_DEMAND_MANIFEST = 'pod5-subsets/on-demand-manifest.json'
+POD5_ON_DEMAND_LISTS_KEY_PREFIX = 'pod5-subsets/on-demand/'
+POD5_SUBSET_PATH = '/fsx/pod5-subsets/'
+# key of the per-file statistics in the manifest, see cdk_packages/assets/create_test_data_sets.py
+FILE_STATS_KEY = 'files'
+# 'samples': balance the signal samples per shard, 'size': balance the bytes per shard,
+# 'count': split into shards of consecutive files of equal count
+SHARD_POLICIES = ['samples', 'size', 'count']
+# None: 'samples' if the manifest has the samples of all files, 'size' otherwise
+DEFAULT_SHARD_POLICY = None
+# S3 error codes of conditional writes that lost against a concurrent write
+CONDITIONAL_WRITE_CONFLICTS = ['PreconditionFailed', 'ConditionalRequestConflict']
 
 ssm_client = boto3.client('ssm')
 s3_client = boto3.client('s3')
 
 
-def chunk_file_list(list_to_chunk, num_chunks=1):
-    chunks = np.array_split(list_to_chunk, num_chunks)
-    return chunks
+# chunk_file_list(), balance_shards() and imbalance_ratio() are the same as in
+# cdk_packages/assets/create_test_data_sets.py, which runs standalone on the downloader instance.
+def chunk_file_list(list_to_chunk, num_chunks=1, weight='samples'):
+    """
+    Split the files into num_chunks shards with balanced load, see balance_shards().
+    """
+    weights = list_to_chunk[weight] if weight in list_to_chunk.columns else pd.Series(1, index=list_to_chunk.index)
+    return [list_to_chunk.iloc[shard] for shard in balance_shards(weights.to_list(), num_chunks)]
+
+
+def balance_shards(weights, num_chunks=1):
+    """
+    Longest-processing-time-first bin packing: assign the items by descending weight, each to the
+    shard with the least load so far. The largest shard is at most 4/3 of the optimum.
+
+    :return: list of item positions per shard, in the original order of the items
+    """
+    shards = [[] for _ in range(num_chunks)]
+    heap = [(0, idx) for idx in range(num_chunks)]
+    for position in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        load, idx = heapq.heappop(heap)
+        shards[idx].append(position)
+        heapq.heappush(heap, (load + weights[position], idx))
+    return [sorted(shard) for shard in shards]
+
+
+def imbalance_ratio(loads):
+    mean = sum(loads) / len(loads)
+    return max(loads) / mean if mean > 0 else 1.0
+
+
+def split_file_list(files, num_chunks=1, policy='size'):
+    """
+    Split the files into num_chunks shards by a shard policy, see SHARD_POLICIES. The 'samples'
+    policy requires a 'samples' column.
+    """
+    if policy not in SHARD_POLICIES:
+        raise ValueError(f'Unknown shard policy "{policy}", expected one of {SHARD_POLICIES}.')
+    if policy == 'count':
+        return [files.iloc[positions] for positions in np.array_split(np.arange(len(files)), num_chunks)]
+    if policy not in files.columns or files[policy].isna().any():
+        raise ValueError(f'The shard policy "{policy}" requires the {policy} of all files.')
+    return chunk_file_list(files, num_chunks=num_chunks, weight=policy)
+
+
+def update_on_demand_manifest(s3_bucket, key, entry, max_attempts=10):
+    """
+    Add an entry to the on-demand manifest on S3, unless a concurrent submitter added it first.
+    The manifest is replaced with a conditional write, which fails if the manifest changed since
+    it was read; the update is then retried.
+
+    :return: entry in the manifest
+    """
+    for attempt in range(max_attempts):
+        try:
+            data = s3_client.get_object(Bucket=s3_bucket, Key=POD5_ON_DEMAND_MANIFEST)
+            manifest = json.loads(data['Body'].read().decode('utf-8'))
+            condition = {'IfMatch': data['ETag']}
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchKey':
+                raise
+            manifest = {}
+            condition = {'IfNoneMatch': '*'}
+        if key in manifest:
+            return manifest[key]
+        manifest[key] = entry
+        try:
+            s3_client.put_object(
+                Body=json.dumps(manifest, indent=4), Bucket=s3_bucket, Key=POD5_ON_DEMAND_MANIFEST, **condition
+            )
+            return entry
+        except ClientError as e:
+            if e.response['Error']['Code'] not in CONDITIONAL_WRITE_CONFLICTS:
+                raise
+            time.sleep(0.1 * 2 ** attempt)
+    raise RuntimeError(f'Failed to update {POD5_ON_DEMAND_MANIFEST} after {max_attempts} attempts.')
 
 
 def save_chunk_files(batch, template, s3_bucket, key_prefix):
@@ -35,8 +133,9 @@ def save_chunk_files(batch, template, s3_bucket, key_prefix):
     file_list = []
     for idx, batch in enumerate(batch):
         file_name = template.substitute(idx=idx)
+        # Each file name ends with a newline, 'while read' in shell scripts skips an unterminated last line.
         s3_client.put_object(
-            Body='\n'.join(batch['file'].to_list()),
+            Body=''.join(f'{f}\n' for f in batch['file']),
             Bucket=s3_bucket,
             Key=key_prefix + file_name
         )
@@ -46,13 +145,17 @@ def save_chunk_files(batch, template, s3_bucket, key_prefix):
 
 def create_list_files(sample_data_sets, files, num_chunks_list, s3_bucket, key_prefix):
     for data_set_name in sample_data_sets:
+        sample_data_sets[data_set_name].update({'load_unit': 'size', 'load': {}, 'imbalance': {}})
         for num_chunks in num_chunks_list:
+            chunks = chunk_file_list(
+                files[:sample_data_sets[data_set_name]['num_files']], num_chunks=num_chunks, weight='size'
+            )
+            loads = [int(chunk['size'].sum()) for chunk in chunks]
+            sample_data_sets[data_set_name]['load'][num_chunks] = loads
+            sample_data_sets[data_set_name]['imbalance'][num_chunks] = round(imbalance_ratio(loads), 4)
             sample_data_sets[data_set_name].update({
                 num_chunks: save_chunk_files(
-                    chunk_file_list(
-                        files[:sample_data_sets[data_set_name]['num_files']],
-                        num_chunks=num_chunks
-                    ),
+                    chunks,
                     f'{data_set_name}_{num_chunks}_${{idx}}.lst',
                     s3_bucket,
                     key_prefix)
@@ -100,6 +203,10 @@ class TestData:
             },
         }
         self.pod5_sample_data_subsets = {}
+        # shard policy of the subsets in the manifest, by data set
+        self.pod5_subset_policies = {}
+        self.pod5_on_demand_subsets = {}
+        self.pod5_file_stats = {}
         self.num_chunks = [1, 2, 4, 8]
 
     def get_file_list(self, pattern, key_prefix):
@@ -140,8 +247,73 @@ class TestData:
         data = s3_client.get_object(Bucket=self.s3_bucket, Key=POD5_FILE_LISTS_MANIFEST)
         contents = data['Body'].read().decode('utf-8')
         self.pod5_sample_data_subsets = json.loads(contents)
+        self.pod5_file_stats = self.pod5_sample_data_subsets.pop(FILE_STATS_KEY, {})
+        self.pod5_subset_policies = {
+            key: data_set.get('load_unit', 'size') for key, data_set in self.pod5_sample_data_subsets.items()
+        }
         # convert numerical string keys to integer
         for key in self.pod5_sample_data_subsets.keys():
             self.pod5_sample_data_subsets[key] = {
                 chunk: self.pod5_sample_data_subsets[key][str(chunk)] for chunk in self.num_chunks
             }
+
+    def resolve_shard_policy(self, policy=DEFAULT_SHARD_POLICY):
+        """
+        :return: the shard policy, 'samples' if the default policy is requested and the manifest has
+            the samples of all files, 'size' otherwise
+        """
+        if policy is not None:
+            return policy
+        has_samples = self.pod5_file_stats and all(
+            entry.get('samples') is not None for entry in self.pod5_file_stats.values()
+        )
+        return 'samples' if has_samples else 'size'
+
+    def get_subset(self, data_set, num_chunks, policy=DEFAULT_SHARD_POLICY):
+        """
+        Get the shards of a POD5 test data set. Subsets not created during deployment are created
+        on request for any number of shards and shard policy, see the module documentation.
+
+        :return: tuple of the list of shard directories on FSx and the S3 URI prefix of their file
+            lists, None if the directories exist already
+        """
+        policy = self.resolve_shard_policy(policy)
+        if policy == self.pod5_subset_policies.get(data_set) \
+                and num_chunks in self.pod5_sample_data_subsets.get(data_set, {}):
+            return self.pod5_sample_data_subsets[data_set][num_chunks], None
+        key = f'{data_set}|{num_chunks}|{policy}'
+        if key not in self.pod5_on_demand_subsets:
+            self.pod5_on_demand_subsets[key] = self.create_on_demand_subset(data_set, num_chunks, policy)
+        entry = self.pod5_on_demand_subsets[key]
+        return entry['file_lists'], entry['file_lists_uri']
+
+    def create_on_demand_subset(self, data_set, num_chunks, policy='size'):
+        if data_set not in self.pod5_sample_data_sets:
+            raise ValueError(f'Subsets of "{data_set}" can not be created on request, '
+                             f'expected one of {list(self.pod5_sample_data_sets)}.')
+        print(f'Creating subset of {data_set} with {num_chunks} shards balanced by {policy} ...')
+        files = self.pod5_all_files[:self.pod5_sample_data_sets[data_set]['num_files']]
+        files = files.assign(samples=files['file'].map(lambda f: self.pod5_file_stats.get(f, {}).get('samples')))
+        chunks = split_file_list(files, num_chunks, policy)
+        file_names = save_chunk_files(
+            chunks, f'{data_set}_{num_chunks}_{policy}_${{idx}}.lst', self.s3_bucket, POD5_ON_DEMAND_LISTS_KEY_PREFIX
+        )
+        load_unit = 'samples' if policy == 'samples' else 'size'
+        loads = [int(chunk[load_unit].sum()) for chunk in chunks]
+        entry = {
+            'file_lists': [POD5_SUBSET_PATH + file_name for file_name in file_names],
+            'file_lists_uri': f's3://{self.s3_bucket}/{POD5_ON_DEMAND_LISTS_KEY_PREFIX}',
+            'load_unit': load_unit,
+            'load': loads,
+            'imbalance': round(imbalance_ratio(loads), 4),
+        }
+        if self.pod5_file_stats:
+            entry['shard_stats'] = [self.shard_stats(chunk['file'].to_list()) for chunk in chunks]
+        return update_on_demand_manifest(self.s3_bucket, f'{data_set}|{num_chunks}|{policy}', entry)
+
+    def shard_stats(self, files):
+        stats = [self.pod5_file_stats.get(f, {}) for f in files]
+        return {
+            name: sum(entry[name] for entry in stats) if all(entry.get(name) is not None for entry in stats) else None
+            for name in ['reads', 'samples', 'bytes']
+        }
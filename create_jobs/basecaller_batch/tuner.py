@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Adaptive search for the basecaller settings with the highest throughput per instance type.
+
+Instead of running every candidate setting on the full test data set, the candidates are run
+with successive halving: all candidates are evaluated on a small subset of the test data, and
+only the best 1/eta are promoted to the next, larger subset. The throughput of a candidate is
+the sum of 'samples_per_s' over the GPUs of its data set, as recorded in the reports table.
+
+The search is independent of AWS Batch. The evaluation function is passed in, so that the
+search can be run against a simulated throughput function.
+
+"""
+
+import hashlib
+import math
+import time
+
+import boto3
+
+from .submission import report_key
+
+# Test data sets of the rungs, from small to large.
+RUNGS = ['wgs_subset_8_files', 'wgs_subset_64_files', 'wgs_subset_128_files']
+ETA = 3
+# Tags of tuning jobs do not start with 'basecaller=', so they are not included in the reports.
+# The settings are replaced by a short tuning ID, the settings of each ID are in the tuning report.
+TUNING_TAGS_PREFIX = 'tuning: '
+TUNING_ID_LENGTH = 12
+REPORTS_TABLE_PARAMETER = '/ONT-performance-benchmark/reports-table-name'
+TERMINAL_JOB_STATUS = ['SUCCEEDED', 'FAILED']
+POLL_INTERVAL = 60  # seconds
+
+
+def successive_halving(candidates: list, evaluate, rungs: list = RUNGS, eta: int = ETA):
+    """
+    Find the candidate with the highest throughput with successive halving.
+
+    :param candidates: list of job sets, see sweep.expand_sweep()
+    :param evaluate: function evaluate(candidates, data_set) returning the throughput by tags,
+        None for failed candidates
+    :param rungs: test data sets, from small to large
+    :param eta: 1/eta of the candidates of a rung are promoted to the next rung
+    :return: tuple of the best candidate and the history, a list with the throughput by tags per rung
+    """
+    history = []
+    for rung, data_set in enumerate(rungs):
+        print(f'Evaluating {len(candidates)} candidates on {data_set} ...')
+        scores = evaluate(candidates, data_set)
+        history.append({'data_set': data_set, 'scores': scores})
+        ranked = sorted(
+            [candidate for candidate in candidates if scores.get(candidate['tags']) is not None],
+            key=lambda candidate: scores[candidate['tags']],
+            reverse=True,
+        )
+        if not ranked:
+            print('All candidates failed.')
+            return None, history
+        if rung == len(rungs) - 1:
+            break
+        candidates = ranked[:max(1, math.ceil(len(ranked) / eta))]
+    return ranked[0], history
+
+
+def tune(compute: list, candidates: list, evaluate, rungs: list = RUNGS, eta: int = ETA):
+    """
+    Run successive halving for each compute environment.
+
+    :param compute: list of compute environments, each a dict with 'instance_type' and 'provisioning_model'
+    :param evaluate: function evaluate(compute, candidates, data_set), see successive_halving()
+    :return: dict with the best candidate, the history and the settings by tuning ID (see
+        tuning_tags()) by instance type
+    """
+    results = {}
+    for item in compute:
+        print(f'Tuning basecaller settings for {item["instance_type"]} ...')
+        best, history = successive_halving(
+            candidates, lambda rung_candidates, data_set: evaluate(item, rung_candidates, data_set), rungs, eta
+        )
+        results[item['instance_type']] = {
+            'best': best['tags'] if best else None,
+            'samples_per_s': history[-1]['scores'].get(best['tags']) if best else None,
+            'history': history,
+            'tuning_ids': {tuning_id(candidate['tags']): candidate['tags'] for candidate in candidates},
+        }
+        print(f'Best settings for {item["instance_type"]}: {results[item["instance_type"]]["best"]}')
+    return results
+
+
+def tuning_id(tags: str):
+    return hashlib.sha1(tags.encode('utf-8')).hexdigest()[:TUNING_ID_LENGTH]
+
+
+def tuning_tags(tags: str, data_set: str):
+    """
+    Tags of the tuning jobs of a candidate. The tags of the candidate are too long to be used as
+    job tags, e.g. as partition names of the results store, they are replaced by their tuning ID.
+    """
+    return f'{TUNING_TAGS_PREFIX}{tuning_id(tags)}; data_set={data_set}'
+
+
+class BatchEvaluator:
+
+    def __init__(self, aws_batch_env, poll_interval: int = POLL_INTERVAL):
+        """
+        Evaluate candidates by running them as AWS Batch jobs and reading their throughput back
+        from the reports table.
+
+        :param aws_batch_env: BasecallerBatch instance
+        :param poll_interval: seconds between checks of the job status
+        """
+        self.aws_batch_env = aws_batch_env
+        self.poll_interval = poll_interval
+        self.batch_client = boto3.client('batch')
+        self.dynamodb_client = boto3.client('dynamodb')
+        self.reports_table = boto3.client('ssm').get_parameter(Name=REPORTS_TABLE_PARAMETER)['Parameter']['Value']
+
+    def __call__(self, compute: dict, candidates: list, data_set: str):
+        from .basecaller_batch import container_image
+
+        jobs = []
+        tags_by_data_set = {}
+        for candidate in candidates:
+            planned = self.aws_batch_env.plan_batch_jobs(
+                [compute], container=container_image(candidate['image']), cmd=candidate['cmd'],
+                tags=tuning_tags(candidate['tags'], data_set), array_job=True, data_set=data_set
+            )
+            tags_by_data_set.update({job['data_set_id']: candidate['tags'] for job in planned})
+            jobs += planned
+        report = self.aws_batch_env.submit_jobs(jobs)
+        self.wait_for_jobs([entry['job_id'] for entry in report.values()])
+        samples_per_s = self.get_samples_per_s(report_job_ids(jobs, report))
+        return {tags_by_data_set[data_set_id]: value for data_set_id, value in samples_per_s.items()}
+
+    def wait_for_jobs(self, job_ids: list):
+        pending = list(job_ids)
+        while pending:
+            status = {}
+            for i in range(0, len(pending), 100):
+                for job in self.batch_client.describe_jobs(jobs=pending[i:i + 100])['jobs']:
+                    status[job['jobId']] = job['status']
+            pending = [job_id for job_id in pending if status.get(job_id) not in TERMINAL_JOB_STATUS]
+            if pending:
+                print(f'Waiting for {len(pending)} of {len(job_ids)} jobs ...')
+                time.sleep(self.poll_interval)
+
+    def get_samples_per_s(self, job_ids: dict):
+        """
+        Sum 'samples_per_s' of the succeeded jobs per data set. The items of the jobs are read by
+        their job IDs. Data sets with failed jobs or jobs without results are left out, their
+        throughput is not comparable.
+
+        :param job_ids: job IDs in the reports table by data set ID, see report_job_ids()
+        :return: samples per second by data set ID
+        """
+        data_set_ids = {job_id: data_set_id for data_set_id, ids in job_ids.items() for job_id in ids}
+        items = []
+        keys = [{'job_id': {'S': job_id}} for job_id in data_set_ids]
+        for i in range(0, len(keys), 100):
+            request = {self.reports_table: {
+                'Keys': keys[i:i + 100],
+                'ProjectionExpression': 'job_id, #status, samples_per_s',
+                'ExpressionAttributeNames': {'#status': 'status'},
+            }}
+            while request:
+                response = self.dynamodb_client.batch_get_item(RequestItems=request)
+                items += response['Responses'].get(self.reports_table, [])
+                request = response.get('UnprocessedKeys')
+                if request:
+                    time.sleep(1)
+        samples_per_s = {}
+        succeeded = set()
+        for item in items:
+            if item.get('status', {}).get('S') != 'succeeded':
+                continue
+            data_set_id = data_set_ids[item['job_id']['S']]
+            succeeded.add(item['job_id']['S'])
+            samples_per_s[data_set_id] = samples_per_s.get(data_set_id, 0) + \
+                float(item.get('samples_per_s', {}).get('S') or 0)
+        return {
+            data_set_id: value for data_set_id, value in samples_per_s.items()
+            if succeeded.issuperset(job_ids[data_set_id])
+        }
+
+
+def report_job_ids(jobs: list, report: dict):
+    """
+    Get the IDs under which the jobs write their results to the reports table, the IDs of the
+    child jobs for array jobs.
+
+    :param jobs: jobs generated by BasecallerBatch.plan_batch_jobs()
+    :param report: submission report of the jobs
+    :return: job IDs by data set ID
+    """
+    job_ids = {}
+    for job in jobs:
+        entry = report.get(report_key(job['key']))
+        if not entry:
+            continue
+        array_size = job.get('array_size') or 1
+        ids = [f'{entry["job_id"]}:{index}' for index in range(array_size)] if array_size > 1 else [entry['job_id']]
+        job_ids.setdefault(job['data_set_id'], []).extend(ids)
+    return job_ids
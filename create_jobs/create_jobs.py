@@ -4,10 +4,16 @@
 Generate ONT basecaller jobs for AWS Batch.
 """
 
+import argparse
+import datetime
+import json
+import os
+
 import boto3
 
 from basecaller_batch.basecaller_batch import \
-    BasecallerBatch, environment_is_ready, terminate_all_jobs, deregister_all_job_definitions
+    BasecallerBatch, environment_is_ready, terminate_all_jobs, deregister_all_job_definitions, container_image
+from basecaller_batch import sweep, tuner
 
 ssm_client = boto3.client('ssm')
 aws_region_name = boto3.session.Session().region_name
@@ -15,83 +21,26 @@ account_id = boto3.client('sts').get_caller_identity().get('Account')
 
 BASECALLER_DORADO_0_3_0 = f'{account_id}.dkr.ecr.{aws_region_name}.amazonaws.com/basecaller_guppy_latest_dorado0.3.0:latest'
 BASECALLER_DORADO_0_5_3 = f'{account_id}.dkr.ecr.{aws_region_name}.amazonaws.com/basecaller_guppy_latest_dorado0.5.3:latest'
-
-gupppy_no_modified_bases = \
-    'guppy_basecaller ' \
-    '--compress_fastq ' \
-    '--input_path ${file_list}/ ' \
-    '--save_path /fsx/out/ ' \
-    '--config dna_r10.4.1_e8.2_400bps_hac.cfg ' \
-    '--bam_out ' \
-    '--index ' \
-    '--device cuda:all:100% ' \
-    '--records_per_fastq 0 ' \
-    '--progress_stats_frequency 600 ' \
-    '--recursive ' \
-    '--num_base_mod_threads ${num_base_mod_threads} ' \
-    '--num_callers 16 ' \
-    '--gpu_runners_per_device 8 ' \
-    '--chunks_per_runner 2048'
-
-gupppy_modified_bases_5mCG = \
-    'guppy_basecaller ' \
-    '--compress_fastq ' \
-    '--input_path ${file_list}/ ' \
-    '--save_path /fsx/out/ ' \
-    '--config dna_r10.4.1_e8.2_400bps_modbases_5mc_cg_hac.cfg ' \
-    '--bam_out ' \
-    '--index ' \
-    '--device cuda:all:100% ' \
-    '--records_per_fastq 0 ' \
-    '--progress_stats_frequency 600 ' \
-    '--recursive ' \
-    '--num_base_mod_threads ${num_base_mod_threads} ' \
-    '--num_callers 16 ' \
-    '--gpu_runners_per_device 8 ' \
-    '--chunks_per_runner 2048'
-
-gupppy_modified_bases_5mCG_5hmCG = \
-    'guppy_basecaller ' \
-    '--compress_fastq ' \
-    '--input_path ${file_list}/ ' \
-    '--save_path /fsx/out/ ' \
-    '--config dna_r10.4_e8.1_modbases_5hmc_5mc_cg_hac.cfg ' \
-    '--bam_out ' \
-    '--index ' \
-    '--device cuda:all:100% ' \
-    '--records_per_fastq 0 ' \
-    '--progress_stats_frequency 600 ' \
-    '--recursive ' \
-    '--num_base_mod_threads ${num_base_mod_threads} ' \
-    '--num_callers 16 ' \
-    '--gpu_runners_per_device 8 ' \
-    '--chunks_per_runner 2048'
-
-dorado_no_modified_bases = \
-    'dorado basecaller ' \
-    '/usr/local/dorado/models/dna_r10.4.1_e8.2_400bps_hac@v3.5.2 ' \
-    '${file_list}/ ' \
-    '--verbose | ' \
-    'samtools view --threads 8 -O BAM -o /fsx/out/&job_id&/calls.bam'
-
-dorado_modified_bases_5mCG = \
-    'dorado basecaller ' \
-    '/usr/local/dorado/models/dna_r10.4.1_e8.2_400bps_hac@v3.5.2 ' \
-    '${file_list}/ ' \
-    '--verbose ' \
-    '--modified-bases 5mCG | ' \
-    'samtools view --threads 8 -O BAM -o /fsx/out/&job_id&/calls.bam'
-
-dorado_modified_bases_5mCG_5hmCG = \
-    'dorado basecaller ' \
-    '/usr/local/dorado/models/dna_r10.4.1_e8.2_400bps_hac@v4.0.0 ' \
-    '${file_list}/ ' \
-    '--verbose ' \
-    '--modified-bases 5mCG_5hmCG | ' \
-    'samtools view --threads 8 -O BAM -o /fsx/out/&job_id&/calls.bam'
+SUBMISSION_REPORT_FILE_NAME = 'submission_report_{sweep}_{time}.json'
+TUNING_REPORT_FILE_NAME = 'tuning_report.json'
+DEFAULT_SWEEP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sweeps', 'benchmark.yaml')
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Submit basecaller benchmark jobs to AWS Batch.')
+    parser.add_argument('--sweep', default=DEFAULT_SWEEP_FILE, metavar='FILE',
+                        help='sweep specification (YAML) with the instance types and basecaller settings to run')
+    parser.add_argument('--tune', action='store_true',
+                        help='search the settings of the sweep with the highest throughput per instance type with '
+                             'successive halving on growing subsets of the test data, instead of running all settings '
+                             'on the full test data set')
+    parser.add_argument('--resume', metavar='REPORT',
+                        help='submission report of an earlier run of the same sweep, only the jobs not listed in the '
+                             'report are submitted, e.g. after some submissions failed')
+    args = parser.parse_args()
+    if args.resume and not os.path.exists(args.resume):
+        parser.error(f'submission report {args.resume} not found')
+
     if not environment_is_ready():
         print(f'The benchmark environment is not ready. Please try again later.')
         return
@@ -102,20 +51,33 @@ def main():
     # terminate_all_jobs()  # <-- run this command to delete all running batch jobs
     # deregister_all_job_definitions()  # <-- run this command to delete all job definitions
 
-    compute = [
-        {'instance_type': 'g5.48xlarge', 'provisioning_model': 'SPOT'},
-        {'instance_type': 'p3.16xlarge', 'provisioning_model': 'SPOT'},
-    ]
-
-    # # create guppy jobs
-    aws_batch_env.create_batch_jobs(compute, cmd=gupppy_no_modified_bases, tags='guppy, no modified bases')
-    aws_batch_env.create_batch_jobs(compute, cmd=gupppy_modified_bases_5mCG, tags='guppy, modified bases 5mCG')
-    aws_batch_env.create_batch_jobs(compute, cmd=gupppy_modified_bases_5mCG_5hmCG, tags='guppy, modified bases 5mCG & 5hmCG')
-
-    # create dorado jobs
-    aws_batch_env.create_batch_jobs(compute, cmd=dorado_no_modified_bases, tags='dorado, no modified bases')
-    aws_batch_env.create_batch_jobs(compute, cmd=dorado_modified_bases_5mCG, tags='dorado, modified bases 5mCG')
-    aws_batch_env.create_batch_jobs(compute, cmd=dorado_modified_bases_5mCG_5hmCG, tags='dorado, modified bases 5mCG & 5hmCG')
+    spec = sweep.load_sweep(args.sweep)
+    job_sets = sweep.expand_sweep(spec)
+    print(f'Sweep {args.sweep}: {len(job_sets)} basecaller settings on {len(spec["compute"])} compute environments.')
+    data_set = spec.get('data_set', sweep.DEFAULT_DATA_SET)
+    if args.tune:
+        rungs = [rung + sweep.READ_SHARDS_SUFFIX for rung in tuner.RUNGS] if sweep.is_read_level(data_set) \
+            else tuner.RUNGS
+        results = tuner.tune(spec['compute'], job_sets, tuner.BatchEvaluator(aws_batch_env), rungs=rungs)
+        with open(TUNING_REPORT_FILE_NAME, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f'Tuning results saved in {TUNING_REPORT_FILE_NAME}.')
+        return
+    jobs = []
+    for job_set in job_sets:
+        jobs += aws_batch_env.plan_batch_jobs(
+            spec['compute'], container=container_image(job_set['image']), cmd=job_set['cmd'], tags=job_set['tags'],
+            array_job=True, data_set=data_set, num_shards=spec.get('num_shards'),
+            shard_policy=spec.get('shard_policy', sweep.DEFAULT_SHARD_POLICY)
+        )
+
+    # Submit all jobs concurrently. Each run writes a new report, unless an earlier run is resumed.
+    report_file = args.resume or SUBMISSION_REPORT_FILE_NAME.format(
+        sweep=os.path.splitext(os.path.basename(args.sweep))[0],
+        time=datetime.datetime.now().strftime('%Y%m%d-%H%M%S'),
+    )
+    aws_batch_env.submit_jobs(jobs, report_file=report_file)
+    print(f'Submission report saved in {report_file}, pass --resume {report_file} to submit failed jobs again.')
 
 
 if __name__ == '__main__':
@@ -1,16 +1,40 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import contextlib
+import csv
 import datetime
+import functools
+import gzip
 import json
+import operator
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os.path import exists
 
 import boto3
-from pkg_resources import resource_filename
+import botocore
+from botocore.config import Config
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+PRICING_MAX_WORKERS = 8
+# Adaptive retry mode backs off and rate limits the client when requests are throttled.
+PRICING_RETRY_CONFIG = Config(
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    max_pool_connections=PRICING_MAX_WORKERS,
+)
 
 # Use AWS Pricing API through Boto3. API only has us-east-1 and ap-south-1 as valid endpoints.
 # It doesn't have any impact on your selected region for your instance.
-client_pricing = boto3.client('pricing', region_name='us-east-1')
+client_pricing = boto3.client('pricing', region_name='us-east-1', config=PRICING_RETRY_CONFIG)
 
 # Search product filter. This will reduce the amount of data returned by the
 # get_products function of the Pricing API
@@ -21,16 +45,39 @@ FLT = '[{{"Field": "tenancy", "Value": "shared", "Type": "TERM_MATCH"}},' \
       '{{"Field": "location", "Value": "{r}", "Type": "TERM_MATCH"}},' \
       '{{"Field": "capacitystatus", "Value": "Used", "Type": "TERM_MATCH"}}]'
 
+# Values of the product attributes in the bulk offer files matching the FLT filter.
+OFFER_FILE_FILTER = {
+    'TermType': 'OnDemand',
+    'Unit': 'Hrs',
+    'Tenancy': 'Shared',
+    'Pre Installed S/W': 'NA',
+    'CapacityStatus': 'Used',
+}
+
 PRICING_FILE_NAME = 'aws_pricing.json'
 PRICING_MAX_AGE = datetime.timedelta(hours=24)
+REGIONS = ['us-west-2', 'us-east-1', 'eu-central-1', 'eu-west-1', 'eu-west-2', 'me-south-1']
 
 
-def get_price(region, instance, os):
+def get_price(region, instance, operating_system, metrics: list = None):
     """
     Get current AWS price for an on-demand instance.
+
+    Args:
+        region: region name as used by the Pricing API, e.g. 'US West (Oregon)'
+        instance: instance type
+        operating_system: operating system, e.g. 'Linux'
+        metrics: if given, the latency and the number of retries of the call are appended
+
     """
-    f = FLT.format(r=region, t=instance, o=os)
+    f = FLT.format(r=region, t=instance, o=operating_system)
+    start = time.perf_counter()
     data = client_pricing.get_products(ServiceCode='AmazonEC2', Filters=json.loads(f))
+    if metrics is not None:
+        metrics.append({
+            'latency_s': time.perf_counter() - start,
+            'retries': data['ResponseMetadata'].get('RetryAttempts', 0),
+        })
     price = None
     if data['PriceList']:
         od = json.loads(data['PriceList'][0])['terms']['OnDemand']
@@ -49,31 +96,99 @@ def get_region_name(region_code):
     other APIs are using the region code.
     """
     default_region = 'US East (N. Virginia)'
-    endpoint_file = resource_filename('botocore', 'data/endpoints.json')
+    return get_region_names().get(region_code, default_region)
+
+
+@functools.lru_cache(maxsize=None)
+def get_region_names():
+    """
+    Map of region codes to region names, read once from the botocore endpoints file.
+    """
+    endpoint_file = os.path.join(os.path.dirname(botocore.__file__), 'data', 'endpoints.json')
     try:
         with open(endpoint_file, 'r') as f:
             data = json.load(f)
-        # Botocore is using Europe while Pricing API using EU...sigh...
-        return data['partitions'][0]['regions'][region_code]['description'].replace('Europe', 'EU')
     except IOError:
-        return default_region
+        return {}
+    # Botocore is using Europe while Pricing API using EU...sigh...
+    return {
+        region_code: region['description'].replace('Europe', 'EU')
+        for region_code, region in data['partitions'][0]['regions'].items()
+    }
 
 
 def load_from_file():
     """
-    Load prices from file
+    Load the pricing cache from file. Pricing files written by earlier versions, with one
+    'price_list_date' for all prices, are migrated to entries with that date.
+
+    Returns:
+        cache: dict with 'currency' and 'entries', entries keyed by entry_key()
+
     """
-    prices = None
+    cache = {'currency': 'USD', 'entries': {}}
     if exists(PRICING_FILE_NAME):
         print('Loading pricing from file ...')
         with open(PRICING_FILE_NAME, 'r') as f:
             prices = json.load(f, object_hook=as_float)
-        price_list_date = datetime.datetime.strptime(prices['price_list_date'], '%Y-%m-%d %H:%M:%S')
-        # If the pricing file is older than desired, then we need to get the new prices
-        if datetime.datetime.now() - price_list_date > PRICING_MAX_AGE:
-            print('Pricing file has expired ...')
-            prices = None
-    return prices
+        if 'entries' in prices:
+            cache = prices
+        else:
+            print('Migrating pricing file ...')
+            cache['entries'] = {
+                entry_key(region, instance, 'Linux'): {
+                    'cost_per_hour': price['cost_per_hour'],
+                    'fetched': prices['price_list_date'],
+                }
+                for region, instance_prices in prices['instances'].items()
+                for instance, price in instance_prices.items()
+            }
+    return cache
+
+
+def save_to_file(cache: dict):
+    """
+    Save the pricing cache. The file is replaced atomically, so that readers never see a
+    partially written file.
+    """
+    with open(PRICING_FILE_NAME + '.tmp', 'w') as f:
+        json.dump(cache, f, indent=4)
+    os.replace(PRICING_FILE_NAME + '.tmp', PRICING_FILE_NAME)
+
+
+@contextlib.contextmanager
+def pricing_file_lock():
+    """
+    Exclusive lock on the pricing cache, held while the cache is read, refreshed and written,
+    so that concurrent runs don't fetch the same prices or overwrite each other's entries.
+    """
+    with open(PRICING_FILE_NAME + '.lock', 'w') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    # retries for 10 seconds before raising an error
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def entry_key(region, instance, operating_system):
+    return f'{region}|{instance}|{operating_system}'
+
+
+def is_expired(entry: dict, now: datetime.datetime):
+    fetched = datetime.datetime.strptime(entry['fetched'], '%Y-%m-%d %H:%M:%S')
+    return now - fetched > PRICING_MAX_AGE
 
 
 def as_float(obj):
@@ -82,35 +197,151 @@ def as_float(obj):
     return obj
 
 
-def get_pricing_from_api(instance_types: list):
+def get_pricing_from_api(requests: list):
     """
     Get current prices from AWS Pricing API
+
+    Args:
+        requests: list of (region code, instance type, operating system) tuples
+
+    Returns:
+        entries: cache entries keyed by entry_key()
+
     """
-    print('Requesting current pricing from AWS pricing API ...')
-    # aws_batch_env = BasecallerBatch()
-    regions = ['us-west-2', 'us-east-1', 'eu-central-1', 'eu-west-1', 'eu-west-2', 'me-south-1']
-    operating_system = 'Linux'
-    prices = {
-        'price_list_date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'currency': 'USD',
-        'instances': {},
-    }
-    for region in regions:
-        prices['instances'][region] = {
-            instance: {'cost_per_hour': get_price(get_region_name(region), instance, operating_system)}
-            for instance in instance_types
+    print(f'Requesting {len(requests)} prices from AWS pricing API ...')
+    fetched = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    metrics = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=PRICING_MAX_WORKERS) as executor:
+        costs = executor.map(
+            lambda request: get_price(get_region_name(request[0]), request[1], request[2], metrics),
+            requests
+        )
+        entries = {
+            entry_key(*request): {'cost_per_hour': float(cost_per_hour) if cost_per_hour else None, 'fetched': fetched}
+            for request, cost_per_hour in zip(requests, costs)
         }
-    with open(PRICING_FILE_NAME, 'w') as f:
-        json.dump(prices, f, indent=4)
-    prices = load_from_file()
-    return prices
+    print_metrics(metrics, time.perf_counter() - start)
+    return entries
+
+
+def print_metrics(metrics: list, wall_time_s: float):
+    """
+    Print a summary of the latencies and retries of the Pricing API calls.
+    """
+    if not metrics:
+        return
+    latencies = sorted(metric['latency_s'] for metric in metrics)
+    print(f'Pricing API: {len(metrics)} calls in {wall_time_s:.1f} s, '
+          f'latency mean {statistics.mean(latencies):.2f} s, '
+          f'p50 {latencies[len(latencies) // 2]:.2f} s, '
+          f'p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.2f} s, '
+          f'max {latencies[-1]:.2f} s, '
+          f'{sum(metric["retries"] for metric in metrics)} retries')
+
+
+def load_offer_file(file_name: str, region: str = None):
+    """
+    Build a price index from a regional EC2 bulk offer file in CSV format, e.g.
+    https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonEC2/current/us-west-2/index.csv
+    The file is parsed row by row in one pass, only the on-demand prices matching the FLT filter
+    are kept. Files compressed with gzip are read if the file name ends with '.gz'.
+
+    Args:
+        file_name: path to the offer file
+        region: region code of the offer file, taken from the 'Region Code' column if None
 
+    Returns:
+        index: cache entries keyed by entry_key(), with the publication date of the file as 'fetched'
 
-def get_pricing(instance_types: list):
     """
-    Get current prices
+    print(f'Loading prices from offer file {file_name} ...')
+    open_file = gzip.open if file_name.endswith('.gz') else open
+    index = {}
+    fetched = None
+    with open_file(file_name, 'rt', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        # The header of the price list is preceded by metadata rows such as the publication date.
+        for row in reader:
+            if row and row[0] == 'Publication Date':
+                fetched = datetime.datetime.strptime(row[1], '%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%d %H:%M:%S')
+            if row and row[0] == 'SKU':
+                header = row
+                break
+        else:
+            raise ValueError(f'No price list header found in offer file {file_name}.')
+        filter_columns = operator.itemgetter(*[header.index(column) for column in OFFER_FILE_FILTER])
+        filter_values = tuple(OFFER_FILE_FILTER.values())
+        instance_column = header.index('Instance Type')
+        os_column = header.index('Operating System')
+        price_column = header.index('PricePerUnit')
+        region_column = header.index('Region Code') if 'Region Code' in header else None
+        for row in reader:
+            if filter_columns(row) != filter_values:
+                continue
+            row_region = region or row[region_column]
+            index[entry_key(row_region, row[instance_column], row[os_column])] = {
+                'cost_per_hour': float(row[price_column]) or None,
+                'fetched': fetched,
+            }
+    return index
+
+
+def get_pricing(instance_types: list, regions: list = REGIONS, operating_system: str = 'Linux',
+                offer_files: list = None):
+    """
+    Get current prices. Only prices missing in the pricing cache or older than PRICING_MAX_AGE
+    are requested from the AWS Pricing API. If offer files are given, the prices are taken from
+    the offer files only, without using the AWS Pricing API or the pricing cache.
+
+    Args:
+        instance_types: instance types
+        regions: region codes
+        operating_system: operating system
+        offer_files: paths to regional EC2 bulk offer files in CSV format
+
+    Returns:
+        prices: dict with 'price_list_date' (the date of the oldest price), 'currency' and
+            'instances', the cost per hour by region and instance type
+
     """
-    prices = load_from_file()
-    if not prices:
-        prices = get_pricing_from_api(instance_types)
-    return prices
+    requests = [(region, instance, operating_system) for region in regions for instance in instance_types]
+    if offer_files:
+        index = {}
+        for file_name in offer_files:
+            index.update(load_offer_file(file_name))
+        missing = {'cost_per_hour': None, 'fetched': None}
+        entries = {request: index.get(entry_key(*request), missing) for request in requests}
+        return prices_from_entries(entries, 'USD', instance_types, regions, operating_system)
+
+    with pricing_file_lock():
+        cache = load_from_file()
+        now = datetime.datetime.now()
+        expired = [
+            request for request in requests
+            if entry_key(*request) not in cache['entries'] or is_expired(cache['entries'][entry_key(*request)], now)
+        ]
+        if expired:
+            cache['entries'].update(get_pricing_from_api(expired))
+            save_to_file(cache)
+    entries = {request: cache['entries'][entry_key(*request)] for request in requests}
+    return prices_from_entries(entries, cache['currency'], instance_types, regions, operating_system)
+
+
+def prices_from_entries(entries: dict, currency: str, instance_types: list, regions: list, operating_system: str):
+    """
+    Convert cache entries keyed by (region, instance type, operating system) into the prices
+    returned by get_pricing().
+    """
+    dates = [entry['fetched'] for entry in entries.values() if entry['fetched']]
+    return {
+        'price_list_date': min(dates) if dates else None,
+        'currency': currency,
+        'instances': {
+            region: {
+                instance: {'cost_per_hour': entries[(region, instance, operating_system)]['cost_per_hour']}
+                for instance in instance_types
+            }
+            for region in regions
+        },
+    }
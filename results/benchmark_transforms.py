@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the columnar transforms in utilities.py against the former row-wise implementations.
+
+A synthetic results table (1M job rows by default) is generated, both implementations are run stage
+by stage and the wall-clock times are reported. The outputs of both implementations are compared on
+a sample of the table first, so that the speedup is only reported for equivalent results.
+
+Usage:
+    python ./results/benchmark_transforms.py [--rows 1000000] [--legacy-rows 50000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import utilities.utilities as utils
+
+INSTANCE_TYPES = {
+    # instance type: (GPUs, GPU name, GPU memory MiB, vCPUs, memory MiB)
+    'g4dn.xlarge': (1, 'T4', 16384, 4, 16384),
+    'g4dn.2xlarge': (1, 'T4', 16384, 8, 32768),
+    'g4dn.12xlarge': (4, 'T4', 16384, 48, 196608),
+    'g4dn.metal': (8, 'T4', 16384, 96, 393216),
+    'g5.xlarge': (1, 'A10G', 24576, 4, 16384),
+    'g5.2xlarge': (1, 'A10G', 24576, 8, 32768),
+    'g5.12xlarge': (4, 'A10G', 24576, 48, 196608),
+    'g5.48xlarge': (8, 'A10G', 24576, 192, 786432),
+    'p3.2xlarge': (1, 'V100', 16384, 8, 62464),
+    'p3.16xlarge': (8, 'V100', 16384, 64, 499712),
+    'p4d.24xlarge': (8, 'A100', 40960, 96, 1179648),
+}
+REGIONS = ['us-west-2', 'us-east-1', 'eu-central-1', 'eu-west-1', 'eu-west-2', 'me-south-1']
+TAGS = ['guppy, no modified bases', 'dorado v0.5.3, modified bases 5mCG', 'dorado v0.3.0, no modified bases']
+MODIFIED_BASES = ['no modified bases', '5mCG', '5mCG_5hmCG']
+
+
+def make_instance_specs():
+    return {
+        instance_type: {
+            'GpuInfo': {'Gpus': [{
+                'Count': gpus, 'Name': gpu_name, 'Manufacturer': 'NVIDIA', 'MemoryInfo': {'SizeInMiB': gpu_mem},
+            }]},
+            'VCpuInfo': {'DefaultVCpus': vcpus},
+            'MemoryInfo': {'SizeInMiB': mem},
+        }
+        for instance_type, (gpus, gpu_name, gpu_mem, vcpus, mem) in INSTANCE_TYPES.items()
+    }
+
+
+def make_pricing(rng: np.random.Generator):
+    return {
+        'price_list_date': '2024-01-01 00:00:00',
+        'currency': 'USD',
+        'instances': {
+            region: {
+                # one instance type is not available in one region, as in the real price list
+                instance_type: {'cost_per_hour': None if (region, instance_type) == ('me-south-1', 'p4d.24xlarge')
+                                else float(rng.uniform(0.5, 40))}
+                for instance_type in INSTANCE_TYPES
+            }
+            for region in REGIONS
+        },
+    }
+
+
+def make_results(rows: int, rng: np.random.Generator):
+    """
+    Generate a synthetic results table with the columns written by basecaller.sh.
+    """
+    instance_types = np.array(list(INSTANCE_TYPES))[rng.integers(0, len(INSTANCE_TYPES), rows)]
+    start = pd.Timestamp('2024-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 3600 * 24 * 90, rows), unit='s')
+    end = start + pd.to_timedelta(rng.integers(600, 3600 * 8, rows), unit='s')
+    # 8 jobs (one per GPU) per data set, all jobs of a data set run on the same EC2 instance
+    data_set_no = np.arange(rows) // 8
+    data_set_ids = pd.Series([f'ds-{i}' for i in data_set_no], dtype=object)
+    data_set_ids[rng.random(rows) < 0.05] = np.nan
+    basecaller_name = np.where(rng.random(rows) < 0.5, 'guppy', 'dorado')
+    return pd.DataFrame({
+        'job_id': [f'job-{i}' for i in range(rows)],
+        'tags': np.array(TAGS)[rng.integers(0, len(TAGS), rows)],
+        'status': np.where(rng.random(rows) < 0.95, 'succeeded', 'failed'),
+        'container_start_time': start.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'container_end_time': end.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'compute_environment': pd.Series(instance_types).str.replace('.', '-', regex=False),
+        'data_set_id': data_set_ids,
+        'ec2_instance_id': [f'i-{i:017x}' for i in data_set_no],
+        'ec2_instance_type': instance_types,
+        'samples_per_s': rng.uniform(0, 5e7, rows).astype(str),
+        'basecaller_name': basecaller_name,
+        'basecaller_version': np.where(basecaller_name == 'guppy', '6.5.7', '0.5.3'),
+        'modified_bases': np.array(MODIFIED_BASES)[rng.integers(0, len(MODIFIED_BASES), rows)],
+    })
+
+
+# ---------- former row-wise implementations, kept for comparison ----------
+
+def legacy_create_y_label(row: pd.Series, instance_specs: dict):
+    instance_type = row.ec2_instance_type
+    gpu_count = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['Count']
+    gpu_name = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['Name']
+    gpu_manufacturer = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['Manufacturer']
+    gpu_mem_in_gib = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['MemoryInfo']['SizeInMiB'] // 1024
+    vcpus = instance_specs[instance_type]['VCpuInfo']['DefaultVCpus']
+    memory_in_gib = instance_specs[instance_type]['MemoryInfo']['SizeInMiB'] // 1024
+    label_text = f'<b>{instance_type}  </b><br>' \
+                 f'<i>{gpu_count} x {gpu_name} {gpu_manufacturer} GPUs w/ {gpu_mem_in_gib} GiB </i><br>' \
+                 f'<i>{vcpus} vCPUs, {memory_in_gib} GiB RAM </i>'
+    return label_text
+
+
+def legacy_create_basecaller_label(row: pd.Series):
+    if 'basecaller' not in row.keys():
+        basecaller = f'{row.basecaller_name} v{row.basecaller_version}'
+    else:
+        basecaller = row.basecaller
+    return basecaller
+
+
+def legacy_create_data_set_id(row: pd.Series):
+    data_set_id = row.data_set_id
+    if row.isna().data_set_id:
+        data_set_id = row.ec2_instance_id
+    return data_set_id
+
+
+def legacy_add_basecaller_label(df: pd.DataFrame):
+    df[['basecaller']] = pd.DataFrame(
+        df.apply(lambda row: legacy_create_basecaller_label(row), axis=1).tolist(), index=df.index)
+    return df
+
+
+def legacy_add_data_set_id(df: pd.DataFrame):
+    df[['data_set_id']] = pd.DataFrame(
+        df.apply(lambda row: legacy_create_data_set_id(row), axis=1).tolist(), index=df.index)
+    return df
+
+
+def legacy_add_display_label(df: pd.DataFrame, instance_specs: dict):
+    df[['display_label']] = pd.DataFrame(
+        df.apply(lambda row: legacy_create_y_label(row, instance_specs), axis=1).tolist(), index=df.index)
+    return df
+
+
+def legacy_add_gpu_count(df: pd.DataFrame, instance_specs: dict):
+    df.loc[:, 'num_gpus'] = df.apply(
+        lambda row: instance_specs[row.ec2_instance_type]['GpuInfo']['Gpus'][0]['Count'],
+        axis=1
+    )
+    return df
+
+
+def legacy_calculate_runtimes(df: pd.DataFrame):
+    df['container_start_time'] = pd.to_datetime(df['container_start_time'])
+    df['container_end_time'] = pd.to_datetime(df['container_end_time'])
+    df['container_run_time'] = df['container_end_time'] - df['container_start_time']
+    df['container_run_time_h'] = df['container_run_time'].apply(lambda delta: delta.total_seconds() / 3600)
+    return df
+
+
+def legacy_add_run_times(df: pd.DataFrame):
+    num_bases = 18330576791
+    num_gigabases = num_bases / 1000000000
+    num_gigabases_whg_GRCh38_p14 = 3298912062 / 1000000000
+    num_gigabases_whg_30x_coverage = num_gigabases_whg_GRCh38_p14 * 30
+    temp1 = df.copy()
+    temp2 = df.copy()
+    temp1[['runtime_type', 'runtime_h']] = df.apply(
+        lambda row: ('per gigabase', row.container_run_time_h / num_gigabases),
+        axis=1, result_type='expand'
+    )
+    temp2[['runtime_type', 'runtime_h']] = df.apply(
+        lambda row: ('per WHG 30x', row.container_run_time_h * (num_gigabases_whg_30x_coverage / num_gigabases)),
+        axis=1, result_type='expand'
+    )
+    return pd.concat([temp1, temp2], ignore_index=True)
+
+
+def legacy_add_cost(df: pd.DataFrame, aws_pricing: dict):
+    cost = pd.DataFrame()
+    for region in aws_pricing['instances'].keys():
+        temp = df.copy()
+        temp[['cost_region', 'cost_per_hour']] = df.apply(
+            lambda row: (
+                region,
+                aws_pricing['instances'][region][row['ec2_instance_type']]['cost_per_hour']
+                if aws_pricing['instances'][region][row['ec2_instance_type']]['cost_per_hour'] else None
+            ), axis=1, result_type='expand'
+        )
+        temp['cost_per_gigabase'] = temp[temp['runtime_type'] == 'per gigabase'].apply(
+            lambda row: (
+                row['cost_per_hour'] * row['runtime_h'] if row['cost_per_hour'] else None
+            ), axis=1, result_type='expand'
+        )
+        temp['cost_per_whg_30x'] = temp[temp['runtime_type'] == 'per WHG 30x'].apply(
+            lambda row: (
+                row['cost_per_hour'] * row['runtime_h'] if row['cost_per_hour'] else None
+            ), axis=1, result_type='expand'
+        )
+        cost = pd.concat([cost, temp], ignore_index=True)
+    return cost
+
+
+# ---------------------------------------------------------------------------
+
+def make_stages(instance_specs: dict, instance_cost: dict):
+    """
+    Stages of the transform chain in the order used by results.py, as (name, legacy, columnar) tuples.
+    """
+    return [
+        ('add_basecaller_label', legacy_add_basecaller_label, utils.add_basecaller_label),
+        ('add_data_set_id', legacy_add_data_set_id, utils.add_data_set_id),
+        ('add_gpu_count',
+         lambda df: legacy_add_gpu_count(df, instance_specs),
+         lambda df: utils.add_gpu_count(df, instance_specs)),
+        ('calculate_runtimes', legacy_calculate_runtimes, utils.calculate_runtimes),
+        # unchanged, included to reduce the table to one row per data set as in results.py
+        ('aggregate_samples_per_s_runtime', utils.aggregate_samples_per_s_runtime,
+         utils.aggregate_samples_per_s_runtime),
+        ('add_display_label',
+         lambda df: legacy_add_display_label(df, instance_specs),
+         lambda df: utils.add_display_label(df, instance_specs)),
+        ('add_run_times', legacy_add_run_times, utils.add_run_times),
+        ('add_cost',
+         lambda df: legacy_add_cost(df, instance_cost),
+         lambda df: utils.add_cost(df, instance_cost)),
+    ]
+
+
+def run_chain(df: pd.DataFrame, stages: list, implementation: int):
+    """
+    Run all stages with the given implementation (1 = legacy, 2 = columnar) and time each stage.
+    """
+    timings = {}
+    df = utils.transform_samples_per_s(df)
+    for stage in stages:
+        start = time.perf_counter()
+        df = stage[implementation](df)
+        timings[stage[0]] = time.perf_counter() - start
+    return df, timings
+
+
+def check_equivalence(results: pd.DataFrame, stages: list):
+    legacy, _ = run_chain(results.copy(), stages, 1)
+    columnar, _ = run_chain(results.copy(), stages, 2)
+    pd.testing.assert_frame_equal(legacy, columnar[legacy.columns], check_dtype=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='number of synthetic job rows')
+    parser.add_argument('--legacy-rows', type=int, default=None,
+                        help='run the legacy implementation on fewer rows and extrapolate linearly')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    instance_specs = make_instance_specs()
+    instance_cost = make_pricing(rng)
+    stages = make_stages(instance_specs, instance_cost)
+
+    print('Checking equivalence of legacy and columnar transforms on 10,000 rows ...')
+    check_equivalence(make_results(10000, rng), stages)
+    print('OK: both implementations produce the same results.')
+
+    print(f'Generating synthetic results table with {args.rows:,} rows ...')
+    results = make_results(args.rows, rng)
+    legacy_rows = min(args.legacy_rows or args.rows, args.rows)
+    scale = args.rows / legacy_rows
+
+    print(f'Running columnar transforms on {args.rows:,} rows ...')
+    _, columnar = run_chain(results.copy(), stages, 2)
+    print(f'Running legacy transforms on {legacy_rows:,} rows ...')
+    _, legacy = run_chain(results.iloc[:legacy_rows].copy(), stages, 1)
+
+    print()
+    print(f'{"stage":<34}{"legacy [s]":>14}{"columnar [s]":>14}{"speedup":>10}')
+    for stage in columnar:
+        legacy_s = legacy[stage] * scale
+        print(f'{stage:<34}{legacy_s:>14.2f}{columnar[stage]:>14.2f}{legacy_s / columnar[stage]:>9.0f}x')
+    legacy_total = sum(legacy.values()) * scale
+    columnar_total = sum(columnar.values())
+    print(f'{"total":<34}{legacy_total:>14.2f}{columnar_total:>14.2f}{legacy_total / columnar_total:>9.0f}x')
+    if scale != 1:
+        print(f'Legacy timings extrapolated linearly from {legacy_rows:,} rows.')
+
+
+if __name__ == '__main__':
+    main()
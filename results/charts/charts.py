@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Render the result charts from chart specifications.
+
+A chart specification names the chart type, the output file and the filters selecting the data
+shown in the chart. The results are filtered once per set of filter columns, the charts are
+rendered in a process pool and each worker process keeps its headless renderer (kaleido) running
+across charts. A chart is only rendered again if its input data, its specification or this module
+changed since it was last written.
+
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+CHART_CACHE_FILE_NAME = '.chart_cache.json'
+CHART_VARIANTS_PATH = 'charts'
+CHART_COLUMNS = ['display_label', 'basecaller', 'modified_bases', 'samples_per_s', 'runtime_h']
+MODIFIED_BASES = ['no modified bases', '5mCG', '5mCG_5hmCG']
+MODIFIED_BASES_LABELS = {
+    # replaced in this order, '5mCG_5hmCG' must be replaced before '5mCG'
+    'modified_bases=5mCG_5hmCG': 'with 5mCG/5hmCG calling',
+    'modified_bases=5mCG': 'with 5mCG calling',
+    'modified_bases=no modified bases': 'without modification calling',
+}
+
+CHART_TYPES = {
+    'samples_per_s': {
+        'title': '<b>Basecaller performance, samples/s (the higher the better)</b>',
+        'x': 'samples_per_s',
+        'x_label': 'samples/s',
+        'ascending': False,
+        'text_auto': '.2s',
+    },
+    'runtime_whg_30x': {
+        'title': '<b>Basecaller performance, runtime [h] for whole human genome (WHG) at 30x coverage '
+                 '(the lower the better)</b>',
+        'x': 'runtime_h',
+        'x_label': 'runtime [h]',
+        'ascending': True,
+        'text_auto': '.1f',
+    },
+}
+
+PUBLICATION_CHARTS = [
+    {
+        'chart_type': 'samples_per_s',
+        'file_name': 'ONT_basecaller_performance_samples_s.png',
+        'filters': {'cost_region': 'us-west-2'},
+    },
+    {
+        'chart_type': 'runtime_whg_30x',
+        'file_name': 'ONT_basecaller_performance_runtime_whg_30x.png',
+        'filters': {'cost_region': 'us-west-2'},
+    },
+]
+
+
+def chart_variants(results: pd.DataFrame, path: str = CHART_VARIANTS_PATH):
+    """
+    Create chart specifications for each chart type per region, per modified bases mode and
+    per basecaller version found in the results.
+    """
+    specs = []
+    for chart_type in CHART_TYPES:
+        for region in sorted(results['cost_region'].unique()):
+            specs.append({
+                'chart_type': chart_type,
+                'file_name': os.path.join(path, f'{chart_type}_{region}.png'),
+                'filters': {'cost_region': region},
+            })
+        for modified_bases in sorted(results['modified_bases'].unique()):
+            specs.append({
+                'chart_type': chart_type,
+                'file_name': os.path.join(path, f'{chart_type}_{modified_bases.replace(" ", "_")}.png'),
+                'filters': {'cost_region': 'us-west-2', 'modified_bases': modified_bases},
+            })
+        for basecaller in sorted(results['basecaller'].unique()):
+            specs.append({
+                'chart_type': chart_type,
+                'file_name': os.path.join(path, f'{chart_type}_{basecaller.replace(" ", "_")}.png'),
+                'filters': {'cost_region': 'us-west-2', 'basecaller': basecaller},
+            })
+    return specs
+
+
+def render_charts(results: pd.DataFrame, specs: list, max_workers: int = None,
+                  cache_file: str = CHART_CACHE_FILE_NAME):
+    """
+    Render all charts whose input data changed since they were last rendered.
+
+    Args:
+        results: processed results with one row per runtime type and cost region
+        specs: chart specifications
+        max_workers: number of renderer processes, defaults to the number of CPUs
+        cache_file: file with the input data hashes of the rendered charts
+
+    Returns:
+        rendered: file names of the charts rendered
+
+    """
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+
+    # Filter the results once per set of filter columns.
+    results = results[results['runtime_type'] == 'per WHG 30x']
+    groups = {}
+    for filter_columns in {tuple(sorted(spec['filters'])) for spec in specs}:
+        groups[filter_columns] = {
+            key if isinstance(key, tuple) else (key,): group[CHART_COLUMNS]
+            for key, group in results.groupby(list(filter_columns))
+        }
+
+    pending = []
+    for spec in specs:
+        filter_columns = tuple(sorted(spec['filters']))
+        data = groups[filter_columns].get(tuple(spec['filters'][column] for column in filter_columns))
+        if data is None:
+            print(f'No data for chart {spec["file_name"]}, skipping.')
+            continue
+        digest = data_hash(data, spec)
+        if cache.get(spec['file_name']) == digest and os.path.exists(spec['file_name']):
+            continue
+        pending.append((spec, data, digest))
+
+    if pending:
+        print(f'Rendering {len(pending)} of {len(specs)} charts ...')
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=start_renderer) as executor:
+            futures = [(executor.submit(render_chart, spec, data), spec, digest) for spec, data, digest in pending]
+            for future, spec, digest in futures:
+                future.result()
+                cache[spec['file_name']] = digest
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f, indent=4)
+    else:
+        print('All charts are up to date.')
+    return [spec['file_name'] for spec, _, _ in pending]
+
+
+def data_hash(data: pd.DataFrame, spec: dict):
+    """
+    Hash of the chart input data, the chart specification and the chart code.
+    """
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    digest.update(json.dumps(spec, sort_keys=True).encode('utf-8'))
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def start_renderer():
+    """
+    Start the renderer of the worker process. Kaleido keeps the renderer running for all
+    charts rendered by the process afterwards.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    pio.to_image(go.Figure(), format='png')
+
+
+def make_figure(spec: dict, data: pd.DataFrame):
+    import plotly.express as px
+
+    chart_type = CHART_TYPES[spec['chart_type']]
+    instance_order = data.sort_values([chart_type['x']], ascending=chart_type['ascending'])['display_label'].unique()
+    fig = px.bar(
+        data,
+        title=chart_type['title'],
+        x=chart_type['x'], y='display_label', color='basecaller', barmode='group', facet_col='modified_bases',
+        facet_col_spacing=0.05,
+        labels={
+            'display_label': 'instance type',
+            chart_type['x']: chart_type['x_label'],
+        },
+        category_orders={
+            'display_label': instance_order,
+            'modified_bases': MODIFIED_BASES,
+        },
+        text_auto=chart_type['text_auto'],
+        orientation='h',
+        height=200 + len(instance_order) * 90, width=1200,
+    )
+    fig.update_traces(textposition='outside', cliponaxis=False)
+    fig.update_layout(legend_traceorder='reversed')
+    for text, label in MODIFIED_BASES_LABELS.items():
+        fig.for_each_annotation(lambda a: a.update(text=a.text.replace(text, label)))
+    return fig
+
+
+def render_chart(spec: dict, data: pd.DataFrame):
+    fig = make_figure(spec, data)
+    if os.path.dirname(spec['file_name']):
+        os.makedirs(os.path.dirname(spec['file_name']), exist_ok=True)
+    print(f'Writing chart to file: {spec["file_name"]}')
+    fig.write_image(spec['file_name'], scale=4)
+    return spec['file_name']
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Incremental synchronisation of the DynamoDB results table into the local results store.
+
+The table is read with a parallel, segmented Scan. After the first synchronisation only items
+that finished after the high-water mark on 'container_end_time' (minus a look-back window for
+late writers) and items of jobs that have not finished yet are transferred. Items that were
+already merged and have not changed since, compared by a hash of the whole item, are skipped,
+so only new or changed items are written to the results store.
+
+"""
+
+import datetime
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import boto3
+import pandas as pd
+from boto3.dynamodb.types import TypeDeserializer
+
+import results_store.results_store as results_store
+
+client_dynamodb = boto3.client('dynamodb')
+
+SYNC_TOTAL_SEGMENTS = 8
+SYNC_MAX_WORKERS = 8
+# Jobs write their end time before the item is updated, allow for items written late.
+SYNC_LOOKBACK = datetime.timedelta(hours=1)
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00'  # format of 'container_end_time' written by job_agent.py
+
+
+def sync(table_name: str, path: str = results_store.RESULTS_STORE_PATH, full: bool = False,
+         total_segments: int = SYNC_TOTAL_SEGMENTS, max_workers: int = SYNC_MAX_WORKERS):
+    """
+    Merge new and changed items of the DynamoDB table into the results store.
+
+    Args:
+        table_name: name of the DynamoDB results table
+        path: path to the results store
+        full: if True, ignore the synchronisation state and scan all items
+        total_segments: number of segments of the parallel scan
+        max_workers: number of threads scanning the segments
+
+    Returns:
+        df: new or changed items merged into the store
+
+    """
+    metadata = results_store.load_metadata(path)
+    state = metadata.get('sync', {}).get(table_name, {})
+    high_water_mark = None if full else state.get('high_water_mark')
+    seen = {} if full else state.get('seen', {})
+    since = None
+    if high_water_mark:
+        since = (datetime.datetime.strptime(high_water_mark, TIME_FORMAT) - SYNC_LOOKBACK).strftime(TIME_FORMAT)
+
+    items = scan_table(table_name, since=since, total_segments=total_segments, max_workers=max_workers)
+    changed = [item for item in items if not is_unchanged(item, seen)]
+    print(f'DynamoDB table {table_name}: {len(items)} items scanned, {len(changed)} new or changed.')
+    df = pd.DataFrame(changed)
+    results_store.append(df, path)
+
+    end_times = [item['container_end_time'] for item in items if 'container_end_time' in item]
+    if end_times:
+        high_water_mark = max([high_water_mark or ''] + end_times)
+    # Only items within the look-back window are scanned again, older ones can be forgotten.
+    seen.update({
+        item['job_id']: [item['container_end_time'], item_hash(item)] for item in items if 'container_end_time' in item
+    })
+    if high_water_mark:
+        oldest = (datetime.datetime.strptime(high_water_mark, TIME_FORMAT) - SYNC_LOOKBACK).strftime(TIME_FORMAT)
+        seen = {job_id: entry for job_id, entry in seen.items() if entry[0] >= oldest}
+    metadata.setdefault('sync', {})[table_name] = {'high_water_mark': high_water_mark, 'seen': seen}
+    results_store.save_metadata(metadata, path)
+    return df
+
+
+def is_unchanged(item: dict, seen: dict):
+    """
+    Items of finished jobs are final, unless the job was retried or the item was updated after
+    the job finished.
+    """
+    return 'container_end_time' in item and \
+        seen.get(item['job_id']) == [item['container_end_time'], item_hash(item)]
+
+
+def item_hash(item: dict):
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def scan_table(table_name: str, since: str = None,
+               total_segments: int = SYNC_TOTAL_SEGMENTS, max_workers: int = SYNC_MAX_WORKERS):
+    """
+    Scan the table with a parallel, segmented Scan.
+
+    Args:
+        table_name: name of the DynamoDB results table
+        since: only return items of jobs that finished at or after this time, or have not finished yet
+        total_segments: number of segments of the parallel scan
+        max_workers: number of threads scanning the segments
+
+    Returns:
+        items: list of deserialized items
+
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        segments = executor.map(
+            lambda segment: scan_segment(table_name, segment, total_segments, since),
+            range(total_segments)
+        )
+        return [item for segment in segments for item in segment]
+
+
+def scan_segment(table_name: str, segment: int, total_segments: int, since: str = None):
+    kwargs = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+    }
+    if since:
+        kwargs['FilterExpression'] = 'attribute_not_exists(container_end_time) OR container_end_time >= :since'
+        kwargs['ExpressionAttributeValues'] = {':since': {'S': since}}
+    items = []
+    for page in client_dynamodb.get_paginator('scan').paginate(**kwargs):
+        items.extend(deserialize(item) for item in page['Items'])
+    return items
+
+
+def deserialize(item: dict):
+    """
+    Convert a DynamoDB item into a dict of Python values. Numbers are returned as int or float.
+    """
+    deserializer = TypeDeserializer()
+    values = {key: deserializer.deserialize(value) for key, value in item.items()}
+    for key, value in values.items():
+        if isinstance(value, Decimal):
+            values[key] = int(value) if value == value.to_integral_value() else float(value)
+    return values
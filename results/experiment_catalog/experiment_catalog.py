@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Catalog of the benchmark experiments included in the reports.
+
+Each experiment is identified by the tags the AWS Batch jobs were submitted with (see
+create_jobs/create_jobs.py) and described by structured attributes. To add the runs of a new
+basecaller release to the reports, add its experiments here.
+
+Jobs generated from a sweep specification (see create_jobs/basecaller_batch/sweep.py) carry
+their settings in the tags, e.g. 'basecaller=dorado; version=0.5.3; ...; batch_size=auto'.
+These experiments are added to the catalog from their tags. Sweep experiments of the same
+basecaller, version and modified bases that differ in their parameters are told apart by their
+'settings', e.g. 'batch_size=256, threads=8', which the reports add to the basecaller label.
+
+"""
+
+import pandas as pd
+
+MODIFIED_BASES = ['no modified bases', '5mCG', '5mCG_5hmCG']
+# Tags of sweep experiments start with the basecaller.
+SWEEP_TAGS_PREFIX = 'basecaller='
+SWEEP_PARAMETERS = ['model', 'num_callers', 'gpu_runners_per_device', 'chunks_per_runner', 'batch_size', 'threads']
+
+EXPERIMENTS = [
+    # ---------- guppy ----------
+    {'tags': 'guppy, no modified bases', 'basecaller': 'guppy', 'version': None,
+     'modified_bases': 'no modified bases'},
+    {'tags': 'guppy, modified bases 5mCG', 'basecaller': 'guppy', 'version': None,
+     'modified_bases': '5mCG'},
+    {'tags': 'guppy, modified bases 5mCG & 5hmCG', 'basecaller': 'guppy', 'version': None,
+     'modified_bases': '5mCG_5hmCG'},
+    # ---------- dorado ----------
+    {'tags': 'dorado, no modified bases', 'basecaller': 'dorado', 'version': None,
+     'modified_bases': 'no modified bases'},
+    {'tags': 'dorado, modified bases 5mCG', 'basecaller': 'dorado', 'version': None,
+     'modified_bases': '5mCG'},
+    {'tags': 'dorado, modified bases 5mCG & 5hmCG', 'basecaller': 'dorado', 'version': None,
+     'modified_bases': '5mCG_5hmCG'},
+    {'tags': 'dorado v0.3.0, no modified bases', 'basecaller': 'dorado', 'version': '0.3.0',
+     'modified_bases': 'no modified bases'},
+    {'tags': 'dorado v0.3.0, modified bases 5mCG', 'basecaller': 'dorado', 'version': '0.3.0',
+     'modified_bases': '5mCG'},
+    {'tags': 'dorado v0.3.0, modified bases 5mCG & 5hmCG', 'basecaller': 'dorado', 'version': '0.3.0',
+     'modified_bases': '5mCG_5hmCG'},
+    {'tags': 'dorado v0.5.3, no modified bases', 'basecaller': 'dorado', 'version': '0.5.3',
+     'modified_bases': 'no modified bases'},
+    {'tags': 'dorado v0.5.3, modified bases 5mCG', 'basecaller': 'dorado', 'version': '0.5.3',
+     'modified_bases': '5mCG'},
+    {'tags': 'dorado v0.5.3, modified bases 5mCG & 5hmCG', 'basecaller': 'dorado', 'version': '0.5.3',
+     'modified_bases': '5mCG_5hmCG'},
+]
+
+
+def get_catalog(tags: list = None):
+    """
+    Get the experiment catalog as dataframe, indexed by tags in catalog order. Sweep experiments
+    among the given tags are appended, sorted by tags.
+    """
+    known = set(experiment['tags'] for experiment in EXPERIMENTS)
+    sweeps = [
+        dict(parse_tags(sweep_tags), tags=sweep_tags)
+        for sweep_tags in sorted(set(tags if tags is not None else []) - known)
+        if parse_tags(sweep_tags)
+    ]
+    catalog = pd.DataFrame(EXPERIMENTS + sweeps, columns=list(EXPERIMENTS[0].keys()) + SWEEP_PARAMETERS) \
+        .set_index('tags')
+    catalog['settings'] = sweep_settings(catalog)
+    return catalog
+
+
+def sweep_settings(catalog: pd.DataFrame):
+    """
+    Get the sweep parameters that differ between the experiments of the same basecaller, version
+    and modified bases, as a string per experiment, e.g. 'batch_size=256, threads=8'. Empty for
+    experiments without such variations.
+    """
+    settings = pd.Series('', index=catalog.index, dtype=object)
+    sweeps = catalog[catalog.index.str.startswith(SWEEP_TAGS_PREFIX)]
+    groups = sweeps.groupby([sweeps['basecaller'], sweeps['version'].fillna(''), sweeps['modified_bases']], sort=False)
+    for _, group in groups:
+        varying = [parameter for parameter in SWEEP_PARAMETERS if group[parameter].nunique(dropna=False) > 1]
+        for tags, values in group[varying].iterrows():
+            settings[tags] = ', '.join(f'{parameter}={values[parameter]}' for parameter in varying)
+    return settings
+
+
+def parse_tags(tags: str):
+    """
+    Parse the tags of a sweep experiment into its settings.
+
+    Returns:
+        settings: dict with the basecaller, version, modified bases and the sweep parameters,
+            None if the tags are not the tags of a sweep experiment
+
+    """
+    if not isinstance(tags, str) or not tags.startswith(SWEEP_TAGS_PREFIX):
+        return None
+    settings = {}
+    for item in tags.split('; '):
+        name, separator, value = item.partition('=')
+        if not separator:
+            return None
+        settings[name] = value
+    if settings.get('modified_bases') not in MODIFIED_BASES:
+        return None
+    return settings
+
+
+def report_tags():
+    """
+    Get the tags of all experiments in the catalog.
+    """
+    return [experiment['tags'] for experiment in EXPERIMENTS]
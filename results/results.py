@@ -3,241 +3,191 @@
 
 """
 Generate result files (diagrams, Excel cost tables, etc.).
+
+Usage:
+    python ./results/results.py [all|charts|cost-tables|throughput|sync] [--full-sync]
 """
 
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-import plotly.express as px
 
 import aws_pricing.aws_pricing as aws_pricing
+import charts.charts as charts
+import experiment_catalog.experiment_catalog as experiment_catalog
+import run_history.run_history as run_history
+import spot_pricing.spot_pricing as spot_pricing
+import stage_cache.stage_cache as stage_cache
 import utilities.utilities as utils
 
-print('Loading instance specifications ...')
-instance_specs = utils.get_instance_specs('/ONT-performance-benchmark/aws-batch-instance-types')
-print('Getting pricing for EC2 instance types ...')
-instance_cost = aws_pricing.get_pricing(list(instance_specs.keys()))
+INSTANCE_SPECS_PARAMETER = '/ONT-performance-benchmark/aws-batch-instance-types'
+RESULTS_TABLE_PARAMETER = '/ONT-performance-benchmark/reports-table-name'
+# Columns of the results table used to generate the reports.
+REPORT_COLUMNS = [
+    'job_id', 'tags', 'status', 'data_set_id', 'compute_environment', 'container_start_time', 'container_end_time',
+    'ec2_instance_id', 'ec2_instance_type', 'ec2_availability_zone', 'basecaller', 'basecaller_name',
+    'basecaller_version', 'samples_per_s', 'parameters', 'output_reads', 'output_bases', 'mean_qscore', 'read_n50',
+    'bases_per_s', 'throughput_series',
+]
+THROUGHPUT_SERIES_FILE_NAME = 'ONT_basecaller_throughput_series.csv'
 
 
 def main():
-    print('Loading data from DynamoDB ...')
-    results = utils.get_data('/ONT-performance-benchmark/reports-table-name')
+    parser = argparse.ArgumentParser(description='Generate result files (diagrams, Excel cost tables, etc.).')
+    parser.add_argument(
+        'command', nargs='?', default='all', choices=['all', 'charts', 'cost-tables', 'throughput', 'sync'],
+        help='result files to generate, or only sync the results store with the DynamoDB table (default: all)'
+    )
+    parser.add_argument('--full-sync', action='store_true',
+                        help='scan the whole DynamoDB table instead of only the items changed since the last run')
+    parser.add_argument('--offer-files', nargs='+', metavar='FILE',
+                        help='take the prices from regional EC2 bulk offer files (CSV, optionally gzipped) '
+                             'instead of the AWS Pricing API')
+    parser.add_argument('--spot-history', metavar='FILE',
+                        help='take the spot prices from the output of "aws ec2 describe-spot-price-history" '
+                             'instead of the EC2 API')
+    args = parser.parse_args()
+
+    if args.command == 'sync':
+        print('Syncing results from DynamoDB ...')
+        utils.sync_data(RESULTS_TABLE_PARAMETER, full_sync=args.full_sync)
+        return
+
+    # Instance specifications, pricing and test data statistics are loaded while the results are synced.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        future_specs_cost = executor.submit(load_instance_specs_and_cost, args.offer_files)
+        future_test_data_stats = executor.submit(utils.get_test_data_stats)
+        print('Loading data from DynamoDB ...')
+        future_results = executor.submit(
+            utils.get_data, RESULTS_TABLE_PARAMETER, columns=REPORT_COLUMNS,
+            tags=experiment_catalog.report_tags(), full_sync=args.full_sync,
+            tag_prefixes=[experiment_catalog.SWEEP_TAGS_PREFIX]
+        )
+        results = future_results.result()
+        instance_specs, instance_cost = future_specs_cost.result()
+        test_data_stats = future_test_data_stats.result()
     if results.empty:
         print('No results found. Make sure to run the benchmark jobs first. Exiting ...')
         return
     print('Filtering results ...')
-    results = filter_results(results)
+    results = filter_results(results, run_history.RunHistory())
     if results.empty:
         print('No results after filtering. Make sure to filter for the tags provided '
               'during creating the jobs. Exiting ...')
         return
-    print('Processing results ...')
-    results = utils.transform_samples_per_s(results)
-    results = utils.add_basecaller_label(results)
-    results = utils.add_data_set_id(results)
-    results = utils.add_gpu_count(results, instance_specs)
-    results = utils.calculate_runtimes(results)
-    utils.check_consistency(results, instance_specs)
-    results = utils.aggregate_samples_per_s_runtime(results)
-    results = utils.add_display_label(results, instance_specs)
-    results = utils.add_run_times(results)
-    results = utils.add_cost(results, instance_cost)
+    if args.command in ['all', 'throughput']:
+        print('Generating throughput time series ...')
+        generate_throughput_series(results)
+    # The time series are only needed for the throughput report, not in the processing stages.
+    results = results.drop(columns=['throughput_series'], errors='ignore')
+    results = process_results(results, instance_specs, instance_cost, args.spot_history, test_data_stats)
 
     # select all data
     results_publication = results.copy()
 
-    print('Generating chart "Basecaller performance in samples/s" ...')
-    generate_chart_performance_samples_per_sec(results_publication)
-    print('Generating chart "Basecaller runtimes for whole human genome (WHG) at 30x coverage" ...')
-    generate_chart_runtime_whg_30x(results_publication)
-    print('Generating cost tables ...')
-    generate_cost_tables(results_publication)
-
-
-def filter_results(df: pd.DataFrame):
-    """
+    if args.command == 'throughput':
+        return
+    if args.command in ['all', 'charts']:
+        print('Generating charts ...')
+        charts.render_charts(results_publication,
+                             charts.PUBLICATION_CHARTS + charts.chart_variants(results_publication))
+    if args.command in ['all', 'cost-tables']:
+        print('Generating cost tables ...')
+        generate_cost_tables(results_publication, instance_specs, instance_cost)
 
-    Filter and collate all results of interest.
 
-    In this function we collate all results from various benchmark runs. Failed and
-    duplicate data is cleaned from the data set.
+def load_instance_specs_and_cost(offer_files: list = None):
+    print('Loading instance specifications ...')
+    instance_specs = utils.get_instance_specs(INSTANCE_SPECS_PARAMETER)
+    print('Getting pricing for EC2 instance types ...')
+    instance_cost = aws_pricing.get_pricing(list(instance_specs.keys()), offer_files=offer_files)
+    return instance_specs, instance_cost
 
-    """
-    results = pd.DataFrame()
-
-    # ---------- guppy ----------
-
-    temp = get_latest_run(df[(df['tags'] == 'guppy, no modified bases') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = 'no modified bases'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'guppy, modified bases 5mCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'guppy, modified bases 5mCG & 5hmCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG_5hmCG'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    # ---------- dorado ----------
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado, no modified bases') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = 'no modified bases'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado, modified bases 5mCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado, modified bases 5mCG & 5hmCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG_5hmCG'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado v0.3.0, no modified bases') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = 'no modified bases'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado v0.3.0, modified bases 5mCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado v0.3.0, modified bases 5mCG & 5hmCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG_5hmCG'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado v0.5.3, no modified bases') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = 'no modified bases'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado v0.5.3, modified bases 5mCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG'
-    results = pd.concat([results, temp], ignore_index=True)
-
-    temp = get_latest_run(df[(df['tags'] == 'dorado v0.5.3, modified bases 5mCG & 5hmCG') & (df['status'] == 'succeeded')].copy())
-    if not temp.empty:
-        temp.loc[:, 'modified_bases'] = '5mCG_5hmCG'
-    results = pd.concat([results, temp], ignore_index=True)
 
+def process_results(results: pd.DataFrame, instance_specs: dict, instance_cost: dict, spot_history_file: str = None,
+                    test_data_stats: dict = None):
+    print('Processing results ...')
+    test_data_stats = test_data_stats or {'shards': {}, 'bases_per_sample': None}
+    cache = stage_cache.StageCache()
+    # Row-wise stages run per experiment, only experiments with new results are processed again.
+    results = cache.run(results, [
+        (utils.transform_samples_per_s,),
+        (utils.transform_output_stats,),
+        (utils.add_basecaller_label,),
+        (utils.add_data_set_id,),
+        (utils.add_gpu_count, instance_specs),
+        (utils.calculate_runtimes,),
+        (utils.add_input_stats, test_data_stats),
+    ], partition_by='tags')
+    utils.check_consistency(results, instance_specs)
+    print('Getting spot price history ...')
+    spot_prices = spot_pricing.get_spot_prices(results, history_file=spot_history_file)
+    results = cache.run(results, [
+        (spot_pricing.add_spot_cost_per_hour, spot_prices),
+        (utils.aggregate_samples_per_s_runtime,),
+        (utils.add_display_label, instance_specs),
+        (utils.add_run_times, test_data_stats['bases_per_sample']),
+        (utils.add_cost, instance_cost),
+    ], input_key=cache.last_key)
+    print(f'Processing stages: {cache.hits} loaded from cache, {cache.misses} run.')
     return results
 
 
-def get_latest_run(df: pd.DataFrame):
+def filter_results(df: pd.DataFrame, history: run_history.RunHistory = None):
     """
 
-    Filter out multiple runs for each instance type. Only keep the run with the latest 'data_set_id'.
+    Filter and collate all results of interest.
+
+    In this function we collate all results from various benchmark runs. Failed and
+    duplicate data is cleaned from the data set. The experiments of interest and their
+    attributes are defined in the experiment catalog, sweep experiments differing in their
+    parameters are told apart by their settings. Of multiple runs of an experiment
+    on the same instance type, only the latest run recorded in the run history is kept.
 
     Args:
-        df: pandas dataframe already filtered by 'tag' column.
+        df: results as loaded from the results store
+        history: run history index, built from df if None
 
     Returns:
         results: filtered dataframe
 
     """
-    last_runs = pd.merge(
-        df.groupby('compute_environment').container_end_time.max().to_frame().reset_index(),
-        df,
-        left_on=['compute_environment', 'container_end_time'], right_on=['compute_environment', 'container_end_time'],
-        how='left'
-    )['data_set_id'].to_list()
-    results = df[df['data_set_id'].isin(last_runs)]
+    df = df[df['status'] == 'succeeded'].copy()
+    catalog = experiment_catalog.get_catalog(df['tags'].dropna().unique())
+    # Join with the catalog on the tags. Tags not in the catalog become NaN and are dropped.
+    df['tags'] = pd.Categorical(df['tags'], categories=catalog.index)
+    df = df[df['tags'].notna()]
+    df['modified_bases'] = df['tags'].map(catalog['modified_bases']).astype(object)
+    df['settings'] = df['tags'].map(catalog['settings']).astype(object)
+    if history is None:
+        history = run_history.RunHistory.from_results(df.astype({'tags': object}))
+    last_runs = history.latest_runs(list(catalog.index))[['tags', 'data_set_id']].drop_duplicates()
+    last_runs['tags'] = pd.Categorical(last_runs['tags'], categories=catalog.index)
+    results = df.merge(last_runs, on=['tags', 'data_set_id'], how='inner')
+    # keep the order of the experiments in the catalog
+    results = results.sort_values('tags', kind='stable').reset_index(drop=True)
+    results['tags'] = results['tags'].astype(object)
     return results
 
 
-def generate_chart_performance_samples_per_sec(results: pd.DataFrame):
-    instance_order = results[
-        (results['runtime_type'] == 'per WHG 30x') &
-        (results['cost_region'] == 'us-west-2')
-        ].sort_values(['samples_per_s'], ascending=False)['display_label'].unique()
-    fig = px.bar(
-        results[
-            (results['runtime_type'] == 'per WHG 30x') &
-            (results['cost_region'] == 'us-west-2')
-            ],
-        title='<b>Basecaller performance, samples/s (the higher the better)</b>',
-        x='samples_per_s', y='display_label', color='basecaller', barmode='group', facet_col='modified_bases',
-        facet_col_spacing=0.05,
-        labels={
-            'display_label': 'instance type',
-            'samples_per_s': 'samples/s',
-        },
-        category_orders={
-            'display_label': instance_order,
-            'modified_bases': ['no modified bases', '5mCG', '5mCG_5hmCG'],
-        },
-        text_auto='.2s',
-        orientation='h',
-        height=200 + len(instance_order) * 90, width=1200,
-    )
-    fig.update_traces(textposition='outside', cliponaxis=False)
-    fig.update_layout(legend_traceorder='reversed')
-    fig.for_each_annotation(
-        lambda a: a.update(text=a.text.replace('modified_bases=5mCG_5hmCG', 'with 5mCG/5hmCG calling'))
-    )
-    fig.for_each_annotation(
-        lambda a: a.update(text=a.text.replace('modified_bases=5mCG', 'with 5mCG calling'))
-    )
-    fig.for_each_annotation(
-        lambda a: a.update(text=a.text.replace('modified_bases=no modified bases', 'without modification calling'))
-    )
-
-    file_name = 'ONT_basecaller_performance_samples_s.png'
-    print(f'Writing chart to file: {file_name}')
-    fig.write_image(file_name, scale=4)
-
-
-def generate_chart_runtime_whg_30x(results: pd.DataFrame):
-    instance_order = results[
-        (results['runtime_type'] == 'per WHG 30x') &
-        (results['cost_region'] == 'us-west-2')
-        ].sort_values(['runtime_h'], ascending=True)['display_label'].unique()
-    fig = px.bar(
-        results[
-            (results['runtime_type'] == 'per WHG 30x') &
-            (results['cost_region'] == 'us-west-2')
-            ],
-        title='<b>Basecaller performance, runtime [h] for whole human genome (WHG) at 30x coverage '
-              '(the lower the better)</b>',
-        x='runtime_h', y='display_label', color='basecaller', barmode='group', facet_col='modified_bases',
-        facet_col_spacing=0.05,
-        labels={
-            'display_label': 'instance type',
-            'runtime_h': 'runtime [h]',
-        },
-        category_orders={
-            'display_label': instance_order,
-            'modified_bases': ['no modified bases', '5mCG', '5mCG_5hmCG'],
-        },
-        text_auto='.1f',
-        orientation='h',
-        height=200 + len(instance_order) * 90, width=1200,
-    )
-    fig.update_traces(textposition='outside', cliponaxis=False)
-    fig.update_layout(legend_traceorder='reversed')
-    fig.for_each_annotation(
-        lambda a: a.update(text=a.text.replace('modified_bases=5mCG_5hmCG', 'with 5mCG/5hmCG calling'))
-    )
-    fig.for_each_annotation(
-        lambda a: a.update(text=a.text.replace('modified_bases=5mCG', 'with 5mCG calling'))
-    )
-    fig.for_each_annotation(
-        lambda a: a.update(text=a.text.replace('modified_bases=no modified bases', 'without modification calling'))
-    )
-
-    file_name = 'ONT_basecaller_performance_runtime_whg_30x.png'
-    print(f'Writing chart to file: {file_name}')
-    fig.write_image(file_name, scale=4)
+def generate_throughput_series(results: pd.DataFrame, file_name: str = THROUGHPUT_SERIES_FILE_NAME):
+    """
+    Write the throughput time series of the jobs recorded while the basecaller ran (see
+    cdk_packages/assets/telemetry.py), one row per job and interval, labelled with the instance
+    type and the experiment of the job.
+    """
+    series = utils.expand_throughput_series(results)
+    if series.empty:
+        print('No throughput time series found, the jobs were run before they were recorded.')
+        return
+    labels = results[['job_id', 'ec2_instance_type', 'tags', 'modified_bases', 'data_set_id']]
+    series = labels.merge(series, on='job_id', how='inner')
+    print(f'Writing throughput time series of {series["job_id"].nunique()} jobs to file: {file_name}')
+    series.to_csv(file_name, index=False)
 
 
-def generate_cost_tables(results: pd.DataFrame):
+def generate_cost_tables(results: pd.DataFrame, instance_specs: dict, instance_cost: dict):
     # transform data into structure suitable for multi-header Excel file
     columns = ['ec2_instance_type', 'basecaller', 'modified_bases', 'runtime_type',
                'runtime_h', 'cost_region', 'cost_per_gigabase', 'cost_per_whg_30x']
@@ -256,8 +206,22 @@ def generate_cost_tables(results: pd.DataFrame):
     temp3.loc[:, 'header_lvl_2'] = 'cost [$]'
     temp3.loc[:, 'header_lvl_3'] = 'per WHG 30x'
     temp3.loc[:, 'value'] = temp3['cost_per_whg_30x']
+    temps = [temp1, temp2, temp3]
+    if 'spot_cost_per_hour' in results.columns:
+        columns_spot = columns + ['spot_cost_per_gigabase', 'spot_cost_per_whg_30x']
+        temp4 = results[columns_spot].copy()
+        temp4.rename(columns={'modified_bases': 'header_lvl_1'}, inplace=True)
+        temp4.loc[:, 'header_lvl_2'] = 'spot cost [$]'
+        temp4.loc[:, 'header_lvl_3'] = 'per gigabase'
+        temp4.loc[:, 'value'] = temp4['spot_cost_per_gigabase']
+        temp5 = results[columns_spot].copy()
+        temp5.rename(columns={'modified_bases': 'header_lvl_1'}, inplace=True)
+        temp5.loc[:, 'header_lvl_2'] = 'spot cost [$]'
+        temp5.loc[:, 'header_lvl_3'] = 'per WHG 30x'
+        temp5.loc[:, 'value'] = temp5['spot_cost_per_whg_30x']
+        temps += [temp4, temp5]
     df = pd.concat(
-        [temp1, temp2, temp3], ignore_index=True
+        temps, ignore_index=True
     )
     df_pivot = pd.pivot_table(
         df,
@@ -265,20 +229,18 @@ def generate_cost_tables(results: pd.DataFrame):
         index=['ec2_instance_type', 'basecaller', 'cost_region'],
         columns=['header_lvl_1', 'header_lvl_2', 'header_lvl_3']
     )
-    df_pivot = df_pivot.reindex(['runtime [h]', 'cost [$]'], axis=1, level=1)
+    df_pivot = df_pivot.reindex(['runtime [h]', 'cost [$]', 'spot cost [$]'], axis=1, level=1)
     df_pivot = df_pivot.reindex(['per gigabase', 'per WHG 30x'], axis=1, level=2)
     df_pivot.reset_index(inplace=True)
 
     # add additional columns for Excel file
-    df_pivot.loc[:, 'num_gpus'] = df_pivot.apply(
-        lambda row: instance_specs[row.ec2_instance_type.iloc[0]]['GpuInfo']['Gpus'][0]['Count'],
-        axis=1
-    )
-    df_pivot.loc[:, 'cost_per_hour'] = df_pivot.apply(
-        lambda row: instance_cost['instances'][row.cost_region.iloc[0]][row.ec2_instance_type.iloc[0]]['cost_per_hour']
-        if instance_cost['instances'][row.cost_region.iloc[0]][row.ec2_instance_type.iloc[0]]['cost_per_hour'] else None,
-        axis=1
-    )
+    instance_types = df_pivot[('ec2_instance_type', '', '')]
+    cost_regions = df_pivot[('cost_region', '', '')]
+    df_pivot.loc[:, 'num_gpus'] = instance_types.map(utils.instance_specs_table(instance_specs)['num_gpus'])
+    df_pivot.loc[:, 'cost_per_hour'] = utils.pricing_table(instance_cost) \
+        .set_index(['cost_region', 'ec2_instance_type'])['cost_per_hour'] \
+        .reindex(pd.MultiIndex.from_arrays([cost_regions, instance_types])) \
+        .to_numpy()
 
     # reorder and rename columns for readability
     df_pivot = df_pivot.round(decimals=2)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Partitioned Parquet store for the benchmark results.
+
+The results of all deployments of the benchmark environment are kept in one Parquet data set,
+partitioned by the job tags and by the month in which the job started:
+
+    results_store.parquet/tag=<tag key>/month=<YYYY-MM>/part.parquet
+
+The tag key is a short hash of the tags, because tags such as those of the tuner are longer than
+the file names allowed by most file systems. The full tags are kept in the 'tags' column of the
+rows. Rows are deduplicated on 'job_id' when they are appended, so the same DynamoDB items can be
+appended repeatedly. Readers only load the partitions matching the requested tags and months
+and only the requested columns.
+
+"""
+
+import glob
+import hashlib
+import json
+import os
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RESULTS_STORE_PATH = 'results_store.parquet'
+METADATA_FILE_NAME = '_metadata.json'  # files starting with '_' are ignored when reading the data set
+PARTITION_FILE_NAME = 'part.parquet'
+PARTITIONING = ds.partitioning(pa.schema([('tag', pa.string()), ('month', pa.string())]), flavor='hive')
+UNTAGGED = 'untagged'
+UNKNOWN_MONTH = 'unknown'
+TAG_KEY_LENGTH = 16
+
+
+def tag_key(tag: str):
+    """
+    Short and stable partition key of the job tags.
+    """
+    return hashlib.sha1(tag.encode('utf-8')).hexdigest()[:TAG_KEY_LENGTH]
+
+
+def partition_keys(df: pd.DataFrame):
+    """
+    Derive the partition keys 'tag' (the tag key of the job tags) and 'month' for each row.
+
+    Args:
+        df: results as returned from the DynamoDB table
+
+    Returns:
+        keys: dataframe with the columns 'tag' and 'month', same index as df
+
+    """
+    tags = df['tags'] if 'tags' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    start_times = df['container_start_time'] if 'container_start_time' in df.columns \
+        else pd.Series(None, index=df.index, dtype=object)
+    return pd.DataFrame({
+        'tag': tags.fillna(UNTAGGED).astype(str).map(tag_key),
+        'month': start_times.astype(str).str[:7].where(start_times.notna(), UNKNOWN_MONTH),
+    }, index=df.index)
+
+
+def partition_path(path: str, key: str, month: str):
+    return os.path.join(path, f'tag={key}', f'month={quote(month, safe="")}', PARTITION_FILE_NAME)
+
+
+def append(df: pd.DataFrame, path: str = RESULTS_STORE_PATH):
+    """
+    Append results to the store. Existing rows with the same 'job_id' are replaced, also if
+    they are stored in a different partition.
+
+    Args:
+        df: results as returned from the DynamoDB table
+        path: path to the store
+
+    Returns:
+        num_rows: number of rows appended or replaced
+
+    """
+    if df.empty:
+        return 0
+    df = df.drop_duplicates(subset='job_id', keep='last')
+    incoming = pd.concat([df, partition_keys(df)], axis=1)
+    existing = read(path, columns=['job_id', 'tag', 'month'])
+    replaced = existing[existing['job_id'].isin(incoming['job_id'])] if not existing.empty else existing
+    affected = pd.concat([incoming[['tag', 'month']], replaced[['tag', 'month']]]).drop_duplicates()
+    for key, month in affected.itertuples(index=False):
+        file_name = partition_path(path, key, month)
+        new_rows = incoming[(incoming['tag'] == key) & (incoming['month'] == month)].drop(columns=['tag', 'month'])
+        if os.path.exists(file_name):
+            old_rows = pd.read_parquet(file_name)
+            old_rows = old_rows[~old_rows['job_id'].isin(incoming['job_id'])]
+            new_rows = pd.concat([old_rows, new_rows], ignore_index=True)
+        write_partition(file_name, new_rows)
+    return len(incoming)
+
+
+def write_partition(file_name: str, df: pd.DataFrame):
+    """
+    Write one partition file. The file is replaced atomically, so that concurrent readers never
+    see a partially written file.
+    """
+    if df.empty:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        return
+    # Columns without any value are dropped, they are read back as null via the unified schema.
+    df = df.dropna(axis=1, how='all').copy()
+    # DynamoDB attributes may hold values of different types, store those as strings.
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    tmp_file_name = os.path.join(os.path.dirname(file_name), f'.{PARTITION_FILE_NAME}.tmp')
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_file_name)
+    os.replace(tmp_file_name, file_name)
+
+
+def read(path: str = RESULTS_STORE_PATH, columns: list = None, tags: list = None, months: list = None,
+         tag_prefixes: list = None):
+    """
+    Read results from the store. Only the partitions matching the given tags and months are
+    loaded, and only the given columns.
+
+    Args:
+        path: path to the store
+        columns: columns to load, all columns if None. Columns not in the store are skipped.
+        tags: job tags to load, all tags if None
+        months: months to load in the format 'YYYY-MM', all months if None
+        tag_prefixes: also load the tags starting with one of these prefixes, if tags are given
+
+    Returns:
+        df: results as dataframe
+
+    """
+    if not glob.glob(os.path.join(path, '*', '*', PARTITION_FILE_NAME)):
+        return pd.DataFrame(columns=columns)
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    # Partitions may have different columns, read all with the union of their schemas.
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in dataset.get_fragments()] + [PARTITIONING.schema],
+        promote_options='permissive'
+    )
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING, schema=schema)
+    expression = None
+    if tags is not None:
+        expression = pc.field('tag').isin(pa.array([tag_key(tag) for tag in tags], type=pa.string()))
+        # The prefixes are matched against the full tags, not the tag keys.
+        for prefix in (tag_prefixes or []) if 'tags' in schema.names else []:
+            expression = expression | pc.starts_with(pc.field('tags'), prefix)
+    if months is not None:
+        months_expression = pc.field('month').isin(list(months))
+        expression = months_expression if expression is None else expression & months_expression
+    if columns is not None:
+        columns = [column for column in columns if column in schema.names]
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table.to_pandas()
+    if columns is None:
+        df = df.drop(columns=['tag', 'month'])
+    return df
+
+
+def load_metadata(path: str = RESULTS_STORE_PATH):
+    """
+    Load the metadata of the store, such as imported snapshots and the synchronisation state.
+    """
+    file_name = os.path.join(path, METADATA_FILE_NAME)
+    if not os.path.exists(file_name):
+        return {}
+    with open(file_name, 'r') as f:
+        return json.load(f)
+
+
+def save_metadata(metadata: dict, path: str = RESULTS_STORE_PATH):
+    os.makedirs(path, exist_ok=True)
+    file_name = os.path.join(path, METADATA_FILE_NAME)
+    with open(file_name + '.tmp', 'w') as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(file_name + '.tmp', file_name)
+
+
+def import_hdf_snapshots(pattern: str = 'results_table_*.h5', path: str = RESULTS_STORE_PATH):
+    """
+    Import results tables saved as HDF5 snapshots by earlier versions of get_data().
+    Each snapshot is imported once.
+
+    Returns:
+        df: results imported from the snapshots
+
+    """
+    metadata = load_metadata(path)
+    imported = metadata.get('imported_snapshots', [])
+    dfs = []
+    for h5_file in sorted(glob.glob(pattern)):
+        if h5_file in imported:
+            continue
+        print(f'Importing results snapshot {h5_file} ...')
+        dfs.append(pd.read_hdf(h5_file, 'df'))
+        append(dfs[-1], path)
+        imported.append(h5_file)
+        metadata['imported_snapshots'] = imported
+        save_metadata(metadata, path)
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Index of all benchmark runs per experiment and compute environment.
+
+A run is one data set, i.e. all AWS Batch jobs submitted together with the same 'data_set_id'.
+The index records the start and end time of every run with succeeded jobs, keyed by
+experiment (the job tags) and compute environment, with the runs sorted by end time. The
+latest, the n-th latest or all runs of an experiment are looked up without grouping the
+results again. The index is updated incrementally with new results and stored next to the
+results store.
+
+"""
+
+import json
+import os
+
+import pandas as pd
+
+import results_store.results_store as results_store
+
+RUN_HISTORY_FILE_NAME = '_run_history.json'  # files starting with '_' are ignored when reading the data set
+RUN_HISTORY_COLUMNS = ['job_id', 'tags', 'status', 'compute_environment', 'data_set_id',
+                       'container_start_time', 'container_end_time']
+
+
+class RunHistory:
+
+    def __init__(self, path: str = results_store.RESULTS_STORE_PATH):
+        """
+        Args:
+            path: path to the results store, or None for an index kept in memory only
+        """
+        self.file_name = os.path.join(path, RUN_HISTORY_FILE_NAME) if path else None
+        # {experiment: {compute environment: [run, ...]}}, runs sorted by end time, latest run last
+        self.runs = {}
+        if self.file_name and os.path.exists(self.file_name):
+            with open(self.file_name, 'r') as f:
+                self.runs = json.load(f)
+
+    @classmethod
+    def from_results(cls, df: pd.DataFrame):
+        """
+        Build an index kept in memory from the given results.
+        """
+        history = cls(path=None)
+        history.update(df)
+        return history
+
+    def exists(self):
+        return self.file_name is not None and os.path.exists(self.file_name)
+
+    def update(self, df: pd.DataFrame):
+        """
+        Add the succeeded jobs in the given results to the index. Jobs already in the index are
+        updated, e.g. when a job has been retried.
+        """
+        if df.empty:
+            return
+        df = df.reindex(columns=RUN_HISTORY_COLUMNS)
+        df = df[(df['status'] == 'succeeded') & df[['tags', 'compute_environment', 'container_end_time']].notna().all(axis=1)]
+        touched = set()
+        for job in df.itertuples(index=False):
+            data_set_id = None if pd.isna(job.data_set_id) else job.data_set_id
+            runs = self.runs.setdefault(job.tags, {}).setdefault(job.compute_environment, [])
+            run = next((run for run in runs if run['data_set_id'] == data_set_id), None)
+            if run is None:
+                run = {'data_set_id': data_set_id, 'jobs': {}}
+                runs.append(run)
+            run['jobs'][job.job_id] = [job.container_start_time, job.container_end_time]
+            touched.add((job.tags, job.compute_environment))
+        for experiment, compute_environment in touched:
+            runs = self.runs[experiment][compute_environment]
+            for run in runs:
+                run['start_time'] = min(start for start, _ in run['jobs'].values())
+                run['end_time'] = max(end for _, end in run['jobs'].values())
+            runs.sort(key=lambda run: run['end_time'])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.file_name), exist_ok=True)
+        with open(self.file_name + '.tmp', 'w') as f:
+            json.dump(self.runs, f)
+        os.replace(self.file_name + '.tmp', self.file_name)
+
+    def all(self, experiment: str, compute_environment: str):
+        """
+        Get all runs of an experiment in a compute environment, latest run last.
+        """
+        return self.runs.get(experiment, {}).get(compute_environment, [])
+
+    def nth(self, experiment: str, compute_environment: str, n: int = 0):
+        """
+        Get the n-th latest run of an experiment in a compute environment, n=0 is the latest run.
+        None if there are not more than n runs.
+        """
+        if n < 0:
+            raise ValueError(f'n must not be negative, got {n}.')
+        runs = self.all(experiment, compute_environment)
+        return runs[-1 - n] if n < len(runs) else None
+
+    def latest(self, experiment: str, compute_environment: str):
+        return self.nth(experiment, compute_environment, 0)
+
+    def latest_runs(self, experiments: list = None):
+        """
+        Get the latest run of each experiment and compute environment. Runs finishing at the
+        same time as the latest run are included as well.
+
+        Args:
+            experiments: experiments to include, all experiments if None
+
+        Returns:
+            runs: dataframe with the columns 'tags', 'compute_environment', 'data_set_id',
+                  'start_time' and 'end_time'
+
+        """
+        latest_runs = [
+            (experiment, compute_environment, run['data_set_id'], run['start_time'], run['end_time'])
+            for experiment in (self.runs.keys() if experiments is None else experiments)
+            for compute_environment, runs in self.runs.get(experiment, {}).items()
+            for run in runs if run['end_time'] == runs[-1]['end_time']
+        ]
+        return pd.DataFrame(
+            latest_runs, columns=['tags', 'compute_environment', 'data_set_id', 'start_time', 'end_time']
+        )
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Spot price history for the benchmark jobs run on spot compute environments.
+
+The price of a spot instance changes during the run time of a job. The effective cost per hour
+of a job is the time-weighted average of the spot price of its instance type in its
+availability zone (AZ) between 'container_start_time' and 'container_end_time'.
+
+The spot price history is requested with one paginated DescribeSpotPriceHistory query per region
+for all instance types and the time window of all jobs, and cached in a local file. Only
+instance types or time windows not covered by the cache are requested again. A file with the
+output of 'aws ec2 describe-spot-price-history' can be used instead of the API.
+
+"""
+
+import datetime
+import functools
+import json
+from os.path import exists
+
+import boto3
+import numpy as np
+import pandas as pd
+
+SPOT_PRICING_FILE_NAME = 'spot_price_history.json'
+PRODUCT_DESCRIPTION = 'Linux/UNIX'
+# Region of jobs recorded before the AZ was added to the results table.
+DEFAULT_REGION = 'us-west-2'
+# The price in effect at the start of a job was set before the job started.
+LOOKBACK = datetime.timedelta(days=1)
+SPOT_COMPUTE_ENVIRONMENT_SUFFIX = '-spot'
+# Region prefix of an AZ name, also of Local Zones (us-west-2-lax-1a) and Wavelength Zones (us-east-1-wl1-bos-wlz-1)
+REGION_PATTERN = r'^([a-z]{2}(?:-[a-z]+)+-[0-9]+)'
+EPOCH = pd.Timestamp('1970-01-01', tz='UTC')
+
+
+@functools.lru_cache(maxsize=None)
+def get_client(region: str):
+    return boto3.client('ec2', region_name=region)
+
+
+def spot_jobs(df: pd.DataFrame):
+    """
+    Select the jobs run on spot compute environments, with their region and AZ.
+
+    Returns:
+        jobs: dataframe with the columns 'region', 'availability_zone', 'ec2_instance_type',
+            'start' and 'end' (seconds since epoch), same index as the selected rows of df
+
+    """
+    is_spot = df['compute_environment'].fillna('').str.endswith(SPOT_COMPUTE_ENVIRONMENT_SUFFIX)
+    df = df[is_spot & df['container_end_time'].notna()]
+    availability_zone = df['ec2_availability_zone'] if 'ec2_availability_zone' in df.columns \
+        else pd.Series(None, index=df.index, dtype=object)
+    return pd.DataFrame({
+        'region': availability_zone.str.extract(REGION_PATTERN, expand=False).fillna(DEFAULT_REGION),
+        'availability_zone': availability_zone,
+        'ec2_instance_type': df['ec2_instance_type'],
+        'start': (pd.to_datetime(df['container_start_time'], format='ISO8601', utc=True) - EPOCH).dt.total_seconds(),
+        'end': (pd.to_datetime(df['container_end_time'], format='ISO8601', utc=True) - EPOCH).dt.total_seconds(),
+    }, index=df.index)
+
+
+def get_spot_prices(df: pd.DataFrame, history_file: str = None):
+    """
+    Get the spot price history covering all spot jobs in the results.
+
+    Args:
+        df: results with one row per job
+        history_file: output of 'aws ec2 describe-spot-price-history' to use instead of the API
+
+    Returns:
+        spot_prices: price history keyed by '<AZ>|<instance type>', each a list of
+            [seconds since epoch, price] sorted by time
+
+    """
+    jobs = spot_jobs(df)
+    if jobs.empty:
+        return {}
+    if history_file:
+        print(f'Loading spot price history from file {history_file} ...')
+        with open(history_file, 'r') as f:
+            return history_from_records(json.load(f)['SpotPriceHistory'])
+
+    cache = load_from_file()
+    lookback = LOOKBACK.total_seconds()
+    updated = False
+    for region, region_jobs in jobs.groupby('region'):
+        region_cache = cache.setdefault(region, {'covered': {}, 'prices': {}})
+        windows = region_jobs.groupby('ec2_instance_type').agg({'start': 'min', 'end': 'max'})
+        windows['start'] -= lookback
+        missing = [
+            instance_type for instance_type, window in windows.iterrows()
+            if instance_type not in region_cache['covered']
+            or window['start'] < region_cache['covered'][instance_type][0]
+            or window['end'] > region_cache['covered'][instance_type][1]
+        ]
+        if not missing:
+            continue
+        # One query for all missing instance types, extended to the windows already covered,
+        # so that each instance type is covered by one contiguous window.
+        start = min(
+            [windows.loc[missing, 'start'].min()] +
+            [region_cache['covered'][instance_type][0] for instance_type in missing
+             if instance_type in region_cache['covered']]
+        )
+        end = max(
+            [windows.loc[missing, 'end'].max()] +
+            [region_cache['covered'][instance_type][1] for instance_type in missing
+             if instance_type in region_cache['covered']]
+        )
+        records = describe_spot_price_history(region, missing, start, end)
+        for key, history in history_from_records(records).items():
+            merged = dict(region_cache['prices'].get(key, []))
+            merged.update(history)
+            region_cache['prices'][key] = sorted([timestamp, price] for timestamp, price in merged.items())
+        for instance_type in missing:
+            region_cache['covered'][instance_type] = [start, end]
+        updated = True
+    if updated:
+        save_to_file(cache)
+    return {key: history for region_cache in cache.values() for key, history in region_cache['prices'].items()}
+
+
+def describe_spot_price_history(region: str, instance_types: list, start: float, end: float):
+    print(f'Requesting spot price history for {len(instance_types)} instance types in {region} ...')
+    paginator = get_client(region).get_paginator('describe_spot_price_history')
+    records = []
+    for page in paginator.paginate(
+            InstanceTypes=instance_types,
+            ProductDescriptions=[PRODUCT_DESCRIPTION],
+            StartTime=datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc),
+            EndTime=datetime.datetime.fromtimestamp(end, tz=datetime.timezone.utc),
+    ):
+        records.extend(page['SpotPriceHistory'])
+    return records
+
+
+def history_from_records(records: list):
+    """
+    Convert SpotPriceHistory records into price histories keyed by '<AZ>|<instance type>'.
+    """
+    history = {}
+    for record in records:
+        if record.get('ProductDescription', PRODUCT_DESCRIPTION) != PRODUCT_DESCRIPTION:
+            continue
+        timestamp = record['Timestamp']
+        if isinstance(timestamp, str):
+            timestamp = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        key = f'{record["AvailabilityZone"]}|{record["InstanceType"]}'
+        history.setdefault(key, []).append([int(timestamp.timestamp()), float(record['SpotPrice'])])
+    return {key: sorted(prices) for key, prices in history.items()}
+
+
+def load_from_file():
+    if not exists(SPOT_PRICING_FILE_NAME):
+        return {}
+    print('Loading spot price history from file ...')
+    with open(SPOT_PRICING_FILE_NAME, 'r') as f:
+        return json.load(f)
+
+
+def save_to_file(cache: dict):
+    with open(SPOT_PRICING_FILE_NAME, 'w') as f:
+        json.dump(cache, f)
+
+
+def time_weighted_price(history: list, start: np.ndarray, end: np.ndarray):
+    """
+    Time-weighted average of a piecewise constant price between start and end. The first price
+    of the history applies before its timestamp.
+
+    Args:
+        history: list of [seconds since epoch, price] sorted by time
+        start: start times in seconds since epoch
+        end: end times in seconds since epoch
+
+    Returns:
+        prices: average price per hour for each time window
+
+    """
+    times = np.array([timestamp for timestamp, _ in history], dtype='float64')
+    prices = np.array([price for _, price in history], dtype='float64')
+    # cumulative cost at each price change
+    cumulative = np.concatenate([[0], np.cumsum(prices[:-1] * np.diff(times))])
+
+    def integral(t):
+        k = np.clip(np.searchsorted(times, t, side='right') - 1, 0, None)
+        return cumulative[k] + prices[k] * (t - times[k])
+
+    duration = end - start
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = (integral(end) - integral(start)) / duration
+    # price in effect at the start of jobs without duration
+    return np.where(duration > 0, average, prices[np.clip(np.searchsorted(times, start, side='right') - 1, 0, None)])
+
+
+def add_spot_cost_per_hour(df: pd.DataFrame, spot_prices: dict):
+    """
+    Add the time-weighted spot price of each job run on a spot compute environment in
+    'spot_cost_per_hour' and the region of the job in 'spot_region'. For jobs without a recorded
+    AZ the price is averaged over the AZs of the region.
+    """
+    jobs = spot_jobs(df)
+    total = pd.Series(0.0, index=jobs.index)
+    count = pd.Series(0, index=jobs.index)
+    for key, history in spot_prices.items():
+        availability_zone, instance_type = key.split('|')
+        selected = (jobs['ec2_instance_type'] == instance_type) & (
+            (jobs['availability_zone'] == availability_zone) |
+            (jobs['availability_zone'].isna() & (jobs['region'] == availability_zone[:-1]))
+        )
+        if not selected.any():
+            continue
+        selected_jobs = jobs[selected]
+        total[selected] += time_weighted_price(history, selected_jobs['start'].to_numpy(),
+                                               selected_jobs['end'].to_numpy())
+        count[selected] += 1
+    df = df.copy()
+    df['spot_cost_per_hour'] = (total / count.where(count > 0)).reindex(df.index)
+    df['spot_region'] = jobs['region'].reindex(df.index)
+    return df
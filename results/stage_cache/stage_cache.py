@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Content-addressed cache for the stages of the results processing chain.
+
+A stage is a tuple of a function taking a dataframe as first argument and its further
+arguments, e.g. (utils.add_gpu_count, instance_specs). The output of each stage is stored on
+disk under a key derived from the key of its input, the source code of the module defining the
+stage function and the stage arguments. The key of the first input is the hash of the data, so
+the keys of all stages are known before any stage is run and a chain is resumed after the last
+stage found in the cache.
+
+Row-wise stages can be run per partition, e.g. per experiment, so that after new results of
+one experiment arrived only the stages of that experiment are run again. The cache is bounded
+in size, the least recently used entries are evicted first.
+
+"""
+
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+STAGE_CACHE_PATH = '.stage_cache'
+STAGE_CACHE_MAX_BYTES = 1024 ** 3
+ENTRY_SUFFIX = '.pkl'
+
+
+class StageCache:
+
+    def __init__(self, path: str = STAGE_CACHE_PATH, max_bytes: int = STAGE_CACHE_MAX_BYTES):
+        """
+        Args:
+            path: directory of the cache entries
+            max_bytes: maximum total size of the cache entries
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # key of the output of the last run, can be passed as input_key to the next run
+        self.last_key = None
+
+    def run(self, df: pd.DataFrame, stages: list, partition_by: str = None, input_key: str = None):
+        """
+        Run the stages on the dataframe, reusing the outputs of stages with unchanged inputs.
+
+        Args:
+            df: input of the first stage
+            stages: list of (function, *args) tuples, run in this order
+            partition_by: if set, run the stages separately for each value of this column
+                and concatenate the outputs. Only valid for stages that work row by row or
+                within groups of this column.
+            input_key: key of df if known, e.g. the last_key of the run producing df. Saves
+                hashing the data.
+
+        Returns:
+            df: output of the last stage
+
+        """
+        if partition_by is None or df.empty:
+            df, self.last_key = self.run_partition(df, stages, input_key)
+        else:
+            outputs = [self.run_partition(partition, stages)
+                       for _, partition in df.groupby(partition_by, sort=False, dropna=False)]
+            df = pd.concat([output for output, _ in outputs], ignore_index=True)
+            self.last_key = hashlib.sha256(''.join(key for _, key in outputs).encode('utf-8')).hexdigest()
+        self.evict()
+        return df
+
+    def run_partition(self, df: pd.DataFrame, stages: list, input_key: str = None):
+        keys = stage_keys(input_key or data_hash(df), stages)
+        start = 0
+        for i in reversed(range(len(stages))):
+            cached = self.load(keys[i])
+            if cached is not None:
+                df = cached
+                start = i + 1
+                break
+        self.hits += start
+        self.misses += len(stages) - start
+        for i in range(start, len(stages)):
+            function, *args = stages[i]
+            df = function(df, *args)
+            self.save(keys[i], df)
+        return df, keys[-1]
+
+    def entry_file_name(self, key: str):
+        return os.path.join(self.path, key + ENTRY_SUFFIX)
+
+    def load(self, key: str):
+        file_name = self.entry_file_name(key)
+        if not os.path.exists(file_name):
+            return None
+        # the modification time is the time of last use for the eviction
+        os.utime(file_name)
+        return pd.read_pickle(file_name)
+
+    def save(self, key: str, df: pd.DataFrame):
+        os.makedirs(self.path, exist_ok=True)
+        file_name = self.entry_file_name(key)
+        df.to_pickle(file_name + '.tmp')
+        os.replace(file_name + '.tmp', file_name)
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits into max_bytes.
+        """
+        if not os.path.isdir(self.path):
+            return
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, file_name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(file_name)
+            total -= size
+
+
+def data_hash(df: pd.DataFrame):
+    """
+    Hash of the data, column names and data types of the dataframe.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage: tuple):
+    """
+    Fingerprint of a stage: its function name, the source code of the module defining the
+    function and its arguments.
+    """
+    function, *args = stage
+    digest = hashlib.sha256()
+    digest.update(function.__qualname__.encode('utf-8'))
+    with open(inspect.getsourcefile(function), 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps(args, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def stage_keys(input_key: str, stages: list):
+    """
+    Cache keys of the outputs of all stages, each derived from the key of the stage input.
+    """
+    keys = []
+    for stage in stages:
+        input_key = hashlib.sha256((input_key + stage_fingerprint(stage)).encode('utf-8')).hexdigest()
+        keys.append(input_key)
+    return keys
@@ -7,46 +7,96 @@ Collection of helper and utility functions for collecting and analysing the benc
 
 """
 
-import glob
 import json
 
 import boto3
+import numpy as np
 import pandas as pd
-from dynamo_pandas import get_df
+from botocore.exceptions import ClientError
+
+import dynamodb_sync.dynamodb_sync as dynamodb_sync
+import results_store.results_store as results_store
+import run_history.run_history as run_history
 
 client_ssm = boto3.client('ssm')
 client_s3 = boto3.client('s3')
 client_dynamodb = boto3.client('dynamodb')
 
+DATA_S3_BUCKET_PARAMETER = '/ONT-performance-benchmark/data-s3-bucket'
+# Manifests of the test data subsets, see cdk_packages/assets/create_test_data_sets.py and
+# create_jobs/basecaller_batch/test_data.py
+TEST_DATA_MANIFESTS = ['pod5-subsets/manifest.json', 'pod5-subsets/on-demand-manifest.json']
+SHARD_DIRECTORY_PATTERN = r'(/fsx/pod5-subsets/[^\s/]+\.lst)'
+# The number of bases of the reference data set was established by running the command below
+# against the output of the dorado basecaller:
+# gzip -cd /fsx/out/e2273a88-5f0a-4751-b819-0c0efc6c28a1/pass/fastq_runid_*.fastq.gz | paste - - - - | cut -f 2 | tr -d '\n' | wc -c
+REFERENCE_DATA_SET = 'wgs_subset_128_files'
+REFERENCE_NUM_BASES = 18330576791  # number of bases in the first 128 FAST5 files
+# Measured in the output of each job, see cdk_packages/assets/count_bases.py
+OUTPUT_STATS_COLUMNS = ['output_reads', 'output_bases', 'mean_qscore', 'read_n50', 'bases_per_s']
+
+
+def get_data(ssm_parameter_name: str, columns: list = None, tags: list = None, full_sync: bool = False,
+             tag_prefixes: list = None):
+    """
+    Load the benchmark results. New and changed items of the current DynamoDB results table are
+    merged into the local results store first, then the requested partitions and columns are read
+    from the store.
+
+    Args:
+        ssm_parameter_name: path to parameter in SSM Parameter Store with the name of the DynamoDB table.
+        columns: columns to load, all columns if None
+        tags: job tags to load, all tags if None
+        full_sync: if True, scan the whole DynamoDB table instead of only the items changed since the last run
+        tag_prefixes: also load the tags starting with one of these prefixes, if tags are given
+
+    Returns:
+        df: results as dataframe
+
+    """
+    sync_data(ssm_parameter_name, full_sync=full_sync)
+    return results_store.read(columns=columns, tags=tags, tag_prefixes=tag_prefixes)
+
+
+def sync_data(ssm_parameter_name: str, full_sync: bool = False):
+    """
+    Merge new and changed items of the current DynamoDB results table into the local results store
+    and update the run history index.
+
+    Args:
+        ssm_parameter_name: path to parameter in SSM Parameter Store with the name of the DynamoDB table.
+        full_sync: if True, scan the whole DynamoDB table instead of only the items changed since the last run
 
-def get_data(ssm_parameter_name: str):
-    # load all results from DynamoDB table
+    """
+    # Sync results from DynamoDB table to the local store, we do this to preserve results in case the
+    # DynamoDB is deleted. The store merges results from different DynamoDB tables in case the environment
+    # gets repeatedly deployed and the name of the DynamoDB table changes with each deployment.
+    changed = pd.DataFrame()
     try:
         results_table = client_ssm.get_parameter(Name=ssm_parameter_name)['Parameter']['Value']
-        df = get_df(table=results_table)
+        changed = dynamodb_sync.sync(results_table, full=full_sync)
     except (
             client_ssm.exceptions.ParameterNotFound,
             client_dynamodb.exceptions.ResourceNotFoundException,
     ) as e:
         pass
+    # Import result tables saved as HDF5 files by earlier versions of this function.
+    imported = results_store.import_hdf_snapshots()
+    update_run_history(pd.concat([changed, imported], ignore_index=True))
+
+
+def update_run_history(changed: pd.DataFrame):
+    """
+    Add new results to the run history index. The index is built from all results in the
+    results store if it doesn't exist yet.
+    """
+    history = run_history.RunHistory()
+    if history.exists():
+        history.update(changed)
     else:
-        # save results to file, we do this to preserve results in case the DynamoDB is deleted
-        df.to_hdf(f'results_table_{results_table}.h5', key='df', mode='w')
-    # Load and join all saved result tables. This merges all results from different DynamoDB tables in case
-    # environments gets repeatedly deployed and the name of the DynamoDB tables changes with each deployment.
-    dir_path = 'results_table_*.h5'
-    h5_files = glob.glob(dir_path)
-    # merge data from h5 files
-    df = pd.DataFrame()
-    for h5_file in h5_files:
-        df = pd.concat(
-            [
-                df,
-                pd.read_hdf(h5_file, 'df'),
-            ],
-            ignore_index=True
-        )
-    return df
+        print('Building run history index ...')
+        history.update(results_store.read(columns=run_history.RUN_HISTORY_COLUMNS))
+    history.save()
 
 
 def get_instance_specs(ssm_parameter_name: str):
@@ -107,85 +157,239 @@ def load_instance_specs_from_file():
     return instance_specs
 
 
+def get_test_data_stats(ssm_parameter_name: str = DATA_S3_BUCKET_PARAMETER):
+    """
+    Load the statistics of the test data shards from the test data manifests on S3.
+
+    Args:
+        ssm_parameter_name: path to parameter in SSM Parameter Store with the name of the data bucket.
+
+    Returns:
+        stats: dict with the reads, samples and bytes by shard directory under 'shards', and the
+            number of bases per signal sample of the reference data set under 'bases_per_sample',
+            None if the manifest has no statistics
+
+    """
+    stats = {'shards': {}, 'bases_per_sample': None}
+    try:
+        print('Loading test data manifests from S3 ...')
+        s3_bucket = client_ssm.get_parameter(Name=ssm_parameter_name)['Parameter']['Value']
+        manifests = []
+        for key in TEST_DATA_MANIFESTS:
+            try:
+                file_obj = client_s3.get_object(Bucket=s3_bucket, Key=key)
+            except client_s3.exceptions.NoSuchKey:
+                continue
+            manifests.append(json.loads(file_obj['Body'].read().decode('utf-8')))
+    except (client_ssm.exceptions.ParameterNotFound, ClientError) as e:
+        print(f'Test data manifests not available ({e}), run times are based on the reference data set.')
+        return stats
+    for manifest in manifests:
+        for name, entry in manifest.items():
+            if 'file_lists' in entry:
+                # subset created on request
+                stats['shards'].update(zip(entry['file_lists'], entry.get('shard_stats', [])))
+                continue
+            for num_chunks, shard_stats in entry.get('shard_stats', {}).items():
+                stats['shards'].update(zip(entry[num_chunks], shard_stats))
+        reference_samples = manifest.get(REFERENCE_DATA_SET, {}).get('stats', {}).get('samples')
+        if reference_samples:
+            stats['bases_per_sample'] = REFERENCE_NUM_BASES / reference_samples
+    return stats
+
+
 def transform_samples_per_s(df: pd.DataFrame):
     df['samples_per_s'] = df['samples_per_s'].astype('float64')
     df = df.drop(df[df['samples_per_s'] < 1].index)
     return df
 
 
+def transform_output_stats(df: pd.DataFrame):
+    """
+    Convert the output statistics written by count_bases.py (see cdk_packages/assets/job_agent.py)
+    to numbers, NaN for jobs run before the output was counted.
+    """
+    for column in OUTPUT_STATS_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce') if column in df.columns else np.nan
+    return df
+
+
+def expand_throughput_series(df: pd.DataFrame):
+    """
+    Expand the throughput time series recorded while the jobs ran (see cdk_packages/assets/telemetry.py)
+    into one row per job and interval, e.g. to compare warm-up, steady state and tail of the jobs.
+
+    Returns:
+        series: dataframe with the job ID, the end of the interval in seconds since the basecaller
+            started ('t') and the rates of the interval
+
+    """
+    frames = []
+    if 'throughput_series' not in df.columns:
+        return pd.DataFrame(columns=['job_id', 't'])
+    for job_id, series in df[['job_id', 'throughput_series']].dropna().itertuples(index=False):
+        if not series:
+            continue
+        series = json.loads(series)
+        frames.append(pd.DataFrame(series['values'], columns=series['columns']).assign(job_id=job_id))
+    if not frames:
+        return pd.DataFrame(columns=['job_id', 't'])
+    series = pd.concat(frames, ignore_index=True)
+    return series[['job_id'] + [column for column in series.columns if column != 'job_id']]
+
+
 def transform_compute_environment(df: pd.DataFrame):
-    df['compute_environment'] = df['compute_environment'].apply(lambda instance_type: instance_type.replace('-', '.'))
+    df['compute_environment'] = df['compute_environment'].str.replace('-', '.', regex=False)
     return df
 
 
+def instance_specs_table(instance_specs: dict):
+    """
+    Flatten the nested instance specs into a table indexed by instance type. All per-instance
+    attributes, including the chart label, are derived once per instance type here so that the
+    transforms can join against this table instead of looking up the nested dict for every row.
+
+    Args:
+        instance_specs: instance specs as dict
+
+    Returns:
+        specs: instance specs as dataframe, indexed by instance type
+
+    """
+    specs = pd.DataFrame(
+        [
+            (
+                instance_type,
+                spec['GpuInfo']['Gpus'][0]['Count'],
+                spec['GpuInfo']['Gpus'][0]['Name'],
+                spec['GpuInfo']['Gpus'][0]['Manufacturer'],
+                spec['GpuInfo']['Gpus'][0]['MemoryInfo']['SizeInMiB'] // 1024,
+                spec['VCpuInfo']['DefaultVCpus'],
+                spec['MemoryInfo']['SizeInMiB'] // 1024,
+            )
+            for instance_type, spec in instance_specs.items()
+        ],
+        columns=['ec2_instance_type', 'num_gpus', 'gpu_name', 'gpu_manufacturer', 'gpu_mem_in_gib', 'vcpus',
+                 'memory_in_gib'],
+    ).set_index('ec2_instance_type')
+    specs['display_label'] = '<b>' + specs.index + '  </b><br>' \
+                             '<i>' + specs['num_gpus'].astype(str) + ' x ' + specs['gpu_name'] + ' ' + \
+                             specs['gpu_manufacturer'] + ' GPUs w/ ' + specs['gpu_mem_in_gib'].astype(str) + \
+                             ' GiB </i><br>' \
+                             '<i>' + specs['vcpus'].astype(str) + ' vCPUs, ' + specs['memory_in_gib'].astype(str) + \
+                             ' GiB RAM </i>'
+    return specs
+
+
+def pricing_table(aws_pricing: dict):
+    """
+    Flatten the nested pricing dict into a table with one row per region and instance type.
+    Missing or zero prices are represented as NaN.
+
+    Args:
+        aws_pricing: prices as returned by aws_pricing.get_pricing()
+
+    Returns:
+        prices: dataframe with the columns 'cost_region', 'ec2_instance_type' and 'cost_per_hour'
+
+    """
+    prices = pd.DataFrame(
+        [
+            (region, instance_type, price['cost_per_hour'] if price['cost_per_hour'] else None)
+            for region, instances in aws_pricing['instances'].items()
+            for instance_type, price in instances.items()
+        ],
+        columns=['cost_region', 'ec2_instance_type', 'cost_per_hour'],
+    )
+    prices['cost_per_hour'] = prices['cost_per_hour'].astype('float64')
+    return prices
+
+
 def add_basecaller_label(df: pd.DataFrame):
-    df[['basecaller']] = pd.DataFrame(
-        df.apply(lambda row: create_basecaller_label(row), axis=1).tolist(), index=df.index)
+    label = df['basecaller_name'].astype(str) + ' v' + df['basecaller_version'].astype(str)
+    # Results of early benchmark runs carry the label in the 'basecaller' column already.
+    df['basecaller'] = df['basecaller'].fillna(label) if 'basecaller' in df.columns else label
+    # Sweep experiments of the same basecaller with different settings, see experiment_catalog.py
+    if 'settings' in df.columns:
+        settings = df['settings'].fillna('').astype(str)
+        df['basecaller'] = df['basecaller'].where(settings == '', df['basecaller'] + ' (' + settings + ')')
     return df
 
 
-def add_data_set_id(df: pd.Series):
-    df[['data_set_id']] = pd.DataFrame(
-        df.apply(lambda row: create_data_set_id(row), axis=1).tolist(), index=df.index)
+def add_data_set_id(df: pd.DataFrame):
+    # Jobs submitted before data set IDs were introduced are grouped by the EC2 instance they ran on.
+    df['data_set_id'] = df['data_set_id'].fillna(df['ec2_instance_id'])
     return df
 
 
-def add_display_label(df: pd.Series, instance_specs: dict):
-    df[['display_label']] = pd.DataFrame(
-        df.apply(lambda row: create_y_label(row, instance_specs), axis=1).tolist(), index=df.index)
+def add_input_stats(df: pd.DataFrame, test_data_stats: dict):
+    """
+    Add the number of reads, signal samples and bytes of the test data shard each job basecalled,
+    NaN if the shard is not in the test data manifests.
+    """
+    shards = pd.DataFrame.from_dict(test_data_stats['shards'], orient='index') \
+        .reindex(columns=['reads', 'samples', 'bytes'])
+    directory = df['parameters'].astype(str).str.extract(SHARD_DIRECTORY_PATTERN, expand=False) \
+        if 'parameters' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    for column in ['reads', 'samples', 'bytes']:
+        df['input_' + column] = directory.map(shards[column]).astype('float64')
     return df
 
 
-def add_gpu_count(df: pd.Series, instance_specs: dict):
-    df.loc[:, 'num_gpus'] = df.apply(
-        lambda row: instance_specs[row.ec2_instance_type]['GpuInfo']['Gpus'][0]['Count'],
-        axis=1
-    )
+def add_display_label(df: pd.DataFrame, instance_specs: dict):
+    df['display_label'] = df['ec2_instance_type'].map(instance_specs_table(instance_specs)['display_label'])
+    return df
+
+
+def add_gpu_count(df: pd.DataFrame, instance_specs: dict):
+    df.loc[:, 'num_gpus'] = df['ec2_instance_type'].map(instance_specs_table(instance_specs)['num_gpus'])
     return df
 
 
 def calculate_runtimes(df: pd.DataFrame):
-    df['container_start_time'] = pd.to_datetime(df['container_start_time'])
-    df['container_end_time'] = pd.to_datetime(df['container_end_time'])
+    df['container_start_time'] = pd.to_datetime(df['container_start_time'], format='ISO8601')
+    df['container_end_time'] = pd.to_datetime(df['container_end_time'], format='ISO8601')
     df['container_run_time'] = df['container_end_time'] - df['container_start_time']
-    df['container_run_time_h'] = df['container_run_time'].apply(lambda delta: delta.total_seconds() / 3600)
+    df['container_run_time_h'] = df['container_run_time'].dt.total_seconds() / 3600
     return df
 
 
-def add_run_times(df: pd.DataFrame):
+def add_run_times(df: pd.DataFrame, bases_per_sample: float = None):
     """
     Add the estimated run times for 1 gigabase and 1 whole human genome at 30x coverage.
 
-    IMPORTANT: The runtime estimations are only accurate if the test runs were conducted
-    with the first 128 FAST5 files of the CliveOME 5mC dataset, flowcell ONLA29134. This
-    data set is downloaded as part of cdk_packages\assets\download_files.sh. For
-    information about the data set please see: https://labs.epi2me.io/cliveome_5mc_cfdna_celldna/.
+    The number of gigabases of a data set is the number of bases the jobs wrote ('output_bases',
+    see transform_output_stats()). For data sets run before the output was counted, it is
+    estimated from the number of signal samples the jobs basecalled ('input_samples', see
+    add_input_stats()) and the bases per sample of the reference data set, the first 128 FAST5
+    files of the CliveOME 5mC dataset, flowcell ONLA29134. This data set is downloaded as part of
+    cdk_packages\assets\download_files.sh. For information about the data set please see:
+    https://labs.epi2me.io/cliveome_5mc_cfdna_celldna/.
 
-    The number of gigabases was established by running the command below against the output
-    of the dorado basecaller:
-
-    gzip -cd /fsx/out/e2273a88-5f0a-4751-b819-0c0efc6c28a1/pass/fastq_runid_*.fastq.gz | paste - - - - | cut -f 2 | tr -d '\n' | wc -c
+    IMPORTANT: Without the number of samples, the runtime estimations are only accurate if the
+    test runs were conducted with the reference data set.
 
     """
 
-    num_bases = 18330576791  # number of bases in the first 128 FAST5 files
-    num_gigabases = num_bases / 1000000000
+    num_gigabases = pd.Series(REFERENCE_NUM_BASES / 1000000000, index=df.index)
+    if bases_per_sample and 'input_samples' in df.columns:
+        num_gigabases = (df['input_samples'] * bases_per_sample / 1000000000).fillna(num_gigabases)
+    if 'output_bases' in df.columns:
+        num_gigabases = (df['output_bases'] / 1000000000).fillna(num_gigabases)
     num_gigabases_whg_GRCh38_p14 = 3298912062 / 1000000000  # source: https://www.ncbi.nlm.nih.gov/grc/human/data
     num_gigabases_whg_30x_coverage = num_gigabases_whg_GRCh38_p14 * 30
 
-    temp1 = df.copy()
-    temp2 = df.copy()
-
-    temp1[['runtime_type', 'runtime_h']] = df.apply(
-        lambda row: ('per gigabase', row.container_run_time_h / num_gigabases),
-        axis=1, result_type='expand'
+    per_gigabase = df.assign(
+        runtime_type='per gigabase',
+        runtime_h=df['container_run_time_h'] / num_gigabases,
     )
-    temp2[['runtime_type', 'runtime_h']] = df.apply(
-        lambda row: ('per WHG 30x', row.container_run_time_h * (num_gigabases_whg_30x_coverage / num_gigabases)),
-        axis=1, result_type='expand'
+    per_whg_30x = df.assign(
+        runtime_type='per WHG 30x',
+        runtime_h=df['container_run_time_h'] * (num_gigabases_whg_30x_coverage / num_gigabases),
     )
 
-    df = pd.concat([temp1, temp2], ignore_index=True)
+    df = pd.concat([per_gigabase, per_whg_30x], ignore_index=True)
+    df['num_gigabases'] = pd.concat([num_gigabases, num_gigabases], ignore_index=True)
 
     return df
 
@@ -195,8 +399,10 @@ def check_consistency(df: pd.DataFrame, instance_specs: dict):
     Do consistency check.
     """
     # Find the completed test runs with failed batch jobs.
-    df['status_succeeded'] = df[(df['status'] == 'succeeded')]['status']
-    df['status_failed'] = df[(df['status'] == 'failed')]['status']
+    df = df.assign(
+        status_succeeded=df[(df['status'] == 'succeeded')]['status'],
+        status_failed=df[(df['status'] == 'failed')]['status'],
+    )
     df = df[(df['status'] == 'succeeded') | (df['status'] == 'failed')] \
         .groupby(['compute_environment', 'data_set_id', 'tags', 'num_gpus']) \
         .agg({'status_succeeded': 'count', 'status_failed': 'count'}) \
@@ -213,67 +419,51 @@ def check_consistency(df: pd.DataFrame, instance_specs: dict):
 
 
 def aggregate_samples_per_s_runtime(df: pd.DataFrame):
+    aggregations = {'samples_per_s': 'sum', 'container_run_time_h': 'mean'}
+    if 'tags' in df.columns:
+        # one data set is run with one set of tags
+        aggregations['tags'] = 'first'
+    if 'spot_cost_per_hour' in df.columns:
+        aggregations.update({'spot_cost_per_hour': 'mean', 'spot_region': 'first'})
+    for column in ['input_reads', 'input_samples', 'input_bytes', 'output_reads', 'output_bases']:
+        if column in df.columns:
+            # NaN if the shard or output of any job of the data set is unknown
+            aggregations[column] = sum_if_complete
+    if 'bases_per_s' in df.columns:
+        aggregations.update({'bases_per_s': sum_if_complete, 'mean_qscore': 'mean'})
     df = df[df['status'] == 'succeeded'] \
         .groupby(['modified_bases', 'compute_environment', 'ec2_instance_id', 'ec2_instance_type', 'num_gpus', 'data_set_id', 'basecaller']) \
-        .agg({'samples_per_s': 'sum', 'container_run_time_h': 'mean'}) \
+        .agg(aggregations) \
         .reset_index()
     return df
 
 
-def create_y_label(row: pd.Series, instance_specs: dict):
-    instance_type = row.ec2_instance_type
-    gpu_count = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['Count']
-    gpu_name = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['Name']
-    gpu_manufacturer = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['Manufacturer']
-    gpu_mem_in_gib = instance_specs[instance_type]['GpuInfo']['Gpus'][0]['MemoryInfo']['SizeInMiB'] // 1024
-    vcpus = instance_specs[instance_type]['VCpuInfo']['DefaultVCpus']
-    memory_in_gib = instance_specs[instance_type]['MemoryInfo']['SizeInMiB'] // 1024
-    label_text = f'<b>{instance_type}  </b><br>' \
-                 f'<i>{gpu_count} x {gpu_name} {gpu_manufacturer} GPUs w/ {gpu_mem_in_gib} GiB </i><br>' \
-                 f'<i>{vcpus} vCPUs, {memory_in_gib} GiB RAM </i>'
-    return label_text
-
-
-def create_basecaller_label(row: pd.Series):
-    if 'basecaller' not in row.keys():
-        basecaller = f'{row.basecaller_name} v{row.basecaller_version}'
-    else:
-        basecaller = row.basecaller
-    return basecaller
-
-
-def create_data_set_id(row: pd.Series):
-    data_set_id = row.data_set_id
-    if row.isna().data_set_id:
-        data_set_id = row.ec2_instance_id
-    return data_set_id
+def sum_if_complete(s: pd.Series):
+    return s.sum(min_count=len(s))
 
 
 def add_cost(df: pd.DataFrame, aws_pricing: dict):
     """
-    Add cost information to the dataframe.
+    Add cost information to the dataframe. Each row is repeated once per pricing region.
+    If the dataframe has the effective spot price of the runs in 'spot_cost_per_hour', the
+    spot cost is added in the rows of the region the runs were made in.
     """
-    cost = pd.DataFrame()
-    for region in aws_pricing['instances'].keys():
-        temp = df.copy()
-        temp[['cost_region', 'cost_per_hour']] = df.apply(
-            lambda row: (
-                region,
-                aws_pricing['instances'][region][row['ec2_instance_type']]['cost_per_hour']
-                if aws_pricing['instances'][region][row['ec2_instance_type']]['cost_per_hour'] else None
-            ), axis=1, result_type='expand'
-        )
-        temp['cost_per_gigabase'] = temp[temp['runtime_type'] == 'per gigabase'].apply(
-            lambda row: (
-                row['cost_per_hour'] * row['runtime_h'] if row['cost_per_hour'] else None
-            ), axis=1, result_type='expand'
-        )
-        temp['cost_per_whg_30x'] = temp[temp['runtime_type'] == 'per WHG 30x'].apply(
-            lambda row: (
-                row['cost_per_hour'] * row['runtime_h'] if row['cost_per_hour'] else None
-            ), axis=1, result_type='expand'
-        )
-        cost = pd.concat([cost, temp], ignore_index=True)
+    regions = list(aws_pricing['instances'].keys())
+    prices = pricing_table(aws_pricing).pivot(index='ec2_instance_type', columns='cost_region', values='cost_per_hour') \
+        .reindex(columns=regions)
+    cost = pd.concat([df] * len(regions), ignore_index=True)
+    cost['cost_region'] = np.repeat(regions, len(df))
+    cost['cost_per_hour'] = np.concatenate([
+        df['ec2_instance_type'].map(prices[region]).to_numpy(dtype='float64') for region in regions
+    ])
+    runtime_cost = cost['cost_per_hour'] * cost['runtime_h']
+    cost['cost_per_gigabase'] = runtime_cost.where(cost['runtime_type'] == 'per gigabase')
+    cost['cost_per_whg_30x'] = runtime_cost.where(cost['runtime_type'] == 'per WHG 30x')
+    if 'spot_cost_per_hour' in cost.columns:
+        cost['spot_cost_per_hour'] = cost['spot_cost_per_hour'].where(cost['cost_region'] == cost['spot_region'])
+        spot_runtime_cost = cost['spot_cost_per_hour'] * cost['runtime_h']
+        cost['spot_cost_per_gigabase'] = spot_runtime_cost.where(cost['runtime_type'] == 'per gigabase')
+        cost['spot_cost_per_whg_30x'] = spot_runtime_cost.where(cost['runtime_type'] == 'per WHG 30x')
     return cost
 
 
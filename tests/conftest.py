@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The scripts in results/ and create_jobs/ import their packages relative to their directory.
+sys.path.insert(0, os.path.join(ROOT, 'results'))
+sys.path.insert(0, os.path.join(ROOT, 'create_jobs'))
+# Scripts run on the downloader instance
+sys.path.insert(0, os.path.join(ROOT, 'cdk_packages', 'assets'))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+import aws_pricing.aws_pricing as aws_pricing
+
+OFFER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ec2_offer_file_us-west-2.csv')
+
+
+class PricingApiUnavailable:
+
+    def get_products(self, **kwargs):
+        raise AssertionError('The AWS Pricing API must not be called in offline mode.')
+
+
+class PricingApi:
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get_products(self, ServiceCode, Filters):
+        time.sleep(self.delay)
+        values = {f['Field']: f['Value'] for f in Filters}
+        with self.lock:
+            self.requests.append((values['location'], values['instanceType']))
+        price_list = {'terms': {'OnDemand': {'sku': {'priceDimensions': {'dimension': {'pricePerUnit': {
+            'USD': '2.5' if values['instanceType'] == 'g5.xlarge' else '1.0'}}}}}}}
+        return {'PriceList': [json.dumps(price_list)], 'ResponseMetadata': {}}
+
+
+def fetched(hours_ago):
+    return (datetime.datetime.now() - datetime.timedelta(hours=hours_ago)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def write_pricing_file(content):
+    with open(aws_pricing.PRICING_FILE_NAME, 'w') as f:
+        json.dump(content, f)
+
+
+def test_only_missing_and_expired_prices_are_requested(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = PricingApi()
+    monkeypatch.setattr(aws_pricing, 'client_pricing', api)
+    recent = fetched(1)
+    write_pricing_file({'currency': 'USD', 'entries': {
+        'us-west-2|g4dn.xlarge|Linux': {'cost_per_hour': 0.5, 'fetched': recent},
+        'us-west-2|g5.xlarge|Linux': {'cost_per_hour': 1.0, 'fetched': fetched(48)},
+    }})
+    prices = aws_pricing.get_pricing(['g4dn.xlarge', 'g5.xlarge', 'p3.2xlarge'], regions=['us-west-2'])
+
+    assert sorted(instance for _, instance in api.requests) == ['g5.xlarge', 'p3.2xlarge']
+    assert prices['instances']['us-west-2'] == {
+        'g4dn.xlarge': {'cost_per_hour': 0.5},
+        'g5.xlarge': {'cost_per_hour': 2.5},
+        'p3.2xlarge': {'cost_per_hour': 1.0},
+    }
+    assert prices['price_list_date'] == recent
+    # all prices are cached now
+    aws_pricing.get_pricing(['g4dn.xlarge', 'g5.xlarge', 'p3.2xlarge'], regions=['us-west-2'])
+    assert len(api.requests) == 2
+
+
+def test_pricing_file_of_earlier_versions_is_migrated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = PricingApi()
+    monkeypatch.setattr(aws_pricing, 'client_pricing', api)
+    price_list_date = fetched(2)
+    write_pricing_file({'price_list_date': price_list_date, 'currency': 'USD', 'instances': {
+        'us-west-2': {'g4dn.xlarge': {'cost_per_hour': '0.526'}},
+    }})
+    prices = aws_pricing.get_pricing(['g4dn.xlarge', 'g5.xlarge'], regions=['us-west-2'])
+
+    assert api.requests == [('US West (Oregon)', 'g5.xlarge')]
+    assert prices['instances']['us-west-2']['g4dn.xlarge'] == {'cost_per_hour': 0.526}
+    with open(aws_pricing.PRICING_FILE_NAME, 'r') as f:
+        cache = json.load(f)
+    assert cache['entries']['us-west-2|g4dn.xlarge|Linux'] == {'cost_per_hour': 0.526, 'fetched': price_list_date}
+    assert 'instances' not in cache
+
+
+def test_concurrent_runs_request_each_price_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = PricingApi(delay=0.2)
+    monkeypatch.setattr(aws_pricing, 'client_pricing', api)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(aws_pricing.get_pricing(['g5.xlarge'], regions=['us-west-2'])))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert api.requests == [('US West (Oregon)', 'g5.xlarge')]
+    assert results[0] == results[1]
+
+
+def test_pricing_file_lock_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    class Msvcrt:
+        LK_LOCK, LK_UNLCK = 1, 0
+
+        def locking(self, fd, mode, nbytes):
+            calls.append(mode)
+            if len(calls) == 1:
+                raise OSError('Resource deadlock avoided')
+
+    monkeypatch.setattr(aws_pricing, 'fcntl', None)
+    monkeypatch.setattr(aws_pricing, 'msvcrt', Msvcrt(), raising=False)
+    with aws_pricing.pricing_file_lock():
+        assert calls == [Msvcrt.LK_LOCK, Msvcrt.LK_LOCK]
+    assert calls[-1] == Msvcrt.LK_UNLCK
+
+
+def test_load_offer_file():
+    index = aws_pricing.load_offer_file(OFFER_FILE)
+    assert index == {
+        'us-west-2|g4dn.xlarge|Linux': {'cost_per_hour': 0.526, 'fetched': '2024-03-04 21:35:02'},
+        'us-west-2|g5.xlarge|Linux': {'cost_per_hour': 1.006, 'fetched': '2024-03-04 21:35:02'},
+        'us-west-2|p3.2xlarge|Linux': {'cost_per_hour': 3.06, 'fetched': '2024-03-04 21:35:02'},
+        'us-west-2|g4dn.xlarge|Windows': {'cost_per_hour': 0.71, 'fetched': '2024-03-04 21:35:02'},
+    }
+
+
+def test_load_offer_file_gzip(tmp_path):
+    file_name = str(tmp_path / 'index.csv.gz')
+    with open(OFFER_FILE, 'rb') as f_in, gzip.open(file_name, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    assert aws_pricing.load_offer_file(file_name) == aws_pricing.load_offer_file(OFFER_FILE)
+
+
+def test_get_pricing_offline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(aws_pricing, 'client_pricing', PricingApiUnavailable())
+    prices = aws_pricing.get_pricing(['g4dn.xlarge', 'g5.xlarge', 'g5.48xlarge'], regions=['us-west-2', 'us-east-1'],
+                                     offer_files=[OFFER_FILE])
+    assert prices['price_list_date'] == '2024-03-04 21:35:02'
+    assert prices['instances']['us-west-2'] == {
+        'g4dn.xlarge': {'cost_per_hour': 0.526},
+        'g5.xlarge': {'cost_per_hour': 1.006},
+        'g5.48xlarge': {'cost_per_hour': None},
+    }
+    # no offer file for us-east-1
+    assert all(price['cost_per_hour'] is None for price in prices['instances']['us-east-1'].values())
+    assert not os.path.exists(aws_pricing.PRICING_FILE_NAME)
+
+
+def test_load_offer_file_without_header(tmp_path):
+    file_name = tmp_path / 'index.csv'
+    file_name.write_text('"FormatVersion","v1.0"\n')
+    with pytest.raises(ValueError):
+        aws_pricing.load_offer_file(str(file_name))
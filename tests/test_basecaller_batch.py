@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import boto3
+import pytest
+from moto import mock_aws
+
+INSTANCE_TYPES = {
+    'g5.12xlarge': {
+        'VCpuInfo': {'DefaultVCpus': 48},
+        'GpuInfo': {'Gpus': [{'Count': 4}]},
+        'MemoryInfo': {'SizeInMiB': 196608},
+        'ProvisioningModel': {'EC2': 'g5-12xlarge-queue', 'SPOT': 'g5-12xlarge-spot-queue'},
+    },
+}
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def basecaller_batch(aws, monkeypatch):
+    import basecaller_batch.basecaller_batch as basecaller_batch
+    monkeypatch.setattr(basecaller_batch, 'batch_client', boto3.client('batch'))
+    return basecaller_batch
+
+
+def make_batch(basecaller_batch):
+    # BasecallerBatch() loads the instance types and the test data manifest from S3.
+    batch = basecaller_batch.BasecallerBatch.__new__(basecaller_batch.BasecallerBatch)
+    batch.instance_types = INSTANCE_TYPES
+    batch.job_definitions = None
+    return batch
+
+
+def test_job_definitions_are_reused_by_content_hash(basecaller_batch, monkeypatch):
+    batch = make_batch(basecaller_batch)
+    image = basecaller_batch.BASECALLER_DORADO_0_5_3
+    arn = batch.get_job_definition_arn('g5.12xlarge', 'EC2', image)
+
+    registered = []
+    register_job_definition = basecaller_batch.batch_client.register_job_definition
+    monkeypatch.setattr(basecaller_batch.batch_client, 'register_job_definition',
+                        lambda **kwargs: registered.append(kwargs) or register_job_definition(**kwargs))
+    # A new run finds the job definition by its content hash tag instead of registering it again.
+    batch = make_batch(basecaller_batch)
+    assert batch.get_job_definition_arn('g5.12xlarge', 'EC2', image) == arn
+    assert batch.get_job_definition_arn('g5.12xlarge', 'EC2', image) == arn
+    assert registered == []
+
+    # Other container properties are a different job definition.
+    other_arn = batch.get_job_definition_arn('g5.12xlarge', 'EC2', basecaller_batch.BASECALLER_DORADO_0_3_0)
+    assert other_arn != arn
+    assert len(registered) == 1
+    content_hash = registered[0]['tags'][basecaller_batch.JOB_DEFINITION_HASH_TAG]
+    assert content_hash == basecaller_batch.job_definition_hash(
+        registered[0]['jobDefinitionName'], batch.make_container_properties('g5.12xlarge',
+                                                                            basecaller_batch.BASECALLER_DORADO_0_3_0)
+    )
+    assert set(basecaller_batch.get_job_definitions()) == set(batch.job_definitions)
+    assert content_hash in batch.job_definitions
+
+
+def test_container_properties_are_not_shared_between_job_definitions(basecaller_batch):
+    batch = make_batch(basecaller_batch)
+    properties = batch.make_container_properties('g5.12xlarge', basecaller_batch.BASECALLER_DORADO_0_5_3)
+    properties['resourceRequirements'][0]['value'] = '1'
+    assert batch.make_container_properties('g5.12xlarge', basecaller_batch.BASECALLER_DORADO_0_5_3) != properties
+    assert basecaller_batch.CONTAINER_PROPERTIES_TEMPLATE['image'] == ''
+
+
+class FakeTestData:
+
+    def resolve_shard_policy(self, policy):
+        return policy or 'samples'
+
+    def get_subset(self, data_set, num_chunks, policy):
+        return [f'/fsx/pod5-subsets/{data_set}_{num_chunks}_{i}.lst' for i in range(num_chunks)], None
+
+
+def submitted_jobs(basecaller_batch, batch, jobs, monkeypatch):
+    calls = []
+    monkeypatch.setattr(basecaller_batch.batch_client, 'submit_job',
+                        lambda **kwargs: calls.append(kwargs) or {'jobId': f'job-{len(calls)}'})
+    for job in jobs:
+        batch.submit_planned_job(job)
+    return calls
+
+
+def environment(call):
+    return {variable['name']: variable['value'] for variable in call['containerOverrides']['environment']}
+
+
+@pytest.mark.parametrize('num_shards', [None, 3])
+def test_array_job_has_one_child_job_per_shard(basecaller_batch, monkeypatch, num_shards):
+    batch = make_batch(basecaller_batch)
+    batch.test_data = FakeTestData()
+    compute = [{'instance_type': 'g5.12xlarge', 'provisioning_model': 'EC2'}]
+    jobs = batch.plan_batch_jobs(compute, cmd='dorado basecaller model $file_list', tags='dorado', array_job=True,
+                                 num_shards=num_shards)
+
+    # one child job per GPU by default
+    expected_shards = num_shards or 4
+    assert len(jobs) == 1
+    assert jobs[0]['basecaller_params'] == f'dorado basecaller model {basecaller_batch.ARRAY_FILE_LIST_PLACEHOLDER}'
+    [call] = submitted_jobs(basecaller_batch, batch, jobs, monkeypatch)
+    assert call['arrayProperties'] == {'size': expected_shards}
+    file_lists = environment(call)['FILE_LISTS'].split()
+    assert file_lists == [f'/fsx/pod5-subsets/wgs_subset_128_files_{expected_shards}_{i}.lst'
+                          for i in range(expected_shards)]
+
+
+def test_single_shard_array_job_is_submitted_as_plain_job(basecaller_batch, monkeypatch):
+    batch = make_batch(basecaller_batch)
+    batch.test_data = FakeTestData()
+    compute = [{'instance_type': 'g5.12xlarge', 'provisioning_model': 'SPOT'}]
+    jobs = batch.plan_batch_jobs(compute, cmd='dorado basecaller model $file_list', tags='dorado', array_job=True,
+                                 num_shards=1)
+
+    [call] = submitted_jobs(basecaller_batch, batch, jobs, monkeypatch)
+    assert 'arrayProperties' not in call
+    assert call['jobQueue'] == 'g5-12xlarge-spot-queue'
+    assert environment(call)['FILE_LISTS'] == '/fsx/pod5-subsets/wgs_subset_128_files_1_0.lst'
+
+
+def test_job_keys_include_image_and_test_data(basecaller_batch):
+    batch = make_batch(basecaller_batch)
+    batch.test_data = FakeTestData()
+    compute = [{'instance_type': 'g5.12xlarge', 'provisioning_model': 'EC2'}]
+    plans = [
+        {},
+        {'container': basecaller_batch.BASECALLER_DORADO_0_3_0},
+        {'data_set': 'wgs_subset_8_files'},
+        {'num_shards': 2},
+        {'shard_policy': 'count'},
+    ]
+    keys = [
+        batch.plan_batch_jobs(compute, cmd='dorado $file_list', tags='dorado', array_job=True, **plan)[0]['key']
+        for plan in plans
+    ]
+    assert len(set(keys)) == len(plans)
+    assert all(key[-1] == 'array' for key in keys)
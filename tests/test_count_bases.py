@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import shutil
+
+import pytest
+
+import count_bases
+
+
+def write_fastq(file_name, reads):
+    with gzip.open(file_name, 'wt') as f:
+        for no, (sequence, qualities) in enumerate(reads):
+            f.write(f'@read{no} runid=a5e7a202\n{sequence}\n+\n{qualities}\n')
+
+
+@pytest.mark.skipif(shutil.which('gzip') is None, reason='gzip not installed')
+def test_count_bases_fastq(tmp_path):
+    (tmp_path / 'pass').mkdir()
+    (tmp_path / 'fail').mkdir()
+    # Q-scores 10 and 20 ('+' and '5')
+    write_fastq(str(tmp_path / 'pass' / 'fastq_runid_0.fastq.gz'), [('A' * 100, '+' * 100), ('C' * 400, '5' * 400)])
+    write_fastq(str(tmp_path / 'fail' / 'fastq_runid_0.fastq.gz'), [('G' * 200, '5' * 200)])
+
+    stats = count_bases.count_bases(str(tmp_path), seconds=10, max_workers=1)
+
+    assert stats['output_format'] == 'fastq'
+    assert (stats['output_files'], stats['output_reads'], stats['output_bases']) == (2, 3, 700)
+    assert stats['mean_qscore'] == pytest.approx((10 + 20 + 20) / 3, abs=0.01)
+    assert stats['read_n50'] == 400
+    assert stats['bases_per_s'] == 70
+
+
+def test_n50():
+    assert count_bases.n50({10: 1, 5: 2, 1: 4}) == 5
+    assert count_bases.n50({}) == 0
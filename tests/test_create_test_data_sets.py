@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import create_test_data_sets
+
+
+def test_balance_shards():
+    shards = create_test_data_sets.balance_shards([10, 1, 7, 3, 5, 4], num_chunks=2)
+    assert shards == [[0, 1, 5], [2, 3, 4]]
+    assert create_test_data_sets.balance_shards([1, 2], num_chunks=4) == [[1], [0], [], []]
+
+
+def test_chunk_file_list_balances_samples():
+    rng = np.random.default_rng(0)
+    files = pd.DataFrame({
+        'file': [f'PAM63974_pass_a5e7a202_{no}.pod5' for no in range(128)],
+        'size': rng.lognormal(20, 0.6, 128).astype(int),
+        'samples': rng.lognormal(22, 0.6, 128).astype(int),
+    })
+    chunks = create_test_data_sets.chunk_file_list(files, num_chunks=8)
+    assert sorted(pd.concat(chunks)['file']) == sorted(files['file'])
+    balanced = create_test_data_sets.imbalance_ratio([chunk['samples'].sum() for chunk in chunks])
+    by_count = create_test_data_sets.imbalance_ratio([
+        files['samples'].iloc[positions].sum() for positions in np.array_split(np.arange(len(files)), 8)
+    ])
+    assert balanced < 1.01 < by_count
+    # the files of each shard stay in order
+    assert all(chunk.index.is_monotonic_increasing for chunk in chunks)
+
+
+def write_pod5(file_name, num_samples):
+    pod5 = pytest.importorskip('pod5')
+    run_info = pod5.RunInfo(
+        acquisition_id='a5e7a202', acquisition_start_time=datetime.datetime(2022, 5, 10), adc_max=2047, adc_min=-2048,
+        context_tags={}, experiment_name='', flow_cell_id='PAM63974', flow_cell_product_code='FLO-PRO114M',
+        protocol_name='', protocol_run_id='', protocol_start_time=datetime.datetime(2022, 5, 10), sample_id='',
+        sample_rate=5000, sequencing_kit='SQK-LSK114', sequencer_position='5H', sequencer_position_type='promethion',
+        software='', system_name='', system_type='', tracking_id={},
+    )
+    read_ids = [uuid.uuid4() for _ in num_samples]
+    with pod5.Writer(file_name) as writer:
+        for read_number, (read_id, samples) in enumerate(zip(read_ids, num_samples)):
+            writer.add_read(pod5.Read(
+                read_id=read_id, pore=pod5.Pore(1, 1, 'not_set'), calibration=pod5.Calibration(0.0, 1.0),
+                read_number=read_number, start_sample=0, median_before=0.0,
+                end_reason=pod5.EndReason(pod5.EndReasonEnum.SIGNAL_POSITIVE, False), run_info=run_info,
+                signal=np.zeros(samples, dtype=np.int16),
+            ))
+    return [str(read_id) for read_id in read_ids]
+
+
+def test_read_index_and_read_shards(tmp_path):
+    data_path = tmp_path / 'pod5-all-files'
+    data_path.mkdir()
+    rng = np.random.default_rng(0)
+    read_ids = []
+    # one large file and three small files
+    for no, num_reads in enumerate([40, 5, 5, 5]):
+        read_ids += write_pod5(str(data_path / f'PAM63974_pass_a5e7a202_{no}.pod5'),
+                               rng.integers(1000, 5000, num_reads).tolist())
+    index_file_name = str(tmp_path / 'pod5-index' / 'read_index.parquet')
+    index = create_test_data_sets.build_read_index(str(data_path), index_file_name, max_workers=1)
+    assert sorted(index['read_id']) == sorted(read_ids)
+    assert index.groupby('file')['row'].max().tolist() == [39, 4, 4, 4]
+    # unchanged files are not indexed again
+    pd.testing.assert_frame_equal(create_test_data_sets.build_read_index(str(data_path), index_file_name), index)
+
+    shards = create_test_data_sets.shard_reads(index, num_chunks=8)
+    loads = [shard['num_samples'].sum() for shard in shards]
+    assert sorted(pd.concat(shards)['read_id']) == sorted(read_ids)
+    assert max(loads) - min(loads) <= 2 * index['num_samples'].max()
+    # the large file is split across shards
+    assert sum(shard['file'].str.endswith('_0.pod5').any() for shard in shards) > 1
+
+    subset_path = str(tmp_path / 'pod5-subsets')
+    layout = {
+        create_test_data_sets.shard_path('reads_8_${idx}.lst', idx, subset_path): {
+            'files': shard['file'].unique().tolist(), 'read_ids': shard['read_id'].tolist()
+        }
+        for idx, shard in enumerate(shards)
+    }
+    create_test_data_sets.sync_layout(layout, data_path=str(data_path))
+    directory = create_test_data_sets.shard_path('reads_8_0.lst', 0, subset_path)
+    with open(directory + create_test_data_sets.READ_IDS_SUFFIX) as f:
+        assert f.read().split() == shards[0]['read_id'].tolist()
+    assert sorted(os.listdir(directory)) == sorted(shards[0]['file'].unique())
+
+
+def test_sync_layout_is_incremental(tmp_path, capsys):
+    data_path, subset_path = str(tmp_path / 'pod5-all-files'), str(tmp_path / 'pod5-subsets')
+    layout = {
+        os.path.join(subset_path, 'set_2_0.lst'): {'files': ['a.pod5', 'b.pod5']},
+        os.path.join(subset_path, 'set_2_1.lst'): {'files': ['c.pod5']},
+    }
+    hashes = create_test_data_sets.sync_layout(layout, data_path=data_path)
+    assert os.readlink(os.path.join(subset_path, 'set_2_0.lst', 'b.pod5')) == os.path.join(data_path, 'b.pod5')
+    capsys.readouterr()
+
+    # nothing changed, nothing is touched
+    assert create_test_data_sets.sync_layout(layout, hashes, data_path=data_path) == hashes
+    assert '0 updated, 0 removed, 0 symlinks created, 0 removed' in capsys.readouterr().out
+
+    # move a file to another shard and drop a shard
+    layout = {os.path.join(subset_path, 'set_2_0.lst'): {'files': ['a.pod5', 'c.pod5']}}
+    create_test_data_sets.sync_layout(layout, hashes, data_path=data_path)
+    assert '1 updated, 1 removed, 1 symlinks created, 2 removed' in capsys.readouterr().out
+    assert sorted(os.listdir(subset_path)) == ['set_2_0.lst']
+    assert sorted(os.listdir(os.path.join(subset_path, 'set_2_0.lst'))) == ['a.pod5', 'c.pod5']
+
+
+def test_file_and_shard_stats(tmp_path):
+    data_path = tmp_path / 'pod5-all-files'
+    data_path.mkdir()
+    num_samples = [[1000, 2000, 3000], [500, 500]]
+    read_ids = [[str(uuid.uuid4()) for _ in samples] for samples in num_samples]
+    index = []
+    for no, (samples, ids) in enumerate(zip(num_samples, read_ids)):
+        file_name = f'PAM63974_pass_a5e7a202_{no}.pod5'
+        (data_path / file_name).write_bytes(bytes(sum(samples)))
+        index.append(pd.DataFrame({'read_id': ids, 'file': file_name, 'num_samples': samples}))
+    read_index = pd.concat(index, ignore_index=True)
+    stats = create_test_data_sets.get_file_stats(str(data_path), read_index=read_index, max_workers=1)
+    assert [(entry['reads'], entry['samples']) for entry in stats.values()] == [(3, 6000), (2, 1000)]
+    assert all(entry['checksum'].startswith('sha256:') for entry in stats.values())
+    # unchanged files are not read again
+    cached = {f: dict(entry, checksum='sha256:cached') for f, entry in stats.items()}
+    assert create_test_data_sets.get_file_stats(str(data_path), previous=cached, read_index=read_index) == cached
+    assert all(entry['reads'] is None for entry in create_test_data_sets.get_file_stats(str(data_path)).values())
+
+    files = list(stats)
+    shard = create_test_data_sets.shard_stats(files, stats)
+    assert (shard['reads'], shard['samples'], shard['bytes']) == (5, 7000, sum(e['bytes'] for e in stats.values()))
+    reads = pd.DataFrame({'read_id': read_ids[0][:2], 'file': files[0], 'num_samples': [1000, 2000]})
+    read_shard = create_test_data_sets.shard_stats([files[0]], stats, reads=reads)
+    assert (read_shard['reads'], read_shard['samples']) == (2, 3000)
+    assert read_shard['bytes'] == int(stats[files[0]]['bytes'] / 2)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import importlib
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import results_store.results_store as results_store
+
+TABLE_NAME = 'reports-table'
+
+
+def put_job(table, job_id, status, end_time=None):
+    item = {
+        'job_id': job_id,
+        'data_set_id': 'data-set-1',
+        'container_start_time': '2024-03-01T10:00:00+00:00',
+        'status': status,
+        'tags': 'dorado v0.5.3, no modified bases',
+        'job_attempts': 1,
+    }
+    if end_time:
+        item['container_end_time'] = end_time
+        item['samples_per_s'] = '1.5e+07'
+    table.put_item(Item=item)
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def dynamodb_sync(aws, monkeypatch):
+    module = importlib.import_module('dynamodb_sync.dynamodb_sync')
+    monkeypatch.setattr(module, 'client_dynamodb', boto3.client('dynamodb'))
+    return module
+
+
+@pytest.fixture
+def table(aws):
+    return boto3.resource('dynamodb').create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST',
+    )
+
+
+def test_sync_merges_only_new_and_changed_items(dynamodb_sync, table, tmp_path):
+    path = str(tmp_path / 'store')
+    for i in range(20):
+        put_job(table, f'old-{i}', 'succeeded', end_time='2024-03-01T11:00:00+00:00')
+    put_job(table, 'running', 'started')
+
+    df = dynamodb_sync.sync(TABLE_NAME, path=path, total_segments=4, max_workers=4)
+    assert len(df) == 21
+    assert len(results_store.read(path)) == 21
+
+    put_job(table, 'new', 'succeeded', end_time='2024-03-02T09:00:00+00:00')
+    put_job(table, 'running', 'failed', end_time='2024-03-02T09:30:00+00:00')
+    df = dynamodb_sync.sync(TABLE_NAME, path=path, total_segments=4, max_workers=4)
+    assert sorted(df['job_id']) == ['new', 'running']
+
+    stored = results_store.read(path).set_index('job_id')
+    assert len(stored) == 22
+    assert stored.loc['running', 'status'] == 'failed'
+    assert stored.loc['new', 'job_attempts'] == 1
+
+    df = dynamodb_sync.sync(TABLE_NAME, path=path)
+    assert df.empty
+    state = results_store.load_metadata(path)['sync'][TABLE_NAME]
+    assert state['high_water_mark'] == '2024-03-02T09:30:00+00:00'
+    # items of jobs that finished before the look-back window are not tracked anymore
+    assert sorted(state['seen']) == ['new', 'running']
+
+
+def test_full_sync_scans_all_items(dynamodb_sync, table, tmp_path):
+    path = str(tmp_path / 'store')
+    for i in range(5):
+        put_job(table, f'job-{i}', 'succeeded', end_time='2024-03-01T11:00:00+00:00')
+    dynamodb_sync.sync(TABLE_NAME, path=path)
+    assert len(dynamodb_sync.sync(TABLE_NAME, path=path, full=True)) == 5
+
+
+def test_items_updated_after_the_job_finished_are_merged_again(dynamodb_sync, table, tmp_path):
+    path = str(tmp_path / 'store')
+    put_job(table, 'job', 'succeeded', end_time='2024-03-01T11:00:00+00:00')
+    dynamodb_sync.sync(TABLE_NAME, path=path)
+
+    table.update_item(Key={'job_id': 'job'}, UpdateExpression='SET job_attempts = :attempts',
+                      ExpressionAttributeValues={':attempts': 2})
+    df = dynamodb_sync.sync(TABLE_NAME, path=path)
+    assert list(df['job_id']) == ['job']
+    assert results_store.read(path).set_index('job_id').loc['job', 'job_attempts'] == 2
+    assert dynamodb_sync.sync(TABLE_NAME, path=path).empty
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import boto3
+from moto import mock_aws
+
+import job_agent
+
+TABLE_NAME = 'reports-table'
+
+
+def test_select_file_list_and_build_command(tmp_path):
+    environ = {
+        'AWS_BATCH_JOB_ID': 'b5d1c0a2:1',
+        'AWS_BATCH_JOB_ARRAY_INDEX': '1',
+        'FILE_LISTS': '/fsx/pod5-subsets/set_2_0.lst /fsx/pod5-subsets/set_2_1.lst',
+    }
+    cmd_line, file_list, array_job_id, array_index = job_agent.select_file_list(
+        'dorado basecaller model &file_list&/ | samtools view -o /fsx/out/&job_id&/calls.bam', environ
+    )
+    assert (file_list, array_job_id, array_index) == ('/fsx/pod5-subsets/set_2_1.lst', 'b5d1c0a2', '1')
+    command, cmd_line = job_agent.build_command(cmd_line, 'b5d1c0a2:1', output_path=str(tmp_path))
+    assert command == 'dorado'
+    assert cmd_line == \
+        'dorado basecaller model /fsx/pod5-subsets/set_2_1.lst/ | samtools view -o /fsx/out/b5d1c0a2:1/calls.bam'
+    assert (tmp_path / 'b5d1c0a2:1').is_dir()
+
+    command, cmd_line = job_agent.build_command('guppy_basecaller --save_path /fsx/out/ --bam_out', 'job-1')
+    assert cmd_line == 'guppy_basecaller --save_path /fsx/out/job-1/ --bam_out'
+
+
+def test_parse_metrics():
+    log = 'selected batchsize 448\n...\nReads basecalled: 1024\nBasecalled @ Samples/s: 1.234567e+07\n'
+    assert job_agent.parse_metrics('dorado', log) == {
+        'selected_batch_size': '448', 'reads_basecalled': '1024', 'samples_per_s': '1.234567e+07'
+    }
+    assert job_agent.parse_metrics('guppy_basecaller', log)['samples_per_s'] == ''
+
+
+def test_write_item_keeps_later_attempt(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        client = boto3.client('dynamodb')
+        client.create_table(
+            TableName=TABLE_NAME, BillingMode='PAY_PER_REQUEST',
+            KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+        )
+        assert job_agent.write_item(client, TABLE_NAME, 'job-1', 1, {'job_attempts': 1, 'status': 'started'})
+        assert job_agent.write_item(client, TABLE_NAME, 'job-1', 2, {'job_attempts': 2, 'status': 'started'})
+        # a late write of the first attempt does not overwrite the second attempt
+        assert not job_agent.write_item(client, TABLE_NAME, 'job-1', 1, {'job_attempts': 1, 'status': 'failed'})
+        assert job_agent.write_item(client, TABLE_NAME, 'job-1', 2, {
+            'job_attempts': 2, 'status': 'succeeded', 'container_VCPU': 8, 'mean_qscore': None,
+        })
+        item = client.get_item(TableName=TABLE_NAME, Key={'job_id': {'S': 'job-1'}})['Item']
+        assert item['status'] == {'S': 'succeeded'}
+        assert item['job_attempts'] == {'N': '2'}
+        assert item['container_VCPU'] == {'N': '8'}
+        assert item['mean_qscore'] == {'S': ''}
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import inspect
+import json
+
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_aws
+
+BUCKET = 'data-bucket'
+
+
+@pytest.fixture
+def test_data(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        import basecaller_batch.test_data as test_data
+        s3_client = boto3.client('s3')
+        s3_client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'us-west-2'})
+        monkeypatch.setattr(test_data, 's3_client', s3_client)
+        yield test_data
+
+
+def read_manifest(test_data):
+    data = test_data.s3_client.get_object(Bucket=BUCKET, Key=test_data.POD5_ON_DEMAND_MANIFEST)
+    return json.loads(data['Body'].read())
+
+
+def test_split_file_list_policies(test_data):
+    files = pd.DataFrame({'file': [f'f{i}.pod5' for i in range(6)], 'size': [9, 1, 1, 1, 1, 5]})
+    by_count = test_data.split_file_list(files, 3, 'count')
+    by_size = test_data.split_file_list(files, 3, 'size')
+    assert [chunk['file'].to_list() for chunk in by_count] == [['f0.pod5', 'f1.pod5'], ['f2.pod5', 'f3.pod5'],
+                                                               ['f4.pod5', 'f5.pod5']]
+    assert sorted(int(chunk['size'].sum()) for chunk in by_size) == [4, 5, 9]
+    with pytest.raises(ValueError):
+        test_data.split_file_list(files, 3, 'random')
+    with pytest.raises(ValueError):
+        test_data.split_file_list(files, 3, 'samples')
+    by_samples = test_data.split_file_list(files.assign(samples=[1, 9, 1, 1, 1, 5]), 3, 'samples')
+    assert sorted(chunk['file'].to_list() for chunk in by_samples) == [
+        ['f0.pod5', 'f2.pod5', 'f3.pod5', 'f4.pod5'], ['f1.pod5'], ['f5.pod5']
+    ]
+
+
+def test_shard_balancing_is_the_same_as_during_deployment(test_data):
+    import create_test_data_sets
+    for name in ['chunk_file_list', 'balance_shards', 'imbalance_ratio']:
+        assert inspect.getsource(getattr(test_data, name)) == inspect.getsource(getattr(create_test_data_sets, name))
+
+
+def test_on_demand_subsets_are_balanced_by_samples_by_default(test_data, monkeypatch):
+    ssm_client = boto3.client('ssm')
+    ssm_client.put_parameter(Name=test_data.PARAMETER_S3_BUCKET, Value=BUCKET, Type='String')
+    monkeypatch.setattr(test_data, 'ssm_client', ssm_client)
+    samples = [1, 9, 1, 1, 1, 5]
+    test_data.s3_client.put_object(Body=b'x', Bucket=BUCKET,
+                                   Key=f'{test_data.FAST5_TEST_DATA_KEY_PREFIX}PAM63974_pass_0.fast5')
+    for no in range(6):
+        test_data.s3_client.put_object(Body=b'x' * (10 - samples[no]), Bucket=BUCKET,
+                                       Key=f'{test_data.POD5_TEST_DATA_KEY_PREFIX}PAM63974_pass_{no}.pod5')
+    data = test_data.TestData()
+    assert data.resolve_shard_policy(None) == 'size'
+
+    data.pod5_file_stats = {
+        f'PAM63974_pass_{no}.pod5': {'reads': 1, 'samples': samples[no], 'bytes': 10 - samples[no]} for no in range(6)
+    }
+    assert data.resolve_shard_policy(None) == 'samples'
+    assert data.resolve_shard_policy('count') == 'count'
+    file_lists, _ = data.get_subset('wgs_subset_8_files', 3)
+    assert file_lists[0].endswith('wgs_subset_8_files_3_samples_0.lst')
+    entry = read_manifest(test_data)['wgs_subset_8_files|3|samples']
+    assert (entry['load_unit'], sorted(entry['load']), entry['imbalance']) == ('samples', [4, 5, 9], 1.5)
+
+
+def test_update_on_demand_manifest_retries_after_concurrent_write(test_data, monkeypatch):
+    test_data.update_on_demand_manifest(BUCKET, 'a|3|size', {'file_lists': ['a']})
+    get_object = test_data.s3_client.get_object
+    calls = []
+
+    def get_object_with_concurrent_write(**kwargs):
+        # Another submitter replaces the manifest between the first read and write of this one.
+        data = get_object(**kwargs)
+        if not calls:
+            manifest = json.loads(get_object(**kwargs)['Body'].read())
+            manifest['b|5|count'] = {'file_lists': ['b']}
+            test_data.s3_client.put_object(Body=json.dumps(manifest), Bucket=BUCKET,
+                                           Key=test_data.POD5_ON_DEMAND_MANIFEST)
+        calls.append(kwargs)
+        return data
+
+    monkeypatch.setattr(test_data.s3_client, 'get_object', get_object_with_concurrent_write)
+    monkeypatch.setattr(test_data.time, 'sleep', lambda seconds: None)
+    entry = test_data.update_on_demand_manifest(BUCKET, 'c|7|size', {'file_lists': ['c']})
+
+    assert entry == {'file_lists': ['c']}
+    assert len(calls) == 2
+    assert set(read_manifest(test_data)) == {'a|3|size', 'b|5|count', 'c|7|size'}
+    # An entry added by another submitter is used as is.
+    assert test_data.update_on_demand_manifest(BUCKET, 'b|5|count', {'file_lists': ['other']}) == {'file_lists': ['b']}
+
+
+def test_file_lists_end_with_a_newline(test_data):
+    files = pd.DataFrame({'file': ['f0.pod5', 'f1.pod5', 'f2.pod5'], 'size': [1, 1, 1]})
+    file_names = test_data.save_chunk_files([files.iloc[:2], files.iloc[2:]], 'shard_${idx}.lst', BUCKET, 'lists/')
+    assert file_names == ['shard_0.lst', 'shard_1.lst']
+    body = test_data.s3_client.get_object(Bucket=BUCKET, Key='lists/shard_0.lst')['Body'].read().decode('utf-8')
+    assert body == 'f0.pod5\nf1.pod5\n'
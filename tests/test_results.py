@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+# The experiments selected by filter_results() before the experiment catalog, in this order.
+BASELINE_CASCADE = [
+    ('guppy, no modified bases', 'no modified bases'),
+    ('guppy, modified bases 5mCG', '5mCG'),
+    ('guppy, modified bases 5mCG & 5hmCG', '5mCG_5hmCG'),
+    ('dorado, no modified bases', 'no modified bases'),
+    ('dorado, modified bases 5mCG', '5mCG'),
+    ('dorado, modified bases 5mCG & 5hmCG', '5mCG_5hmCG'),
+    ('dorado v0.3.0, no modified bases', 'no modified bases'),
+    ('dorado v0.3.0, modified bases 5mCG', '5mCG'),
+    ('dorado v0.3.0, modified bases 5mCG & 5hmCG', '5mCG_5hmCG'),
+    ('dorado v0.5.3, no modified bases', 'no modified bases'),
+    ('dorado v0.5.3, modified bases 5mCG', '5mCG'),
+    ('dorado v0.5.3, modified bases 5mCG & 5hmCG', '5mCG_5hmCG'),
+]
+
+
+def baseline_latest_run(df):
+    last_runs = pd.merge(
+        df.groupby('compute_environment').container_end_time.max().to_frame().reset_index(),
+        df,
+        left_on=['compute_environment', 'container_end_time'], right_on=['compute_environment', 'container_end_time'],
+        how='left'
+    )['data_set_id'].to_list()
+    return df[df['data_set_id'].isin(last_runs)]
+
+
+def baseline_filter_results(df):
+    results = pd.DataFrame()
+    for tags, modified_bases in BASELINE_CASCADE:
+        temp = baseline_latest_run(df[(df['tags'] == tags) & (df['status'] == 'succeeded')].copy())
+        if not temp.empty:
+            temp.loc[:, 'modified_bases'] = modified_bases
+        results = pd.concat([results, temp], ignore_index=True)
+    return results
+
+
+def jobs(tags, data_set_id, end_time, compute_environment='g5-12xlarge', status='succeeded', num_jobs=2):
+    return [{
+        'job_id': f'{data_set_id}-{i}', 'tags': tags, 'status': status, 'data_set_id': data_set_id,
+        'compute_environment': compute_environment, 'container_start_time': '2024-03-01T09:00:00+00:00',
+        'container_end_time': end_time,
+    } for i in range(num_jobs)]
+
+
+def test_catalog_selects_the_same_runs_as_the_baseline_cascade(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    import results
+
+    df = pd.DataFrame(
+        jobs('guppy, no modified bases', 'guppy-1', '2024-03-01T10:00:00+00:00')
+        + jobs('guppy, no modified bases', 'guppy-2', '2024-03-02T10:00:00+00:00')
+        + jobs('guppy, no modified bases', 'guppy-3', '2024-03-03T10:00:00+00:00', status='failed')
+        + jobs('guppy, no modified bases', 'guppy-4', '2024-03-01T11:00:00+00:00', compute_environment='p4d-24xlarge')
+        + jobs('dorado, modified bases 5mCG', 'dorado-1', '2024-03-01T10:00:00+00:00')
+        + jobs('dorado v0.3.0, modified bases 5mCG & 5hmCG', 'dorado-030-1', '2024-03-04T10:00:00+00:00')
+        + jobs('dorado v0.5.3, no modified bases', 'dorado-053-1', '2024-03-05T10:00:00+00:00')
+        + jobs('dorado v0.5.3, no modified bases', 'dorado-053-2', '2024-03-04T10:00:00+00:00')
+        + jobs('dorado v0.5.3, modified bases 5mCG & 5hmCG', 'dorado-053-3', '2024-03-05T10:00:00+00:00')
+        # not part of the reports
+        + jobs('dorado v0.5.3, test run', 'other-1', '2024-03-06T10:00:00+00:00')
+        + jobs(None, 'untagged-1', '2024-03-06T10:00:00+00:00')
+    )
+
+    expected = baseline_filter_results(df)
+    selected = results.filter_results(df)
+
+    assert sorted(expected['data_set_id'].unique()) == [
+        'dorado-030-1', 'dorado-053-1', 'dorado-053-3', 'dorado-1', 'guppy-2', 'guppy-4'
+    ]
+    columns = ['job_id', 'tags', 'modified_bases']
+    assert selected[columns].values.tolist() == expected[columns].values.tolist()
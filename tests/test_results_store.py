@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import pandas as pd
+
+import results_store.results_store as results_store
+
+LONG_TAG = 'tuning: ' + '; '.join(f'--option_{i}={i * 1000}' for i in range(30)) + '; data_set=wgs_subset_128_files'
+
+
+def results(job_ids, tags='dorado v0.5.3, no modified bases', month='2024-03', **values):
+    return pd.DataFrame({
+        'job_id': job_ids,
+        'tags': tags,
+        'container_start_time': f'{month}-01T10:00:00+00:00',
+        'status': 'succeeded',
+        **values,
+    })
+
+
+def test_append_and_read_round_trip(tmp_path):
+    path = str(tmp_path / 'store')
+    df = pd.concat([results(['a', 'b']), results(['c'], month='2024-04'), results(['d'], tags=None)],
+                   ignore_index=True)
+
+    assert results_store.append(df, path) == 4
+    stored = results_store.read(path).set_index('job_id').sort_index()
+
+    assert list(stored.index) == ['a', 'b', 'c', 'd']
+    assert stored.loc['c', 'container_start_time'] == '2024-04-01T10:00:00+00:00'
+    assert pd.isna(stored.loc['d', 'tags'])
+    assert 'tag' not in stored.columns
+    assert list(results_store.read(path, months=['2024-04'])['job_id']) == ['c']
+    assert list(results_store.read(path, columns=['job_id', 'missing']).columns) == ['job_id']
+
+
+def test_append_replaces_rows_with_the_same_job_id(tmp_path):
+    path = str(tmp_path / 'store')
+    results_store.append(results(['a', 'b'], status='started'), path)
+    # 'b' was tagged again and moved to another partition.
+    results_store.append(results(['b'], tags='guppy v6.5.7', status='succeeded'), path)
+    results_store.append(results(['a'], status='succeeded'), path)
+
+    stored = results_store.read(path).set_index('job_id').sort_index()
+    assert len(stored) == 2
+    assert list(stored['status']) == ['succeeded', 'succeeded']
+    assert stored.loc['b', 'tags'] == 'guppy v6.5.7'
+
+
+def test_long_tags_are_stored_under_a_short_key(tmp_path):
+    path = str(tmp_path / 'store')
+    assert len(LONG_TAG) > 255
+    results_store.append(pd.concat([results(['a'], tags=LONG_TAG), results(['b'])], ignore_index=True), path)
+
+    tag_directory = os.path.dirname(os.path.dirname(
+        results_store.partition_path(path, results_store.tag_key(LONG_TAG), '2024-03')))
+    assert os.path.isdir(tag_directory)
+    assert len(os.path.basename(tag_directory)) < 32
+    assert list(results_store.read(path, tags=[LONG_TAG])['tags']) == [LONG_TAG]
+    assert list(results_store.read(path, tags=[], tag_prefixes=['tuning: '])['job_id']) == ['a']
+    assert sorted(results_store.read(path, tags=['dorado v0.5.3, no modified bases'],
+                                     tag_prefixes=['tuning: '])['job_id']) == ['a', 'b']
+
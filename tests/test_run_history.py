@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import pytest
+
+from run_history.run_history import RunHistory
+
+
+def job(job_id, data_set_id, start_time, end_time, tags='dorado v0.5.3', compute_environment='g5', status='succeeded'):
+    return {
+        'job_id': job_id, 'tags': tags, 'status': status, 'compute_environment': compute_environment,
+        'data_set_id': data_set_id, 'container_start_time': start_time, 'container_end_time': end_time,
+    }
+
+
+def test_latest_runs_select_the_newest_run_per_experiment_and_environment():
+    history = RunHistory.from_results(pd.DataFrame([
+        job('1', 'run-1', '2024-03-01T10:00', '2024-03-01T11:00'),
+        job('2', 'run-1', '2024-03-01T10:00', '2024-03-01T12:00'),
+        job('3', 'run-2', '2024-03-02T10:00', '2024-03-02T11:00'),
+        # failed and unfinished jobs don't make a run
+        job('4', 'run-3', '2024-03-03T10:00', '2024-03-03T11:00', status='failed'),
+        job('5', 'run-4', '2024-03-04T10:00', None),
+        job('6', 'run-5', '2024-03-01T10:00', '2024-03-01T11:00', compute_environment='p4d'),
+        job('7', 'run-6', '2024-03-05T10:00', '2024-03-05T11:00', tags='guppy v6.5.7'),
+    ]))
+
+    latest = history.latest_runs().set_index(['tags', 'compute_environment'])['data_set_id'].to_dict()
+    assert latest == {
+        ('dorado v0.5.3', 'g5'): 'run-2',
+        ('dorado v0.5.3', 'p4d'): 'run-5',
+        ('guppy v6.5.7', 'g5'): 'run-6',
+    }
+    assert list(history.latest_runs(experiments=['guppy v6.5.7'])['data_set_id']) == ['run-6']
+    assert history.nth('dorado v0.5.3', 'g5', 1)['end_time'] == '2024-03-01T12:00'
+    assert history.nth('dorado v0.5.3', 'g5', 2) is None
+    with pytest.raises(ValueError):
+        history.nth('dorado v0.5.3', 'g5', -1)
+
+
+def test_retried_job_moves_its_run_to_the_end(tmp_path):
+    history = RunHistory(str(tmp_path))
+    history.update(pd.DataFrame([
+        job('1', 'run-1', '2024-03-01T10:00', '2024-03-01T11:00'),
+        job('2', 'run-2', '2024-03-02T10:00', '2024-03-02T11:00'),
+    ]))
+    history.save()
+
+    history = RunHistory(str(tmp_path))
+    assert history.exists()
+    history.update(pd.DataFrame([job('1', 'run-1', '2024-03-01T10:00', '2024-03-03T11:00')]))
+    assert history.latest('dorado v0.5.3', 'g5')['data_set_id'] == 'run-1'
+    assert len(history.all('dorado v0.5.3', 'g5')) == 2
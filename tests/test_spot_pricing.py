@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import spot_pricing.spot_pricing as spot_pricing
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spot_price_history_us-west-2.json')
+
+
+def make_jobs():
+    return pd.DataFrame({
+        'job_id': ['job-1', 'job-2', 'job-3', 'job-4', 'job-5'],
+        'compute_environment': ['g5-48xlarge-spot', 'g5-48xlarge-spot', 'g5-48xlarge-spot', 'g5-48xlarge',
+                                'p3-16xlarge-spot'],
+        'ec2_instance_type': ['g5.48xlarge', 'g5.48xlarge', 'g5.48xlarge', 'g5.48xlarge', 'p3.16xlarge'],
+        'ec2_availability_zone': ['us-west-2a', 'us-west-2b', None, 'us-west-2a', 'us-west-2a'],
+        'container_start_time': ['2024-03-01T10:00:00+00:00'] * 5,
+        'container_end_time': ['2024-03-01T12:00:00+00:00'] * 5,
+    })
+
+
+class FakeEc2Client:
+
+    def __init__(self):
+        self.calls = []
+
+    def get_paginator(self, operation_name):
+        return self
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        with open(HISTORY_FILE, 'r') as f:
+            records = json.load(f)['SpotPriceHistory']
+        yield {'SpotPriceHistory': [record for record in records if record['InstanceType'] in kwargs['InstanceTypes']]}
+
+
+def test_spot_jobs_region_of_the_availability_zone():
+    df = make_jobs()
+    df['ec2_availability_zone'] = ['us-west-2a', 'us-west-2-lax-1a', None, 'us-west-2a', 'us-east-1-wl1-bos-wlz-1']
+    jobs = spot_pricing.spot_jobs(df)
+    assert jobs['region'].to_list() == ['us-west-2', 'us-west-2', 'us-west-2', 'us-east-1']
+    gov_cloud = spot_pricing.spot_jobs(df.assign(ec2_availability_zone='us-gov-west-1a'))
+    assert gov_cloud['region'].iloc[0] == 'us-gov-west-1'
+
+
+def test_time_weighted_price():
+    history = [[0, 1.0], [3600, 3.0]]
+    prices = spot_pricing.time_weighted_price(history, np.array([0.0, 1800.0, -3600.0, 7200.0]),
+                                              np.array([7200.0, 5400.0, 0.0, 7200.0]))
+    np.testing.assert_allclose(prices, [2.0, 2.0, 1.0, 3.0])
+
+
+def test_add_spot_cost_per_hour_from_file():
+    jobs = make_jobs()
+    spot_prices = spot_pricing.get_spot_prices(jobs, history_file=HISTORY_FILE)
+    result = spot_pricing.add_spot_cost_per_hour(jobs, spot_prices)
+    # job-1: 1 h at 6.0 and 1 h at 9.0, job-2: 5.0, job-3: AZ unknown, average over AZs
+    assert result['spot_cost_per_hour'].tolist()[:3] == pytest.approx([7.5, 5.0, 6.25])
+    # on-demand job
+    assert np.isnan(result['spot_cost_per_hour'][3])
+    assert result['spot_cost_per_hour'][4] == pytest.approx(7.5)
+    assert result['spot_region'].tolist()[:3] == ['us-west-2'] * 3
+
+
+def test_get_spot_prices_batched_and_cached(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = FakeEc2Client()
+    monkeypatch.setattr(spot_pricing, 'get_client', lambda region: client)
+    jobs = make_jobs()
+    spot_prices = spot_pricing.get_spot_prices(jobs)
+    # one query for all instance types of the region
+    assert len(client.calls) == 1
+    assert sorted(client.calls[0]['InstanceTypes']) == ['g5.48xlarge', 'p3.16xlarge']
+    assert spot_prices == spot_pricing.get_spot_prices(jobs, history_file=HISTORY_FILE)
+    # the time windows of the jobs are covered by the cache
+    assert spot_pricing.get_spot_prices(jobs) == spot_prices
+    assert len(client.calls) == 1
+    # a later job requires new prices
+    later = jobs.assign(container_end_time='2024-03-02T12:00:00+00:00')
+    spot_pricing.get_spot_prices(later)
+    assert len(client.calls) == 2
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import importlib.util
+
+import pandas as pd
+import pytest
+
+from stage_cache.stage_cache import StageCache
+
+STAGES_SOURCE = '''
+def add_bases(df, bases_per_sample):
+    df = df.copy()
+    df['bases'] = df['samples'] * bases_per_sample
+    return df
+
+
+def add_rate(df):
+    df = df.copy()
+    df['bases_per_s'] = df['bases'] / df['seconds']
+    return df
+'''
+
+
+@pytest.fixture
+def stages_module(tmp_path):
+    file_name = tmp_path / 'stages.py'
+    file_name.write_text(STAGES_SOURCE)
+    spec = importlib.util.spec_from_file_location('stages', file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.file_name = file_name
+    return module
+
+
+def results():
+    return pd.DataFrame({'tags': ['a', 'a', 'b'], 'samples': [10, 20, 30], 'seconds': [1.0, 2.0, 3.0]})
+
+
+def test_unchanged_stages_are_loaded_from_the_cache(stages_module, tmp_path):
+    cache = StageCache(str(tmp_path / 'cache'))
+    stages = [(stages_module.add_bases, 2), (stages_module.add_rate,)]
+    first = cache.run(results(), stages)
+    second = cache.run(results(), stages)
+
+    pd.testing.assert_frame_equal(first, second)
+    assert list(second['bases_per_s']) == [20.0, 20.0, 20.0]
+    assert (cache.hits, cache.misses) == (2, 2)
+    # changed arguments invalidate the stage and all later stages
+    cache.run(results(), [(stages_module.add_bases, 3), (stages_module.add_rate,)])
+    assert cache.misses == 4
+
+
+def test_entry_is_stale_after_the_module_source_changed(stages_module, tmp_path):
+    cache = StageCache(str(tmp_path / 'cache'))
+    stages = [(stages_module.add_bases, 2), (stages_module.add_rate,)]
+    cache.run(results(), stages)
+    stages_module.file_name.write_text(STAGES_SOURCE + '\n# changed\n')
+    cache.run(results(), stages)
+
+    assert (cache.hits, cache.misses) == (0, 4)
+
+
+def test_partitions_rerun_only_the_changed_tags(stages_module, tmp_path):
+    cache = StageCache(str(tmp_path / 'cache'))
+    stages = [(stages_module.add_bases, 2), (stages_module.add_rate,)]
+    cache.run(results(), stages, partition_by='tags')
+    first_key = cache.last_key
+    changed = results()
+    changed.loc[2, 'samples'] = 60
+    output = cache.run(changed, stages, partition_by='tags')
+
+    # partition 'a' is loaded from its last stage, partition 'b' is run again
+    assert (cache.hits, cache.misses) == (2, 6)
+    assert list(output['bases']) == [20, 40, 120]
+    assert cache.last_key != first_key
+
+
+def test_least_recently_used_entries_are_evicted(stages_module, tmp_path):
+    cache = StageCache(str(tmp_path / 'cache'), max_bytes=0)
+    cache.run(results(), [(stages_module.add_bases, 2)])
+
+    assert not list((tmp_path / 'cache').glob('*.pkl'))
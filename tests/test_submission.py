@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+import basecaller_batch.submission as submission
+
+
+class FakeBatch:
+
+    def __init__(self, throttle_every=0, fail_keys=()):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.submitted = []
+        self.throttle_every = throttle_every
+        self.fail_keys = fail_keys
+
+    def submit(self, job):
+        with self.lock:
+            self.calls += 1
+            if self.throttle_every and self.calls % self.throttle_every == 0:
+                raise ClientError({'Error': {'Code': 'TooManyRequestsException', 'Message': 'Too Many Requests'}},
+                                  'SubmitJob')
+            if job['key'] in self.fail_keys:
+                raise ClientError({'Error': {'Code': 'ClientException', 'Message': 'Invalid job'}}, 'SubmitJob')
+            self.submitted.append(job['key'])
+            return f'job-{len(self.submitted)}'
+
+
+def make_jobs(n):
+    return [{'key': ('g5.48xlarge', 'SPOT', 'dorado, no modified bases', shard), 'data_set_id': 'data-set-1'}
+            for shard in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(submission, 'SUBMISSION_BASE_DELAY', 0)
+    monkeypatch.setattr(submission.time, 'sleep', lambda seconds: None)
+
+
+def test_token_bucket_burst():
+    bucket = submission.TokenBucket(rate=1, capacity=5)
+    for _ in range(5):
+        bucket.acquire()
+    assert bucket.tokens < 1
+
+
+def test_submit_jobs_retries_throttled_calls():
+    batch = FakeBatch(throttle_every=3)
+    report = submission.submit_jobs(make_jobs(100), batch.submit, rate=1000, burst=1000)
+    assert len(report) == 100
+    assert sorted(batch.submitted) == sorted(job['key'] for job in make_jobs(100))
+    assert len({entry['job_id'] for entry in report.values()}) == 100
+
+
+def test_submit_jobs_resumes_from_report(tmp_path):
+    report_file = str(tmp_path / 'submission_report.json')
+    jobs = make_jobs(10)
+    batch = FakeBatch(fail_keys=[jobs[3]['key']])
+    report = submission.submit_jobs(jobs, batch.submit, report_file=report_file, rate=1000, burst=1000)
+    assert len(report) == 9
+    with open(report_file, 'r') as f:
+        assert json.load(f) == report
+
+    # only the failed job is submitted again
+    batch = FakeBatch()
+    report = submission.submit_jobs(jobs, batch.submit, report_file=report_file, rate=1000, burst=1000)
+    assert batch.submitted == [jobs[3]['key']]
+    assert report[submission.report_key(jobs[3]['key'])]['data_set_id'] == 'data-set-1'
+    assert len(report) == 10
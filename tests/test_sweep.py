@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import pandas as pd
+import pytest
+
+import basecaller_batch.sweep as sweep
+import experiment_catalog.experiment_catalog as experiment_catalog
+
+SWEEPS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'create_jobs', 'sweeps')
+
+SPEC = {
+    'compute': [{'instance_type': 'g5.48xlarge', 'provisioning_model': 'SPOT'}],
+    'images': {'dorado': {'0.5.3': 'basecaller_guppy_latest_dorado0.5.3'}},
+    'sweeps': [
+        {'basecaller': 'dorado', 'matrix': {
+            'version': ['0.5.3'],
+            'modified_bases': [
+                {'modified_bases': 'no modified bases', 'model': 'dna_r10.4.1_e8.2_400bps_hac@v3.5.2'},
+                {'modified_bases': '5mCG', 'model': 'dna_r10.4.1_e8.2_400bps_hac@v3.5.2'},
+            ],
+            'batch_size': ['auto', 256],
+            # not a dorado parameter, ignored
+            'chunks_per_runner': [1024, 2048],
+        }},
+        # same settings as above
+        {'basecaller': 'dorado', 'matrix': {
+            'version': ['0.5.3'],
+            'modified_bases': [{'modified_bases': '5mCG', 'model': 'dna_r10.4.1_e8.2_400bps_hac@v3.5.2'}],
+            'batch_size': ['AUTO'],
+        }},
+    ],
+}
+
+
+def test_expand_sweep_deduplicates():
+    job_sets = sweep.expand_sweep(SPEC)
+    assert len(job_sets) == 4
+    assert len({job_set['tags'] for job_set in job_sets}) == 4
+    job_set = job_sets[1]
+    assert job_set['tags'] == 'basecaller=dorado; version=0.5.3; model=dna_r10.4.1_e8.2_400bps_hac@v3.5.2; ' \
+                              'modified_bases=no modified bases; batch_size=256; threads=8'
+    assert '--batchsize 256 ' in job_set['cmd']
+    assert '--modified-bases' not in job_set['cmd']
+    assert '--batchsize' not in job_sets[2]['cmd']
+    assert '--modified-bases 5mCG |' in job_sets[2]['cmd']
+
+
+def test_expand_sweep_rejects_unknown_modified_bases():
+    spec = {'images': SPEC['images'], 'sweeps': [
+        {'basecaller': 'dorado', 'matrix': {'version': ['0.5.3'], 'model': ['m'], 'modified_bases': ['6mA']}},
+    ]}
+    with pytest.raises(ValueError):
+        sweep.expand_sweep(spec)
+
+
+def test_benchmark_sweep_matches_catalog():
+    job_sets = sweep.expand_sweep(sweep.load_sweep(os.path.join(SWEEPS_PATH, 'benchmark.yaml')))
+    assert len(job_sets) == 6
+    tags = [job_set['tags'] for job_set in job_sets]
+    catalog = experiment_catalog.get_catalog(tags + ['guppy, no modified bases', 'unrelated'])
+    assert 'unrelated' not in catalog.index
+    assert catalog.loc[tags, 'basecaller'].tolist() == ['guppy'] * 3 + ['dorado'] * 3
+    assert catalog.loc[tags, 'modified_bases'].tolist() == experiment_catalog.MODIFIED_BASES * 2
+    assert catalog.loc[tags[0], 'chunks_per_runner'] == '2048'
+    assert catalog.loc[tags[3], 'batch_size'] == 'auto'
+    # one setting per basecaller, version and modified bases, the labels stay as they are
+    assert (catalog['settings'] == '').all()
+
+
+def test_sweep_settings_tell_experiments_apart(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    import utilities.utilities as utils
+    tags = [job_set['tags'] for job_set in sweep.expand_sweep(SPEC)]
+    catalog = experiment_catalog.get_catalog(tags + ['dorado v0.5.3, no modified bases'])
+    assert catalog.loc['dorado v0.5.3, no modified bases', 'settings'] == ''
+    assert sorted(catalog.loc[tags, 'settings']) == ['batch_size=256', 'batch_size=256', 'batch_size=auto',
+                                                     'batch_size=auto']
+
+    results = pd.DataFrame({
+        'basecaller_name': 'dorado', 'basecaller_version': '0.5.3', 'settings': catalog.loc[tags, 'settings'].values,
+    })
+    labels = utils.add_basecaller_label(results)['basecaller']
+    assert set(labels) == {'dorado v0.5.3 (batch_size=auto)', 'dorado v0.5.3 (batch_size=256)'}
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import socket
+
+import telemetry
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_guppy_progress_rates_and_statsd():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1)
+    clock = Clock()
+    t = telemetry.Telemetry(tags={'instance_type': 'g5.xlarge'}, host='127.0.0.1', port=receiver.getsockname()[1],
+                            clock=clock)
+    t.on_line('[PROG_STAT_HDR] time elapsed(secs), time remaining (estimate), total reads processed, '
+              'total reads (estimate), interval(secs), interval reads processed, interval bases processed\n')
+    t.on_line('[PROG_STAT] 5.0, 100, 500, 10000, 5.0, 500, 2500000\n')
+    t.on_line('[PROG_STAT] 10.0, 95, 1000, 10000, 5.0, 500, 2500000\n')
+    clock.now = 10.0
+    assert t.sample() == {'reads_per_s': 100.0, 'bases_per_s': 500000.0}
+    messages = sorted(receiver.recv(1024).decode('utf-8') for _ in range(2))
+    assert messages == ['basecaller.bases_per_s:500000.0|g|#instance_type:g5.xlarge',
+                        'basecaller.reads_per_s:100.0|g|#instance_type:g5.xlarge']
+    receiver.close()
+
+    t.on_line('[PROG_STAT] 15.0, 90, 1200, 10000, 5.0, 200, 1000000\n')
+    clock.now = 20.0
+    assert t.sample()['reads_per_s'] == 20.0
+    series = json.loads(t.series_json())
+    assert series['columns'] == ['t', 'reads_per_s', 'bases_per_s', 'progress_percent']
+    assert series['values'] == [[10.0, 100.0, 500000.0, None], [20.0, 20.0, 100000.0, None]]
+
+
+def test_dorado_progress_and_compact():
+    t = telemetry.Telemetry(host='127.0.0.1', port=9, clock=Clock())
+    t.on_line('[======>                 ] 27% [01m:04s<02m:53s]\n')
+    assert t.progress == 27
+    assert telemetry.compact([[10, 1.0, None], [20, 3.0, None], [30, 5.0, 1.0]]) == \
+        [[20, 2.0, None], [30, 5.0, 1.0]]
+
+
+def test_default_gateway(tmp_path):
+    route_file = tmp_path / 'route'
+    route_file.write_text('Iface\tDestination\tGateway\tFlags\n'
+                          'eth0\t000011AC\t00000000\t0001\n'
+                          'eth0\t00000000\t010011AC\t0003\n')
+    assert telemetry.default_gateway(str(route_file)) == '172.17.0.1'
+
+
+def test_series_json_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    import pandas as pd
+    import results
+    import utilities.utilities as utils
+
+    clock = Clock()
+    t = telemetry.Telemetry(host='127.0.0.1', port=9, clock=clock)
+    for now, reads in [(10.0, 100), (20.0, 300)]:
+        t.on_line(f'[PROG_STAT] {now}, 0, {reads}, 1000, 10.0, 0, {reads * 1000}\n')
+        clock.now = now
+        t.sample()
+    jobs = pd.DataFrame({
+        'job_id': ['job-1', 'job-2', 'job-3'],
+        'throughput_series': [t.series_json(), None, ''],
+        'ec2_instance_type': 'g5.xlarge', 'tags': 'dorado v0.5.3, no modified bases',
+        'modified_bases': 'no modified bases', 'data_set_id': 'data-set-1',
+    })
+
+    series = utils.expand_throughput_series(jobs)
+    assert list(series.columns) == ['job_id', 't', 'reads_per_s', 'bases_per_s', 'progress_percent']
+    assert series['t'].tolist() == [10.0, 20.0]
+    assert series['reads_per_s'].tolist() == [10.0, 20.0]
+    assert series['bases_per_s'].tolist() == [10000.0, 30000.0]
+    assert utils.expand_throughput_series(jobs.drop(columns=['throughput_series'])).empty
+
+    file_name = str(tmp_path / 'series.csv')
+    results.generate_throughput_series(jobs, file_name)
+    report = pd.read_csv(file_name)
+    assert report['job_id'].tolist() == ['job-1', 'job-1']
+    assert report['ec2_instance_type'].tolist() == ['g5.xlarge', 'g5.xlarge']
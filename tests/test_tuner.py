@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+
+import boto3
+from moto import mock_aws
+
+import basecaller_batch.submission as submission
+import basecaller_batch.sweep as sweep
+import basecaller_batch.tuner as tuner
+
+SPEC = {
+    'images': {'guppy': {'latest': 'basecaller_guppy_latest_dorado0.5.3'}},
+    'sweeps': [{'basecaller': 'guppy', 'matrix': {
+        'version': ['latest'],
+        'model': ['dna_r10.4.1_e8.2_400bps_hac'],
+        'modified_bases': ['no modified bases'],
+        'num_callers': [4, 8, 16],
+        'gpu_runners_per_device': [2, 4, 8],
+        'chunks_per_runner': [256, 512, 1024],
+    }}],
+}
+
+
+class SimulatedThroughput:
+    """
+    Throughput peaking at num_callers=8, gpu_runners_per_device=4 and chunks_per_runner=512 on
+    g5.48xlarge, with more noise on the smaller data sets.
+    """
+
+    NOISE = {'wgs_subset_8_files': 0.05, 'wgs_subset_64_files': 0.02, 'wgs_subset_128_files': 0.01}
+
+    def __init__(self):
+        self.random = random.Random(42)
+        self.evaluations = {data_set: 0 for data_set in tuner.RUNGS}
+
+    def __call__(self, compute, candidates, data_set):
+        self.evaluations[data_set] += len(candidates)
+        scores = {}
+        for candidate in candidates:
+            params = candidate['params']
+            if params['chunks_per_runner'] == '1024' and params['gpu_runners_per_device'] == '8':
+                scores[candidate['tags']] = None  # out of GPU memory
+                continue
+            distance = abs(int(params['num_callers']) - 8) / 8 + abs(int(params['gpu_runners_per_device']) - 4) / 4 + \
+                abs(int(params['chunks_per_runner']) - 512) / 512
+            scores[candidate['tags']] = 3e7 * (1 - 0.3 * distance) * (1 + self.random.gauss(0, self.NOISE[data_set]))
+        return scores
+
+
+def test_tune_finds_best_settings_with_few_full_runs():
+    candidates = sweep.expand_sweep(SPEC)
+    evaluate = SimulatedThroughput()
+    results = tuner.tune([{'instance_type': 'g5.48xlarge', 'provisioning_model': 'SPOT'}], candidates, evaluate)
+    best = results['g5.48xlarge']['best']
+    assert 'num_callers=8; gpu_runners_per_device=4; chunks_per_runner=512' in best
+    assert evaluate.evaluations == {'wgs_subset_8_files': 27, 'wgs_subset_64_files': 8, 'wgs_subset_128_files': 3}
+    assert [rung['data_set'] for rung in results['g5.48xlarge']['history']] == tuner.RUNGS
+
+
+def test_successive_halving_all_failed():
+    candidates = sweep.expand_sweep(SPEC)[:2]
+    best, history = tuner.successive_halving(candidates, lambda rung_candidates, data_set: {})
+    assert best is None
+    assert len(history) == 1
+
+
+def test_tuning_tags_are_short():
+    candidates = sweep.expand_sweep(SPEC)
+    tags = [tuner.tuning_tags(candidate['tags'], 'wgs_subset_128_files') for candidate in candidates]
+    assert len(set(tags)) == len(candidates)
+    assert max(len(tag) for tag in tags) < 64
+    results = tuner.tune([{'instance_type': 'g5.48xlarge', 'provisioning_model': 'SPOT'}], candidates,
+                         SimulatedThroughput())
+    tuning_ids = results['g5.48xlarge']['tuning_ids']
+    assert tuning_ids[tuner.tuning_id(candidates[0]['tags'])] == candidates[0]['tags']
+
+
+def test_samples_per_s_are_read_by_job_id(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        table = boto3.resource('dynamodb').create_table(
+            TableName='reports-table',
+            KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        items = [
+            ('array-1:0', 'succeeded', '1.0e+07'), ('array-1:1', 'succeeded', '2.0e+07'),
+            ('array-2:0', 'succeeded', '1.0e+07'), ('array-2:1', 'failed', ''),
+            # the second child job of array-3 wrote no results
+            ('array-3:0', 'succeeded', '1.0e+07'),
+            ('job-4', 'succeeded', '3.0e+07'),
+        ]
+        for job_id, status, samples_per_s in items:
+            table.put_item(Item={'job_id': job_id, 'status': status, 'samples_per_s': samples_per_s})
+        jobs = [
+            {'key': ('g5.48xlarge', 'SPOT', f'tuning: {i}', 'array'), 'data_set_id': f'data-set-{i}',
+             'array_size': 1 if i == 4 else 2}
+            for i in range(1, 5)
+        ]
+        report = {submission.report_key(job['key']): {'job_id': f'array-{i}' if i < 4 else 'job-4'}
+                  for i, job in enumerate(jobs, start=1)}
+        evaluator = tuner.BatchEvaluator.__new__(tuner.BatchEvaluator)
+        evaluator.dynamodb_client = boto3.client('dynamodb')
+        evaluator.reports_table = 'reports-table'
+
+        assert evaluator.get_samples_per_s(tuner.report_job_ids(jobs, report)) == {
+            'data-set-1': 3e7, 'data-set-4': 3e7,
+        }